@@ -0,0 +1,134 @@
+"""Room actors: one ordered inbox per room.
+
+In actor mode the connection handlers never touch a room themselves. They
+route each command to the actor of the room it concerns. The actor runs
+its inbox one command at a time, in arrival order, so two commands for the
+same room can never interleave at an ``await``. Commands for different
+rooms still run concurrently.
+
+What an actor owns is its room: the members, the game and the delta
+sequence. A command that moves a player out of one room into another
+leaves the old room through a command queued on the old room's actor.
+The node-wide indexes (players, room codes, the leaderboard, timers) are
+shared by every actor on the node. Each update to them completes without
+an ``await``, which is what keeps them consistent on the one event loop,
+so the actors of one node cannot be split over processes. Rooms are
+spread over processes by the room bus instead: each room belongs to one
+node, and its commands are forwarded to that node's actor for it.
+
+A command awaited with ``call`` on a room with nothing queued runs at once
+in the caller's coroutine, as it would without actors; the room counts as
+busy until it finishes, so commands that arrive meanwhile queue behind it
+and run on the actor's task afterwards. Only contended rooms pay for a
+task switch.
+
+An actor's task only exists while its inbox has work. It exits once the
+inbox drains, and the actor is dropped until the room's next command, so an
+idle room costs nothing here.
+"""
+import asyncio
+import logging
+from collections import deque
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RoomActor:
+    __slots__ = ('code', 'inbox', 'task', 'inline')
+
+    def __init__(self, code: str):
+        self.code = code
+        self.inbox = deque()  # (func, args, future or None)
+        self.task: Optional[asyncio.Task] = None
+        self.inline = False  # A command is running in its caller's coroutine
+
+
+class RoomActors:
+    def __init__(self):
+        self.actors: Dict[str, RoomActor] = {}  # Rooms with commands queued or running
+        self.posted = 0
+        self.processed = 0
+        self.errors = 0
+        self.max_depth = 0
+
+    def post(self, room_code: str, func: Callable, *args, future: asyncio.Future = None):
+        """Queue ``func(*args)`` on a room's inbox without waiting for it"""
+        actor = self.actors.get(room_code)
+        if actor is None:
+            actor = self.actors[room_code] = RoomActor(room_code)
+        actor.inbox.append((func, args, future))
+        self.posted += 1
+        if len(actor.inbox) > self.max_depth:
+            self.max_depth = len(actor.inbox)
+        if actor.task is None and not actor.inline:
+            actor.task = asyncio.create_task(self._run(actor))
+        return future
+
+    async def call(self, room_code: str, func: Callable, *args):
+        """Run ``func(*args)`` as a command of a room and wait for its result"""
+        if room_code in self.actors:
+            future = asyncio.get_running_loop().create_future()
+            return await self.post(room_code, func, *args, future=future)
+
+        # Nothing queued for the room: run the command here
+        actor = self.actors[room_code] = RoomActor(room_code)
+        actor.inline = True
+        self.posted += 1
+        try:
+            result = func(*args)
+            if asyncio.iscoroutine(result):
+                result = await result
+            return result
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.processed += 1
+            actor.inline = False
+            if actor.inbox:
+                actor.task = asyncio.create_task(self._run(actor))
+            elif self.actors.get(room_code) is actor:
+                del self.actors[room_code]
+
+    async def _run(self, actor: RoomActor):
+        inbox = actor.inbox
+        while inbox:
+            func, args, future = inbox.popleft()
+            try:
+                result = func(*args)
+                if asyncio.iscoroutine(result):
+                    result = await result
+                if future is not None and not future.done():
+                    future.set_result(result)
+            except Exception as e:
+                self.errors += 1
+                if future is not None and not future.done():
+                    future.set_exception(e)
+                else:
+                    logger.exception("Error in room %s actor: %s", actor.code, e)
+            self.processed += 1
+        actor.task = None
+        if self.actors.get(actor.code) is actor:
+            del self.actors[actor.code]
+
+    async def drain(self):
+        """Wait until every inbox is empty, and every command running in its caller has finished"""
+        while self.actors:
+            tasks = [actor.task for actor in self.actors.values() if actor.task is not None]
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            elif any(actor.inline for actor in self.actors.values()):
+                await asyncio.sleep(0.01)
+            else:
+                break
+
+    def stats(self) -> dict:
+        return {
+            'active': len(self.actors),
+            'queued': sum(len(actor.inbox) for actor in self.actors.values()),
+            'max_depth': self.max_depth,
+            'posted': self.posted,
+            'processed': self.processed,
+            'errors': self.errors,
+        }
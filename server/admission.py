@@ -0,0 +1,185 @@
+"""Admission control: connection cap, per-client rate limits and load shedding.
+
+Everything here runs before a message reaches its handler, and costs a
+few attribute lookups. Its job is to keep a flood from one client, or a
+surge of new ones, from starving the games already being played on the
+one event loop.
+
+- Rate limits. A client's socket is read no faster than its token bucket
+  allows. Past the burst, the next frame is only read once a token is
+  due, so a flood waits in the socket's buffers, and then in the sender's,
+  without costing the server anything. Message types with a limit of
+  their own (``RATE_LIMITS``) have a bucket each, and a message over that
+  limit is dropped. The client is told once per run of drops, so a flood
+  does not turn into a flood of error frames.
+- Connection cap. A new session beyond ``max_connections`` is accepted
+  and closed at once with code 1013 (try again later). A client resuming
+  a suspended session is always let back in.
+- Load shedding. While the event loop's measured lag is above
+  ``shed_lag``, new sessions are refused. Messages that start something
+  new (rooms, matchmaking, solo questions) are dropped, while answers and
+  moves in running games still go through. Shedding stops once lag falls
+  below half the threshold, so it does not flap on and off.
+"""
+import logging
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Per-type limits (messages per second / burst) for messages no game needs often
+DEFAULT_RATE_LIMITS = ('toggle_ready=2/5,get_question=5/10,answer=5/10,'
+                       'create_room=1/5,join_room=1/5,spectate_room=1/5,find_match=1/5')
+
+# Messages dropped while shedding load: none of them is needed by a game in progress
+SHEDDABLE = frozenset({
+    'create_room', 'join_room', 'spectate_room', 'find_match', 'toggle_ready', 'get_question', 'answer',
+})
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'burst', 'tokens', 'updated', 'notified')
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate  # Tokens added per second
+        self.burst = burst  # Most tokens held
+        self.tokens = burst
+        self.updated = now
+        self.notified = False  # The client has been told about the current run of drops
+
+    def _refill(self, now: float) -> float:
+        tokens = self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return tokens
+
+    def take(self, now: float) -> bool:
+        """Take a token if one is there"""
+        if self._refill(now) < 1:
+            return False
+        self.tokens -= 1
+        self.notified = False
+        return True
+
+    def reserve(self, now: float) -> float:
+        """Take a token, borrowing it if need be. Returns the seconds until it is due."""
+        self.tokens = self._refill(now) - 1
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+
+def parse_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    """Parse ``"type=rate/burst,..."`` into ``{type: (rate, burst)}``; a missing burst equals the rate"""
+    limits = {}
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        message_type, _, limit = item.partition('=')
+        rate, _, burst = limit.partition('/')
+        try:
+            limits[message_type.strip()] = (float(rate), float(burst or rate))
+        except ValueError:
+            raise ValueError(f"Bad rate limit {item!r}: expected type=rate/burst") from None
+    return limits
+
+
+class AdmissionController:
+    def __init__(self, max_connections: int = 0, rate: float = 0, burst: float = 0,
+                 limits: Dict[str, Tuple[float, float]] = None, shed_lag: float = 0,
+                 lag: Callable[[], float] = None, clock: Callable[[], float] = time.monotonic):
+        self.max_connections = max_connections  # 0 is no cap
+        self.rate = rate  # Messages per second per client, all types together; 0 is no limit
+        self.burst = burst or rate
+        self.limits = limits or {}
+        self.shed_lag = shed_lag  # Seconds of event-loop lag that start shedding; 0 never sheds
+        self.lag = lag or (lambda: 0.0)
+        self.clock = clock
+        self.connections = 0
+        self.shedding = False
+        self.refused: Dict[str, int] = {'connection_cap': 0, 'overload': 0}
+        self.dropped: Dict[str, int] = {'rate_limit': 0, 'overload': 0}
+        self.throttled = 0  # Reads held back for a client over its rate
+
+    @property
+    def overloaded(self) -> bool:
+        if self.shed_lag <= 0:
+            return False
+        lag = self.lag()
+        if self.shedding:
+            if lag < self.shed_lag / 2:
+                self.shedding = False
+                logger.warning("Event loop lag %.3fs: no longer shedding load", lag)
+        elif lag > self.shed_lag:
+            self.shedding = True
+            logger.warning("Event loop lag %.3fs: shedding load", lag)
+        return self.shedding
+
+    def admit(self, resuming: bool) -> Optional[str]:
+        """Count a new connection in, or return why it is refused"""
+        if resuming:
+            self.connections += 1
+            return None
+        if self.max_connections and self.connections >= self.max_connections:
+            reason = 'connection_cap'
+        elif self.overloaded:
+            reason = 'overload'
+        else:
+            self.connections += 1
+            return None
+        self.refused[reason] += 1
+        return reason
+
+    def release(self):
+        self.connections -= 1
+
+    def _buckets(self, player) -> dict:
+        buckets = player.buckets
+        if buckets is None:
+            buckets = player.buckets = {}
+        return buckets
+
+    def throttle(self, player) -> float:
+        """Seconds to wait before reading a client's next frame"""
+        if not self.rate:
+            return 0.0
+        buckets = self._buckets(player)
+        bucket = buckets.get(None)
+        if bucket is None:
+            bucket = buckets[None] = TokenBucket(self.rate, self.burst, self.clock())
+        delay = bucket.reserve(self.clock())
+        if delay:
+            self.throttled += 1
+        return delay
+
+    def check(self, player, message_type: str) -> Optional[str]:
+        """Return why a client's message is to be dropped, or None to handle it.
+
+        The reason is an empty string for a drop the client has already been told about.
+        """
+        if message_type in SHEDDABLE and self.overloaded:
+            self.dropped['overload'] += 1
+            return 'overload'
+        limit = self.limits.get(message_type)
+        if limit is None:
+            return None
+        buckets = self._buckets(player)
+        now = self.clock()
+        bucket = buckets.get(message_type)
+        if bucket is None:
+            bucket = buckets[message_type] = TokenBucket(*limit, now)
+        if bucket.take(now):
+            return None
+        self.dropped['rate_limit'] += 1
+        if bucket.notified:
+            return ''
+        bucket.notified = True
+        return 'rate_limit'
+
+    def stats(self) -> dict:
+        return {
+            'connections': self.connections,
+            'max_connections': self.max_connections,
+            'shedding': self.shedding,
+            'refused': dict(self.refused),
+            'dropped': dict(self.dropped),
+            'throttled': self.throttled,
+        }
@@ -0,0 +1,203 @@
+"""In-memory static asset pipeline.
+
+Every file under the static directory is read once at startup and held as
+bytes, with a gzip variant when that is smaller. Each file is also served
+under a content-hashed name such as ``game.3f9a1c2b.js``. Those names
+never change meaning, so they are sent with a year-long ``immutable``
+``Cache-Control``. HTML pages have their ``href``/``src`` references
+rewritten to the hashed names and are revalidated on every load. Plain
+names still work, with revalidation, for anything that links to them.
+
+Responses carry a weak ``ETag``. A matching ``If-None-Match`` gets a 304.
+No request touches the disk, so serving assets costs the process that
+also carries the WebSocket traffic very little.
+"""
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+COMPRESSIBLE = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+_REFERENCE = re.compile(r'(\b(?:href|src)=")([^"?#]+)(")')
+
+
+class Asset:
+    __slots__ = ('path', 'content_type', 'body', 'gzip', 'etag', 'cache_control')
+
+    def __init__(self, path: str, content_type: str, body: bytes, cache_control: str):
+        self.path = path
+        self.content_type = content_type
+        self.body = body
+        self.etag = f'W/"{hashlib.sha256(body).hexdigest()[:16]}"'
+        self.cache_control = cache_control
+        self.gzip = None
+        if content_type.startswith(COMPRESSIBLE):
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                self.gzip = compressed
+
+
+def _hashed_name(path: str, body: bytes) -> str:
+    stem, ext = os.path.splitext(path)
+    return f'{stem}.{hashlib.sha256(body).hexdigest()[:8]}{ext}'
+
+
+class StaticAssets:
+    """ASGI app serving a directory from memory; mount it in place of ``StaticFiles``"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.assets: Dict[str, Asset] = {}  # URL path under the mount -> asset
+        self.hashed: Dict[str, str] = {}  # Plain path -> hashed path
+        self.not_modified = 0
+        self.served = 0
+        self.bytes_sent = 0
+        self.load()
+
+    def load(self):
+        files = {}
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                full = os.path.join(root, name)
+                path = os.path.relpath(full, self.directory).replace(os.sep, '/')
+                with open(full, 'rb') as f:
+                    files[path] = f.read()
+
+        assets, hashed = {}, {}
+        pages = [path for path in files if path.endswith('.html')]
+        for path, body in files.items():
+            if path in pages:
+                continue
+            content_type = self._content_type(path)
+            hashed[path] = _hashed_name(path, body)
+            assets[hashed[path]] = Asset(path, content_type, body, IMMUTABLE)
+            assets[path] = Asset(path, content_type, body, REVALIDATE)
+
+        for path in pages:
+            body = self._rewrite(path, files[path].decode('utf-8'), hashed).encode('utf-8')
+            assets[path] = Asset(path, self._content_type(path), body, REVALIDATE)
+
+        self.assets, self.hashed = assets, hashed
+        raw = sum(len(body) for body in files.values())
+        packed = sum(len(asset.gzip or asset.body) for path, asset in assets.items() if path in files)
+        logger.info("Loaded %d static files (%d bytes, %d gzipped)", len(files), raw, packed)
+
+    @staticmethod
+    def _content_type(path: str) -> str:
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if content_type.startswith('text/') or content_type == 'application/javascript':
+            content_type += '; charset=utf-8'
+        return content_type
+
+    @staticmethod
+    def _rewrite(page: str, html: str, hashed: Dict[str, str]) -> str:
+        """Point relative references in a page at the hashed names"""
+        base = os.path.dirname(page)
+
+        def replace(match):
+            reference = match.group(2)
+            target = os.path.normpath(os.path.join(base, reference)).replace(os.sep, '/')
+            if '://' in reference or reference.startswith('/') or target not in hashed:
+                return match.group(0)
+            relative = os.path.relpath(hashed[target], base or '.').replace(os.sep, '/')
+            return f'{match.group(1)}{relative}{match.group(3)}'
+
+        return _REFERENCE.sub(replace, html)
+
+    def lookup(self, path: str) -> Optional[Asset]:
+        return self.assets.get(path.lstrip('/'))
+
+    async def __call__(self, scope, receive, send):
+        assert scope['type'] == 'http'
+        method = scope['method']
+        if method not in ('GET', 'HEAD'):
+            await self._respond(send, 405, [(b'allow', b'GET, HEAD')], b'Method Not Allowed')
+            return
+
+        asset = self.lookup(scope['path'])  # Mount passes the path below the mount point
+        if asset is None:
+            await self._respond(send, 404, [], b'Not Found')
+            return
+
+        headers = {}
+        for name, value in scope['headers']:
+            if name in (b'if-none-match', b'accept-encoding'):
+                headers[name] = value.decode('latin-1')
+
+        common = [
+            (b'etag', asset.etag.encode('latin-1')),
+            (b'cache-control', asset.cache_control.encode('latin-1')),
+        ]
+        if asset.gzip is not None:
+            common.append((b'vary', b'Accept-Encoding'))
+
+        if_none_match = headers.get(b'if-none-match')
+        if if_none_match and self._etag_matches(if_none_match, asset.etag):
+            self.not_modified += 1
+            await self._respond(send, 304, common, b'')
+            return
+
+        body = asset.body
+        if asset.gzip is not None and self._accepts_gzip(headers.get(b'accept-encoding', '')):
+            body = asset.gzip
+            common.append((b'content-encoding', b'gzip'))
+        common.append((b'content-type', asset.content_type.encode('latin-1')))
+        self.served += 1
+        if method == 'HEAD':
+            await self._respond(send, 200, common, b'', content_length=len(body))
+            return
+        self.bytes_sent += len(body)
+        await self._respond(send, 200, common, body)
+
+    @staticmethod
+    def _accepts_gzip(header: str) -> bool:
+        """Whether an Accept-Encoding header allows gzip, named or through ``*``, with a q above 0"""
+        accepted = None
+        for item in header.split(','):
+            coding, *params = item.split(';')
+            coding = coding.strip().lower()
+            if coding not in ('gzip', '*'):
+                continue
+            q = 1.0
+            for param in params:
+                name, _, value = param.partition('=')
+                if name.strip().lower() == 'q':
+                    try:
+                        q = float(value)
+                    except ValueError:
+                        q = 0.0
+            if coding == 'gzip':
+                return q > 0  # An explicit gzip entry overrides *
+            accepted = q > 0
+        return bool(accepted)
+
+    @staticmethod
+    def _etag_matches(header: str, etag: str) -> bool:
+        if header.strip() == '*':
+            return True
+        # Weak comparison, as If-None-Match requires
+        opaque = etag[2:]
+        return any(candidate.strip().removeprefix('W/') == opaque for candidate in header.split(','))
+
+    @staticmethod
+    async def _respond(send, status: int, headers: list, body: bytes, content_length: int = None):
+        if status != 304:
+            length = len(body) if content_length is None else content_length
+            headers = headers + [(b'content-length', str(length).encode('latin-1'))]
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    def stats(self) -> dict:
+        return {
+            'files': len(self.hashed) + sum(1 for path in self.assets if path.endswith('.html')),
+            'served': self.served,
+            'not_modified': self.not_modified,
+            'bytes_sent': self.bytes_sent,
+        }
@@ -0,0 +1,4 @@
+"""Micro-benchmarks for the game server.
+
+Run from the server directory, e.g. ``python -m benchmarks.room_index``.
+"""
@@ -0,0 +1,134 @@
+"""Cost of running room commands through room actors, against running them directly.
+
+Builds ``--rooms`` rooms of three players with a game in progress, in
+one process, against the in-process fake Redis. Every player then sends
+``--answers`` ``submit_answer`` messages, one every ``--pace`` seconds,
+through ``route_message``, the path a message read off a socket takes.
+Rooms start spread over the first ``--pace`` seconds. The three players
+of a room start together, so in actor mode a command that arrives while
+another for its room is running queues on the room's inbox. Two cases,
+each in its own process because ``ROOM_EXECUTION`` is read when the app
+is imported:
+
+- direct: each handler runs in its sender's coroutine
+- actor: each command runs as a command of its room's actor, in its
+  sender's coroutine if nothing is queued for the room, otherwise from
+  the inbox
+
+Reports CPU time per command, the p50/p99 time from routing a message to
+its handler finishing, and in actor mode the deepest inbox seen.
+
+    python -m benchmarks.actors --rooms 2000 --answers 20 --pace 0.5
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+CASES = ('direct', 'actor')
+ROOM_SIZE = 3
+
+
+class NullChannel:
+    """Encodes frames as a client channel would, then drops them"""
+
+    depth = 0
+
+    def __init__(self, codec):
+        self.codec = codec
+        self.frames = 0
+
+    def send(self, frame, kind: str = None) -> bool:
+        if not isinstance(frame, str):
+            frame.encode(self.codec)
+        self.frames += 1
+        return True
+
+    def close(self):
+        pass
+
+
+def build_rooms(manager, rooms: int) -> list:
+    """Create the rooms, each with three players and a game in progress"""
+    from models import Player
+    from wire import JSON
+
+    codes = [f'R{i:05d}' for i in range(rooms)]
+    for code in codes:
+        for seat in range(ROOM_SIZE):
+            player_id = f'{code}-{seat}'
+            player = manager.players[player_id] = Player(player_id, name=player_id)
+            player.channel = NullChannel(JSON)
+            manager.add_player_to_room(player_id, code)
+        manager.start_game(code)
+    return codes
+
+
+async def play(main, client_id: str, answers: int, pace: float, delay: float, latencies: list):
+    message = {'type': 'submit_answer', 'answer_index': 0}
+    await asyncio.sleep(delay)
+    for _ in range(answers):
+        start = time.perf_counter()
+        await main.route_message(client_id, dict(message))
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(pace)
+
+
+async def run_case(case: str, options) -> dict:
+    os.environ.update({
+        'REDIS_URL': 'memory://',
+        'ROOM_EXECUTION': case,
+        'QUESTIONS_RELOAD_INTERVAL': '0',
+        'QUESTION_TIME_LIMIT': '0',
+        'ROOM_IDLE_TIMEOUT': '0',
+        'LOG_LEVEL': 'WARNING',
+    })
+    import main
+    from benchmarks.loadtest import percentile
+
+    manager = main.manager
+    codes = build_rooms(manager, options.rooms)
+    latencies = []
+    pace = options.pace
+    cpu = time.process_time()
+    await asyncio.gather(*(play(main, f'{code}-{seat}', options.answers, pace, pace * i / len(codes), latencies)
+                           for i, code in enumerate(codes) for seat in range(ROOM_SIZE)))
+    await manager.actors.drain()
+    cpu = time.process_time() - cpu
+
+    latencies.sort()
+    return {
+        'case': case,
+        'cpu_us': cpu / len(latencies) * 1e6,
+        'p50': percentile(latencies, 0.50) * 1000,
+        'p99': percentile(latencies, 0.99) * 1000,
+        'max_depth': manager.actors.max_depth,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rooms', type=int, default=2000)
+    parser.add_argument('--answers', type=int, default=20, help='submit_answer messages per player')
+    parser.add_argument('--pace', type=float, default=0.5, help='seconds between one player\'s messages')
+    parser.add_argument('--case', choices=CASES, help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.case:
+        print(json.dumps(asyncio.run(run_case(options.case, options))))
+        return
+
+    print(f"{options.rooms} rooms, {options.answers} answers per player every {options.pace}s\n")
+    print(f"{'mode':>6} {'cpu us/cmd':>11} {'p50 ms':>8} {'p99 ms':>8} {'max inbox':>10}")
+    for case in CASES:
+        output = subprocess.run([sys.executable, '-m', 'benchmarks.actors', *sys.argv[1:], '--case', case],
+                                check=True, capture_output=True, text=True).stdout
+        r = json.loads(output.strip().splitlines()[-1])
+        print(f"{case:>6} {r['cpu_us']:>11.2f} {r['p50']:>8.2f} {r['p99']:>8.2f} {r['max_depth']:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""Latency of running games under a flood, with and without admission control.
+
+Plays ``--rooms`` games of three against the in-process app for
+``--seconds``, each room answering a question every ``--pace`` seconds,
+and records ``submit_answer`` latency (send until the sender has its
+``game_state_update``). Three cases:
+
+- quiet: the games alone
+- flood: ``--flooders`` clients each send ``--flood-rate`` ``get_question``
+  and ``toggle_ready`` messages a second and never read the replies, while
+  ``--surge`` new clients connect over the run and create rooms
+- flood, admission: the same flood with admission control on, as ``main``
+  configures it by default
+
+Each case runs in its own process so every case starts from a fresh app.
+
+    python -m benchmarks.admission --rooms 30 --flooders 20 --seconds 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+CASES = ('quiet', 'flood', 'flood, admission')
+
+
+def configure(case: str):
+    """Environment for a case, set before the app is imported"""
+    os.environ.setdefault('LOOP_LAG_INTERVAL', '0.05')  # Sample lag often enough to shed within a run
+    os.environ.setdefault('LOG_LEVEL', 'ERROR')
+    if case == 'flood, admission':
+        from admission import DEFAULT_RATE_LIMITS
+        os.environ.update({'MAX_CONNECTIONS': '10000', 'CLIENT_RATE_LIMIT': '20', 'CLIENT_RATE_BURST': '40',
+                           'RATE_LIMITS': DEFAULT_RATE_LIMITS, 'SHED_LAG_THRESHOLD': '0.2'})
+
+
+async def flood(harness, client_id: str, rate: float, until: float, sent: list):
+    ws = await harness.connect(client_id)
+    # Encoded once: the flooders share the CPU with the server, which is what is being measured
+    messages = [json.dumps({'type': 'get_question', 'job_title': 'software_engineer'}),
+                json.dumps({'type': 'toggle_ready'})]
+    tick = 0.01
+    per_tick = max(1, int(rate * tick))
+    while time.perf_counter() < until:
+        for i in range(per_tick):
+            ws.send_text(messages[i % 2])
+        sent[0] += per_tick
+        await asyncio.sleep(tick)
+
+
+async def surge(harness, index: int, delay: float, outcome: dict):
+    from benchmarks.harness import ConnectionClosed
+    await asyncio.sleep(delay)
+    ws = await harness.connect(f'surge{index}')
+    await ws.send({'type': 'create_room', 'username': f'surge{index}'})
+    try:
+        # A refused connection is accepted and then closed straight away
+        await ws.recv()
+    except ConnectionClosed:
+        outcome['refused'] += 1
+        return
+    outcome['admitted'] += 1
+    await ws.send({'type': 'get_question', 'job_title': 'software_engineer'})
+
+
+async def play(sockets: list, question: dict, pace: float, until: float, latencies: list):
+    from benchmarks.loadtest import correct_answer
+    turn = 0
+    while time.perf_counter() < until:
+        sender = sockets[turn % len(sockets)]
+        turn += 1
+        sent = time.perf_counter()
+        await sender.send({'type': 'submit_answer', 'answer_index': correct_answer(question)})
+        update = await sender.recv_until(lambda m: m['type'] == 'game_state_update')
+        latencies.append(sender.last_received_at - sent)
+        for ws in sockets:
+            if ws is not sender:
+                await ws.recv_until(lambda m: m['type'] == 'game_state_update')
+        question = update['game_state']['current_question']
+        await asyncio.sleep(pace)
+
+
+async def run_case(case: str, options) -> dict:
+    from benchmarks.harness import AppHarness
+    from benchmarks.loadtest import Recorder, percentile, setup_room
+
+    async with AppHarness() as harness:
+        setup = [await setup_room(harness, i, 3, Recorder()) for i in range(options.rooms)]
+        start = time.perf_counter()
+        until = start + options.seconds
+        latencies, sent, outcome = [], [0], {'admitted': 0, 'refused': 0}
+        tasks = [play(sockets, question, options.pace, until, latencies) for sockets, question in setup]
+        if case != 'quiet':
+            rng = random.Random(1)
+            tasks += [flood(harness, f'flood{i}', options.flood_rate, until, sent) for i in range(options.flooders)]
+            tasks += [surge(harness, i, rng.uniform(0, options.seconds), outcome) for i in range(options.surge)]
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+        stats = harness.main.admission.stats()
+
+    latencies.sort()
+    return {
+        'case': case,
+        'answers_per_second': len(latencies) / elapsed,
+        'p50': percentile(latencies, 0.50) * 1000,
+        'p95': percentile(latencies, 0.95) * 1000,
+        'p99': percentile(latencies, 0.99) * 1000,
+        'flood_per_second': sent[0] / elapsed,
+        'surge': outcome,
+        'dropped': stats['dropped'],
+        'refused': stats['refused'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rooms', type=int, default=30, help='games of three being played')
+    parser.add_argument('--pace', type=float, default=0.05, help='seconds between answers in a room')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--flooders', type=int, default=20, help='clients sending as fast as --flood-rate')
+    parser.add_argument('--flood-rate', type=float, default=500, help='messages per second per flooder')
+    parser.add_argument('--surge', type=int, default=500, help='new clients connecting during the run')
+    parser.add_argument('--case', choices=CASES, help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.case:
+        configure(options.case)
+        print(json.dumps(asyncio.run(run_case(options.case, options))))
+        return
+
+    print(f"{'case':>16} {'answers/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'flood/s':>8} "
+          f"{'surge in/out':>12} {'dropped rate/lag':>16}")
+    args = [arg for arg in sys.argv[1:]]
+    for case in CASES:
+        output = subprocess.run([sys.executable, '-m', 'benchmarks.admission', *args, '--case', case],
+                                check=True, capture_output=True, text=True).stdout
+        r = json.loads(output.strip().splitlines()[-1])
+        surged = f"{r['surge']['admitted']}/{r['surge']['refused']}"
+        dropped = f"{r['dropped']['rate_limit']}/{r['dropped']['overload']}"
+        print(f"{case:>16} {r['answers_per_second']:>9.0f} {r['p50']:>8.2f} {r['p95']:>8.2f} {r['p99']:>8.2f} "
+              f"{r['flood_per_second']:>8.0f} {surged:>12} {dropped:>16}")
+
+
+if __name__ == '__main__':
+    main()
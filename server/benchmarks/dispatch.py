@@ -0,0 +1,148 @@
+"""Per-message decode, dispatch and encode cost, before and after the handler registry.
+
+before: ``json.loads``, the old ``if/elif`` chain over ``message["type"]``
+        and ``json.dumps``
+after:  ``wire.decode_message``, a registry lookup plus schema validation,
+        and each available wire format (stdlib JSON, orjson, msgpack)
+
+Dispatch is measured up to the point the handler would be called, so the
+numbers are the framework overhead per message, not the game logic.
+
+    python -m benchmarks.dispatch --iterations 200000
+"""
+import argparse
+import json
+import os
+import time
+
+os.environ.setdefault('REDIS_URL', 'memory://')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+import wire  # noqa: E402
+from main import handlers  # noqa: E402
+
+# A mix weighted like a running game: mostly answers, a few room messages
+INCOMING = [
+    {'type': 'submit_answer', 'answer_index': 2},
+    {'type': 'submit_answer', 'answer_index': 0},
+    {'type': 'submit_answer', 'answer_index': 1},
+    {'type': 'submit_answer', 'answer_index': 3},
+    {'type': 'toggle_ready'},
+    {'type': 'join_room', 'room': 'AB12C', 'username': 'player', 'job_title': 'software_engineer'},
+    {'type': 'create_room', 'username': 'player'},
+    {'type': 'get_question', 'job_title': 'software_engineer'},
+    {'type': 'answer', 'job_title': 'software_engineer', 'answer_idx': 1},
+]
+
+OUTGOING = {
+    'type': 'game_state_update',
+    'game_state': {
+        'status': 'active',
+        'current_round': 1,
+        'players': [
+            {'id': f'player-{i}', 'name': f'Player {i}', 'score': 40 + i * 10, 'level': 1}
+            for i in range(3)
+        ],
+        'current_question': {
+            'id': 7,
+            'question': 'What is the formula for Return on Assets (ROA)?',
+            'options': ['Net Income / Total Assets', 'Net Income / Revenue',
+                        'Total Assets / Net Income', 'Revenue / Total Assets'],
+            'correct': 0,
+            'level': 1,
+        },
+    },
+    'answer_result': {'correct': True, 'player_id': 'player-1'},
+}
+
+
+def legacy_dispatch(message: dict):
+    """The old chain, in its original order, stopping where a branch would run"""
+    if message["type"] == "create_room":
+        return "create_room"
+    elif message["type"] == "join_room":
+        return "join_room"
+    elif message["type"] == "toggle_ready":
+        return "toggle_ready"
+    elif message["type"] == "start_game":
+        return "start_game"
+    elif message["type"] == "submit_answer":
+        return "submit_answer"
+    elif message["type"] == "hello":
+        return "hello"
+    elif message["type"] == "sync_request":
+        return "sync_request"
+    elif message["type"] == "get_question":
+        return "get_question"
+    elif message["type"] == "answer":
+        return "answer"
+
+
+def registry_dispatch(message: dict):
+    handler = handlers.get(message.get("type"))
+    if handler is None:
+        return None
+    if handler.schema.validate(message):
+        return None
+    return handler.func
+
+
+def per_call(func, items: list, iterations: int) -> float:
+    count = len(items)
+    for i in range(min(iterations, 1000)):
+        func(items[i % count])  # Warm up
+    start = time.perf_counter()
+    for i in range(iterations):
+        func(items[i % count])
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=200_000)
+    options = parser.parse_args()
+    n = options.iterations
+
+    json_codecs = [wire.JsonCodec('stdlib')]
+    if wire.orjson is not None:
+        json_codecs.append(wire.JsonCodec('orjson'))
+    binary_codecs = [codec for codec in wire.CODECS.values() if codec.binary]
+
+    texts = [json.dumps(message) for message in INCOMING]
+    parsed = [json.loads(text) for text in texts]
+
+    rows = [
+        ('before', 'json.loads', per_call(json.loads, texts, n),
+         per_call(legacy_dispatch, parsed, n), per_call(json.dumps, [OUTGOING], n)),
+    ]
+    for codec in json_codecs:
+        rows.append((
+            'after', f'json ({codec.backend})',
+            per_call(lambda text: wire.decode_message(text, None, codec), texts, n),
+            per_call(registry_dispatch, parsed, n),
+            per_call(codec.encode, [OUTGOING], n),
+        ))
+    for codec in binary_codecs:
+        frames = [codec.encode(message) for message in INCOMING]
+        rows.append((
+            'after', codec.name,
+            per_call(lambda data: wire.decode_message(None, data, codec), frames, n),
+            per_call(registry_dispatch, parsed, n),
+            per_call(codec.encode, [OUTGOING], n),
+        ))
+    if not binary_codecs:
+        print("msgpack is not installed; skipping the binary format\n")
+
+    print(f"{'':>7} {'format':>16} {'decode us':>10} {'dispatch us':>12} {'encode us':>10} {'total us':>9}")
+    for label, name, decode, dispatch, encode in rows:
+        total = decode + dispatch + encode
+        print(f"{label:>7} {name:>16} {decode * 1e6:>10.3f} {dispatch * 1e6:>12.3f} "
+              f"{encode * 1e6:>10.3f} {total * 1e6:>9.3f}")
+
+    sizes = [('json.dumps', len(json.dumps(OUTGOING))), ('json (compact)', len(json_codecs[0].encode(OUTGOING)))]
+    sizes += [(codec.name, len(codec.encode(OUTGOING))) for codec in binary_codecs]
+    print("\ngame_state_update size: " + ", ".join(f"{name} {size} bytes" for name, size in sizes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Encode cost of a ``game_state_update`` broadcast, whole versus from cached fragments.
+
+Plays ``--rounds`` answered questions in a room of ``--players``, with
+questions drawn from the question bank. Each round moves the game on and
+changes the answering player's score, as ``submit_answer`` does, and then
+builds the frame and encodes it once to JSON, which is the cost of a
+broadcast before the frame is queued for each player:
+
+- whole: the ``game_state`` dict encoded in one go
+- cached: ``FragmentCache``. With the stdlib backend only the round, the
+  deadline, the answer result and the one player whose score changed are
+  encoded; the question and the other players come from the cache. With
+  orjson the cache steps aside and the message is encoded whole, so the
+  two cases should match.
+
+Runs with each JSON backend available. Reports microseconds per broadcast
+and bytes per frame.
+
+    python -m benchmarks.fragments --rounds 50000 --players 3 10
+"""
+import argparse
+import random
+import time
+
+from fragments import FragmentCache
+from models import Player
+from question_bank import QuestionBank
+from wire import Frame, JsonCodec, orjson
+
+QUESTIONS = 'data/questions.jsonl'
+
+
+def rounds(bank: QuestionBank, players: int, count: int, seed: int):
+    """The players and the (question, answering player) of every round"""
+    rng = random.Random(seed)
+    questions = [bank.get(question_id) for question_id in bank.index.questions]
+    members = {f'player-{i}': Player(f'player-{i}', f'Player {i}') for i in range(players)}
+    plays = []
+    for _ in range(count):
+        question = rng.choice(questions)
+        # As the game state holds it: the answer stays on the room
+        plays.append(({'id': question['id'], 'question': question['question'], 'options': question['options'],
+                       'level': question['level']},
+                      rng.choice(list(members))))
+    return members, plays
+
+
+def game_state(members: dict) -> dict:
+    return {
+        'status': 'active',
+        'current_round': 1,
+        'players': [{'id': player.id, 'name': player.name, 'score': 0, 'level': 1}
+                    for player in members.values()],
+        'current_question': None,
+        'question_deadline': None,
+    }
+
+
+def play(members: dict, plays: list, codec, cache: FragmentCache = None) -> tuple:
+    state = game_state(members)
+    entries = {entry['id']: entry for entry in state['players']}
+    size = 0
+    start = time.perf_counter()
+    for question, player_id in plays:
+        entries[player_id]['score'] += question['level'] * 10
+        state['current_question'] = question
+        state['current_round'] += 1
+        state['question_deadline'] = round(time.time() + 30, 3)
+        answer_result = {'correct': True, 'player_id': player_id}
+        if cache is None:
+            frame = Frame({'type': 'game_state_update', 'game_state': state, 'answer_result': answer_result})
+        else:
+            frame = cache.frame('game_state_update', state, answer_result=answer_result)
+        size += len(frame.encode(codec))
+    elapsed = time.perf_counter() - start
+    return elapsed / len(plays) * 1e6, size / len(plays)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=50000, help='answered questions per case')
+    parser.add_argument('--players', type=int, nargs='+', default=[3, 10], help='players per room')
+    parser.add_argument('--seed', type=int, default=1)
+    options = parser.parse_args()
+
+    bank = QuestionBank(QUESTIONS)
+    bank.load()
+    backends = ['stdlib'] + (['orjson'] if orjson is not None else [])
+    print(f"{'players':>7} {'backend':>7} {'whole us':>9} {'cached us':>10} {'speedup':>8} "
+          f"{'whole B':>8} {'cached B':>9}")
+    for players in options.players:
+        for backend in backends:
+            codec = JsonCodec(backend)
+            members, plays = rounds(bank, players, options.rounds, options.seed)
+            whole, whole_size = play(members, plays, codec)
+            members, plays = rounds(bank, players, options.rounds, options.seed)
+            cache = FragmentCache(members, bank, codec)
+            cached, cached_size = play(members, plays, codec, cache)
+            print(f"{players:>7} {backend:>7} {whole:>9.2f} {cached:>10.2f} {whole / cached:>7.1f}x "
+                  f"{whole_size:>8.0f} {cached_size:>9.0f}")
+
+
+if __name__ == '__main__':
+    main()
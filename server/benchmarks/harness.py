@@ -0,0 +1,106 @@
+"""In-process ASGI WebSocket client for driving the app without a network.
+
+Benchmarks import this module before ``main`` so the app comes up against
+the in-process fake Redis:
+
+    from benchmarks.harness import AppHarness
+    async with AppHarness() as harness:
+        ws = await harness.connect('alice')
+"""
+import asyncio
+import json
+import os
+import time
+
+os.environ.setdefault('REDIS_URL', 'memory://')
+os.environ.setdefault('QUESTIONS_RELOAD_INTERVAL', '0')
+# Benchmarks drive the app flat out; benchmarks.admission turns admission control on itself
+os.environ.setdefault('MAX_CONNECTIONS', '0')
+os.environ.setdefault('CLIENT_RATE_LIMIT', '0')
+os.environ.setdefault('RATE_LIMITS', '')
+os.environ.setdefault('SHED_LAG_THRESHOLD', '0')
+
+
+class ConnectionClosed(Exception):
+    pass
+
+
+class ASGIWebSocket:
+    """One client connection speaking the ASGI websocket protocol directly to the app"""
+
+    def __init__(self, app, path: str):
+        self.app = app
+        self.path = path
+        self._to_app = asyncio.Queue()
+        self._from_app = asyncio.Queue()
+        self._task = None
+        self.last_received_at = None  # perf_counter() when the last frame returned by recv() arrived
+
+    async def connect(self):
+        scope = {
+            'type': 'websocket',
+            'asgi': {'version': '3.0'},
+            'scheme': 'ws',
+            'http_version': '1.1',
+            'path': self.path,
+            'raw_path': self.path.encode(),
+            'root_path': '',
+            'query_string': b'',
+            'headers': [(b'host', b'testserver')],
+            'client': ('127.0.0.1', 0),
+            'server': ('testserver', 80),
+            'subprotocols': [],
+        }
+        self._to_app.put_nowait({'type': 'websocket.connect'})
+        self._task = asyncio.create_task(self.app(scope, self._to_app.get, self._send_from_app))
+        _, message = await self._from_app.get()
+        if message['type'] != 'websocket.accept':
+            raise ConnectionClosed(message)
+        return self
+
+    async def _send_from_app(self, message: dict):
+        self._from_app.put_nowait((time.perf_counter(), message))
+
+    async def send(self, message: dict):
+        self._to_app.put_nowait({'type': 'websocket.receive', 'text': json.dumps(message)})
+
+    def send_text(self, text: str):
+        """Queue an already-encoded frame, for clients whose own cost should not count"""
+        self._to_app.put_nowait({'type': 'websocket.receive', 'text': text})
+
+    async def recv(self) -> dict:
+        self.last_received_at, message = await self._from_app.get()
+        if message['type'] == 'websocket.close':
+            raise ConnectionClosed(message)
+        text = message.get('text')
+        return json.loads(text if text is not None else message['bytes'])
+
+    async def recv_until(self, predicate) -> dict:
+        while True:
+            message = await self.recv()
+            if predicate(message):
+                return message
+
+    async def close(self):
+        self._to_app.put_nowait({'type': 'websocket.disconnect', 'code': 1000})
+        if self._task is not None:
+            await self._task
+
+
+class AppHarness:
+    """Runs the app's startup/shutdown hooks and hands out connections"""
+
+    def __init__(self):
+        import main
+        self.main = main
+        self.app = main.app
+
+    async def __aenter__(self):
+        await self.app.router.startup()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.app.router.shutdown()
+
+    async def connect(self, client_id: str) -> ASGIWebSocket:
+        return await ASGIWebSocket(self.app, f'/ws/{client_id}').connect()
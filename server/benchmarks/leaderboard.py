@@ -0,0 +1,105 @@
+"""Leaderboard reads: ordered structures versus scanning every score.
+
+Builds a leaderboard of N players and times one score update, one rank
+lookup and one top-10 read for:
+
+- scan: a plain ``player_id -> score`` dict, ranked by counting higher
+  scores and read with ``heapq.nlargest``
+- memory: ``MemoryLeaderboard`` (``SortedList``)
+- redis: ``RedisLeaderboard`` against the in-process fake Redis
+
+It then has many pollers hit the top-10 through ``ResponseCache`` and
+reports how many of their requests actually reached the leaderboard.
+
+    python -m benchmarks.leaderboard --players 200000
+"""
+import argparse
+import asyncio
+import heapq
+import random
+import time
+
+from fake_redis import FakeRedis
+from leaderboard import MemoryLeaderboard, RedisLeaderboard, ResponseCache
+
+
+class ScanLeaderboard:
+    def __init__(self):
+        self.scores = {}
+
+    def add(self, player_id, name, points):
+        self.scores[player_id] = self.scores.get(player_id, 0) + points
+
+    async def top(self, k):
+        return heapq.nlargest(k, self.scores.items(), key=lambda item: item[1])
+
+    async def rank(self, player_id):
+        score = self.scores[player_id]
+        return 1 + sum(1 for other in self.scores.values() if other > score)
+
+
+async def per_call(func, args_list) -> float:
+    start = time.perf_counter()
+    for args in args_list:
+        result = func(*args)
+        if asyncio.iscoroutine(result):
+            await result
+    return (time.perf_counter() - start) / len(args_list)
+
+
+async def poll(board, pollers: int, requests: int, ttl: float, latency: float) -> tuple:
+    cache = ResponseCache(ttl)
+
+    async def load():
+        await asyncio.sleep(latency)  # Stand-in for the Redis round trip
+        return await board.top(10)
+
+    async def poller():
+        for _ in range(requests // pollers):
+            await cache.get('top:10', load)
+            await asyncio.sleep(0.001)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(poller() for _ in range(pollers)))
+    return cache.misses, time.perf_counter() - start
+
+
+async def run(players: int, samples: int):
+    ids = [f'player-{i}' for i in range(players)]
+    boards = {'scan': ScanLeaderboard(), 'memory': MemoryLeaderboard(), 'redis': RedisLeaderboard(FakeRedis())}
+    for board in boards.values():
+        for player_id in ids:
+            board.add(player_id, player_id, random.randrange(0, 10_000))
+    await boards['redis'].flush()
+
+    updates = [(random.choice(ids), None, 10) for _ in range(samples)]
+    lookups = [(random.choice(ids),) for _ in range(samples)]
+    print(f"{players} players\n")
+    print(f"{'backend':>8} {'update us':>10} {'rank us':>10} {'top-10 us':>10}")
+    for label, board in boards.items():
+        update = await per_call(board.add, updates)
+        if label == 'redis':
+            await board.flush()
+        # The scan costs O(n) per read, so it gets fewer samples
+        reads = lookups if label != 'scan' else lookups[:max(1, samples // 100)]
+        rank = await per_call(board.rank, reads)
+        top = await per_call(board.top, [(10,)] * len(reads))
+        print(f"{label:>8} {update * 1e6:>10.2f} {rank * 1e6:>10.2f} {top * 1e6:>10.2f}")
+
+    print()
+    for ttl in (0.0, 2.0):
+        # With a ttl of 0 only concurrent misses are shared
+        misses, elapsed = await poll(boards['memory'], pollers=200, requests=20_000, ttl=ttl, latency=0.001)
+        print(f"20000 polls, cache ttl {ttl:g}s: {misses} reached the leaderboard ({elapsed:.2f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--players', type=int, default=200_000)
+    parser.add_argument('--samples', type=int, default=2_000)
+    options = parser.parse_args()
+    asyncio.run(run(options.players, options.samples))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""WebSocket load test against the in-process app and fake Redis.
+
+Simulates N concurrent clients on ``/ws/{client_id}`` running the real
+game flow: ``create_room``, ``join_room``, ``toggle_ready``,
+``start_game`` and then rounds of ``submit_answer``, with the players of
+each room taking turns. Reports answer throughput, per-message-type
+latency percentiles (send until the sender gets its reply), broadcast
+fan-out time (send until the last player in the room has the frame) and
+memory per connection.
+
+    python -m benchmarks.loadtest --clients 300 --answers 20
+    python -m benchmarks.loadtest --save baseline.json
+    python -m benchmarks.loadtest --baseline baseline.json --tolerance 0.2
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+from benchmarks.harness import AppHarness
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.fanout = []
+
+    def record(self, message_type: str, sent_at: float, received_at: float):
+        self.latencies[message_type].append(received_at - sent_at)
+
+
+async def setup_room(harness: AppHarness, index: int, room_size: int, recorder: Recorder):
+    client_ids = [f'r{index}p{j}' for j in range(room_size)]
+    sockets = {client_id: await harness.connect(client_id) for client_id in client_ids}
+    first = sockets[client_ids[0]]
+
+    sent = time.perf_counter()
+    await first.send({'type': 'create_room', 'username': client_ids[0]})
+    room_code = (await first.recv_until(lambda m: m['type'] == 'room_created'))['room_code']
+    recorder.record('create_room', sent, first.last_received_at)
+
+    for client_id in client_ids[1:]:
+        ws = sockets[client_id]
+        sent = time.perf_counter()
+        await ws.send({'type': 'join_room', 'room': room_code, 'username': client_id})
+        await ws.recv_until(lambda m: m['type'] == 'room_joined')
+        recorder.record('join_room', sent, ws.last_received_at)
+
+    update = await first.recv_until(lambda m: m['type'] == 'room_update' and len(m['players']) == room_size)
+    creator_id = next(p['id'] for p in update['players'] if p['isCreator'])
+    creator = sockets[creator_id]
+
+    for client_id, ws in sockets.items():
+        if client_id != creator_id:
+            sent = time.perf_counter()
+            await ws.send({'type': 'toggle_ready'})
+            await ws.recv_until(lambda m: m['type'] == 'ready_state_updated')
+            recorder.record('toggle_ready', sent, ws.last_received_at)
+    await creator.recv_until(lambda m: m['type'] == 'room_update' and all(
+        p['ready'] or p['isCreator'] for p in m['players']))
+
+    sent = time.perf_counter()
+    await creator.send({'type': 'start_game'})
+    started = await creator.recv_until(lambda m: m['type'] == 'game_started')
+    recorder.record('start_game', sent, creator.last_received_at)
+    for client_id, ws in sockets.items():
+        if client_id != creator_id:
+            await ws.recv_until(lambda m: m['type'] == 'game_started')
+
+    return list(sockets.values()), started['game_state']['current_question']
+
+
+def correct_answer(question: dict) -> int:
+    """Clients are not sent the answer; look it up in the bank the server loaded"""
+    import main
+    return main.question_bank.get(question['id'])['correct']
+
+
+async def play_room(sockets: list, question: dict, answers: int, recorder: Recorder):
+    for turn in range(answers):
+        sender = sockets[turn % len(sockets)]
+        sent = time.perf_counter()
+        await sender.send({'type': 'submit_answer', 'answer_index': correct_answer(question)})
+        update = await sender.recv_until(lambda m: m['type'] == 'game_state_update')
+        recorder.record('submit_answer', sent, sender.last_received_at)
+        last = sender.last_received_at
+        for ws in sockets:
+            if ws is not sender:
+                await ws.recv_until(lambda m: m['type'] == 'game_state_update')
+                last = max(last, ws.last_received_at)
+        recorder.fanout.append(last - sent)
+        question = update['game_state']['current_question']
+
+
+async def run(clients: int, room_size: int, answers: int, measure_memory: bool) -> dict:
+    recorder = Recorder()
+    rooms = clients // room_size
+    async with AppHarness() as harness:
+        if measure_memory:
+            tracemalloc.start()
+            before = tracemalloc.take_snapshot()
+        setup = await asyncio.gather(*(setup_room(harness, i, room_size, recorder) for i in range(rooms)))
+        memory_per_connection = None
+        if measure_memory:
+            after = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            allocated = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+            memory_per_connection = allocated / (rooms * room_size)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(play_room(sockets, question, answers, recorder) for sockets, question in setup))
+        elapsed = time.perf_counter() - start
+
+        for sockets, _ in setup:
+            for ws in sockets:
+                await ws.close()
+        room_updates = harness.main.manager.room_updates.stats()
+
+    answered = len(recorder.latencies['submit_answer'])
+    return {
+        'clients': rooms * room_size,
+        'rooms': rooms,
+        'answers': answered,
+        'throughput': answered / elapsed,
+        'frames_per_second': answered * room_size / elapsed,
+        'memory_per_connection': memory_per_connection,
+        'room_updates': room_updates,
+        'latency_ms': {
+            message_type: {
+                'p50': percentile(sorted(values), 0.50) * 1000,
+                'p95': percentile(sorted(values), 0.95) * 1000,
+                'p99': percentile(sorted(values), 0.99) * 1000,
+            }
+            for message_type, values in recorder.latencies.items()
+        },
+        'fanout_ms': {
+            'p50': percentile(sorted(recorder.fanout), 0.50) * 1000,
+            'p95': percentile(sorted(recorder.fanout), 0.95) * 1000,
+            'p99': percentile(sorted(recorder.fanout), 0.99) * 1000,
+        },
+    }
+
+
+def report(results: dict):
+    print(f"clients={results['clients']} rooms={results['rooms']} answers={results['answers']}")
+    print(f"throughput: {results['throughput']:.0f} answers/s, {results['frames_per_second']:.0f} frames/s")
+    if results['memory_per_connection'] is not None:
+        print(f"memory: {results['memory_per_connection'] / 1024:.1f} KiB per connection (Python heap)")
+    print(f"\n{'message':>14} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for message_type, stats in results['latency_ms'].items():
+        print(f"{message_type:>14} {stats['p50']:>8.2f} {stats['p95']:>8.2f} {stats['p99']:>8.2f}")
+    fanout = results['fanout_ms']
+    print(f"{'fan-out':>14} {fanout['p50']:>8.2f} {fanout['p95']:>8.2f} {fanout['p99']:>8.2f}")
+    updates = results['room_updates']
+    print(f"\nroom_update: {updates['requested']} requested, {updates['sent']} sent "
+          f"(ratio {updates['coalescing_ratio']:.2f}, interval {updates['interval_ms']:g} ms)")
+
+
+def regressions(results: dict, baseline: dict, tolerance: float) -> list:
+    problems = []
+    if results['throughput'] < baseline['throughput'] * (1 - tolerance):
+        problems.append(f"throughput {results['throughput']:.0f}/s < baseline {baseline['throughput']:.0f}/s")
+    for message_type, stats in baseline['latency_ms'].items():
+        current = results['latency_ms'].get(message_type)
+        if current and current['p95'] > stats['p95'] * (1 + tolerance):
+            problems.append(f"{message_type} p95 {current['p95']:.2f}ms > baseline {stats['p95']:.2f}ms")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=300)
+    parser.add_argument('--room-size', type=int, default=3, choices=[2, 3])
+    parser.add_argument('--answers', type=int, default=20, help='submit_answer rounds per room')
+    parser.add_argument('--no-memory', action='store_true', help='skip tracemalloc during setup')
+    parser.add_argument('--save', help='write results as JSON to this path')
+    parser.add_argument('--baseline', help='compare against results saved with --save')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    options = parser.parse_args()
+
+    results = asyncio.run(run(options.clients, options.room_size, options.answers, not options.no_memory))
+    report(results)
+
+    if options.save:
+        with open(options.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if options.baseline:
+        with open(options.baseline) as f:
+            problems = regressions(results, json.load(f), options.tolerance)
+        for problem in problems:
+            print(f"REGRESSION: {problem}")
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""Matchmaking under a simulated player population.
+
+Players arrive ``--rate`` times a second for ``--seconds`` on a simulated
+clock. Each has one of ``--jobs`` job titles and a level between 1 and
+``--levels``, with low levels the most common, as in a live game. A
+``--cancel`` share of them give up before they are matched. Every
+``--interval`` seconds the matcher runs, in one of two ways:
+
+- scan: one queue in arrival order. For each waiting player, the matcher
+  walks the rest of the queue looking for compatible players. The widening
+  rule is the same.
+- bucketed: ``Matchmaker``, with one queue per job title and level
+
+Reports the CPU cost of enqueueing and matching, the simulated time to a
+match (p50/p95/p99/max), and the players still waiting at the end.
+
+    python -m benchmarks.matchmaking --rate 2000 --seconds 60
+"""
+import argparse
+import random
+import time
+
+from matchmaking import Matchmaker, Ticket
+
+
+async def _discard(group):
+    pass
+
+
+class ScanMatchmaker(Matchmaker):
+    """The same matching rule, applied by scanning one arrival-ordered list"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.queue = []
+
+    def enqueue(self, player_id: str, job_title: str, level: int) -> Ticket:
+        self.cancel(player_id)
+        ticket = self.tickets[player_id] = Ticket(player_id, job_title, level, self.clock())
+        self.queue.append(ticket)
+        self.enqueued += 1
+        return ticket
+
+    def match(self, now: float = None):
+        now = self.clock() if now is None else now
+        groups = []
+        queue = [ticket for ticket in self.queue if ticket.live]
+        for i, ticket in enumerate(queue):
+            if not ticket.live:
+                continue
+            group = [ticket]
+            low = high = ticket.level
+            spread = self.spread(ticket, now)
+            for other in queue[i + 1:]:
+                if not other.live or other.job_title != ticket.job_title:
+                    continue
+                other_spread = min(spread, self.spread(other, now))
+                if max(high, other.level) - min(low, other.level) > other_spread:
+                    continue
+                group.append(other)
+                low, high, spread = min(low, other.level), max(high, other.level), other_spread
+                if len(group) == self.room_size:
+                    break
+            if len(group) == self.room_size or (len(group) == 2 and spread >= self.max_spread):
+                for member in group:
+                    member.live = False
+                    del self.tickets[member.player_id]
+                groups.append(group)
+        self.queue = [ticket for ticket in queue if ticket.live]
+        self.matched += sum(len(group) for group in groups)
+        self.rooms += len(groups)
+        return groups
+
+
+def population(rate: float, seconds: float, jobs: int, levels: int, cancel: float, seed: int):
+    """Arrivals as (time, player_id, job_title, level, cancel_at or None), in time order"""
+    rng = random.Random(seed)
+    weights = [1 / level for level in range(1, levels + 1)]
+    titles = [f'job_{i}' for i in range(jobs)]
+    arrivals, t, i = [], 0.0, 0
+    while True:
+        t += rng.expovariate(rate)
+        if t >= seconds:
+            return arrivals
+        level = rng.choices(range(1, levels + 1), weights)[0]
+        cancel_at = t + rng.uniform(1, 20) if rng.random() < cancel else None
+        arrivals.append((t, f'p{i}', rng.choice(titles), level, cancel_at))
+        i += 1
+
+
+def simulate(cls, arrivals, seconds: float, options) -> dict:
+    now = [0.0]
+    matchmaker = cls(_discard, room_size=3, interval=options.interval,
+                     widen_after=options.widen_after, max_spread=options.max_spread,
+                     clock=lambda: now[0])
+    cancels = sorted((cancel_at, player_id) for _, player_id, _, _, cancel_at in arrivals if cancel_at)
+    waits, sizes = [], {}
+    enqueue_cpu = match_cpu = 0.0
+    worst_tick = 0.0
+    a = c = 0
+    tick = options.interval
+    while tick <= seconds + 60:
+        start = time.perf_counter()
+        while a < len(arrivals) and arrivals[a][0] <= tick:
+            arrived, player_id, job_title, level, _ = arrivals[a]
+            now[0] = arrived
+            matchmaker.enqueue(player_id, job_title, level)
+            a += 1
+        while c < len(cancels) and cancels[c][0] <= tick:
+            matchmaker.cancel(cancels[c][1])
+            c += 1
+        enqueue_cpu += time.perf_counter() - start
+
+        now[0] = tick
+        start = time.perf_counter()
+        groups = matchmaker.match()
+        elapsed = time.perf_counter() - start
+        match_cpu += elapsed
+        worst_tick = max(worst_tick, elapsed)
+        for group in groups:
+            sizes[len(group)] = sizes.get(len(group), 0) + 1
+            waits.extend(tick - ticket.enqueued_at for ticket in group)
+        tick += options.interval
+        if tick > seconds and not matchmaker.tickets:
+            break
+
+    waits.sort()
+
+    def pct(p):
+        return waits[min(len(waits) - 1, int(p * len(waits)))] if waits else 0.0
+
+    return {
+        'enqueue_rate': len(arrivals) / enqueue_cpu if enqueue_cpu else float('inf'),
+        'match_ms': match_cpu / (seconds / options.interval) * 1000,
+        'worst_ms': worst_tick * 1000,
+        'p50': pct(0.50), 'p95': pct(0.95), 'p99': pct(0.99), 'max': waits[-1] if waits else 0.0,
+        'rooms': sizes,
+        'left': len(matchmaker.tickets),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rate', type=float, nargs='+', default=[200, 2000], help='arrivals per second')
+    parser.add_argument('--seconds', type=float, default=60, help='simulated seconds of arrivals')
+    parser.add_argument('--jobs', type=int, default=5, help='job titles')
+    parser.add_argument('--levels', type=int, default=10, help='levels')
+    parser.add_argument('--cancel', type=float, default=0.05, help='share of players who give up')
+    parser.add_argument('--interval', type=float, default=0.25, help='seconds between matcher runs')
+    parser.add_argument('--widen-after', type=float, default=5.0, help='seconds per extra level of spread')
+    parser.add_argument('--max-spread', type=int, default=3, help='most levels apart in one room')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--no-scan', action='store_true', help='skip the scanning baseline')
+    options = parser.parse_args()
+
+    print(f"{'rate':>6} {'matcher':>9} {'enqueue/s':>10} {'ms/tick':>8} {'worst':>8} "
+          f"{'p50 s':>6} {'p95 s':>6} {'p99 s':>6} {'max s':>6} {'rooms 3/2':>11} {'left':>5}")
+    for rate in options.rate:
+        arrivals = population(rate, options.seconds, options.jobs, options.levels, options.cancel, options.seed)
+        matchers = [('bucketed', Matchmaker)] if options.no_scan else [('scan', ScanMatchmaker), ('bucketed', Matchmaker)]
+        for label, cls in matchers:
+            r = simulate(cls, arrivals, options.seconds, options)
+            rooms = f"{r['rooms'].get(3, 0)}/{r['rooms'].get(2, 0)}"
+            print(f"{rate:>6.0f} {label:>9} {r['enqueue_rate']:>10.0f} {r['match_ms']:>8.2f} {r['worst_ms']:>8.2f} "
+                  f"{r['p50']:>6.2f} {r['p95']:>6.2f} {r['p99']:>6.2f} {r['max']:>6.2f} {rooms:>11} {r['left']:>5}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Bytes per connected player: parallel dicts versus slotted records.
+
+Builds N connected players in rooms of three in two layouts and measures
+the heap each one allocates with tracemalloc:
+
+- dicts: the old ``ConnectionManager`` layout, with one dict per field
+  (``player_scores``, ``player_levels``, ``player_names``,
+  ``player_ready_states``, ``player_job_titles``, ``client_rooms``,
+  ``active_connections``) and a set per room in ``room_players``
+- records: one ``Player`` per player in ``players`` and one ``Room`` per
+  room in ``rooms``
+
+Player ids, names and the channel object are created up front and shared
+by both layouts, so only the bookkeeping is counted.
+
+    python -m benchmarks.memory --players 100000
+"""
+import argparse
+import gc
+import tracemalloc
+
+from models import Player, Room
+
+ROOM_SIZE = 3
+
+
+def build_dicts(ids, names, channel):
+    state = {
+        'active_connections': {}, 'player_scores': {}, 'player_levels': {}, 'player_names': {},
+        'player_ready_states': {}, 'player_job_titles': {}, 'client_rooms': {}, 'room_players': {},
+    }
+    for i, player_id in enumerate(ids):
+        room_code = ids[i - i % ROOM_SIZE]
+        state['active_connections'][player_id] = channel
+        state['player_scores'][player_id] = 0
+        state['player_levels'][player_id] = 1
+        state['player_names'][player_id] = names[i]
+        state['player_ready_states'][player_id] = False
+        state['player_job_titles'][player_id] = 'software_engineer'
+        state['client_rooms'][player_id] = room_code
+        state['room_players'].setdefault(room_code, set()).add(player_id)
+    return state
+
+
+def build_records(ids, names, channel):
+    players, rooms = {}, {}
+    for i, player_id in enumerate(ids):
+        room_code = ids[i - i % ROOM_SIZE]
+        player = players[player_id] = Player(player_id, name=names[i])
+        player.channel = channel
+        player.job_title = 'software_engineer'
+        room = rooms.get(room_code)
+        if room is None:
+            room = rooms[room_code] = Room(room_code)
+        room.players[player_id] = player
+        player.room = room_code
+    return players, rooms
+
+
+def measure(build, *args) -> int:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    state = build(*args)
+    allocated = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del state
+    return allocated
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--players', type=int, default=100_000)
+    options = parser.parse_args()
+
+    ids = [f'player-{i:06d}' for i in range(options.players)]
+    names = [f'Player {i}' for i in range(options.players)]
+    channel = object()
+
+    print(f"{'layout':>8} {'total MiB':>10} {'bytes/player':>13}")
+    for label, build in (('dicts', build_dicts), ('records', build_records)):
+        allocated = measure(build, ids, names, channel)
+        print(f"{label:>8} {allocated / 2**20:>10.1f} {allocated / options.players:>13.0f}")
+
+
+if __name__ == '__main__':
+    main()
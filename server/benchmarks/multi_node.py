@@ -0,0 +1,179 @@
+"""Run rooms that span several server processes over the Redis room bus.
+
+Starts a fake Redis (``fake_redis.py``) and N uvicorn processes with
+``ROOM_BUS=redis``, then plays games where each room's creator is connected
+to one node and the second player to another, so every message for the
+second player crosses the bus. With one node nothing crosses it. Reports
+answer throughput and cross-node delivery latency.
+
+Several node counts run one after another, each on fresh processes, which
+shows how throughput scales as rooms are spread over more processes. The
+rooms of a node run on its one event loop, so the nodes only add capacity
+up to the number of cores, and the clients share the machine with them.
+
+    python -m benchmarks.multi_node --nodes 1 2 4 --rooms 40 --answers 20 --execution actor
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+import websockets
+
+from question_bank import QuestionBank
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Clients are not sent the answer; they look it up in the bank the nodes load
+question_bank = QuestionBank(os.path.join(SERVER_DIR, 'data', 'questions.jsonl'))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_http(url: str, timeout: float = 15.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def wait_for_port(port: int, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+async def recv_until(ws, predicate):
+    while True:
+        message = json.loads(await ws.recv())
+        if predicate(message):
+            return message
+
+
+async def play_room(index: int, ports: list, answers: int, latencies: list):
+    creator_port = ports[index % len(ports)]
+    joiner_port = ports[(index + 1) % len(ports)]
+    async with websockets.connect(f'ws://127.0.0.1:{creator_port}/ws/c{index}') as first, \
+            websockets.connect(f'ws://127.0.0.1:{joiner_port}/ws/j{index}') as second:
+        await first.send(json.dumps({'type': 'create_room', 'username': f'creator{index}'}))
+        room_code = (await recv_until(first, lambda m: m['type'] == 'room_created'))['room_code']
+
+        await second.send(json.dumps({'type': 'join_room', 'room': room_code, 'username': f'joiner{index}'}))
+        update = await recv_until(first, lambda m: m['type'] == 'room_update' and len(m['players']) == 2)
+
+        # The room creator is whoever the server reports, not necessarily the first socket
+        creator_id = next(p['id'] for p in update['players'] if p['isCreator'])
+        creator, other = (first, second) if creator_id == f'c{index}' else (second, first)
+
+        await other.send(json.dumps({'type': 'toggle_ready'}))
+        await recv_until(creator, lambda m: m['type'] == 'room_update' and all(
+            p['ready'] or p['isCreator'] for p in m['players']))
+
+        await creator.send(json.dumps({'type': 'start_game'}))
+        started = await recv_until(other, lambda m: m['type'] == 'game_started')
+        question = started['game_state']['current_question']
+
+        for _ in range(answers):
+            sent = time.perf_counter()
+            await creator.send(json.dumps({'type': 'submit_answer', 'answer_index': question_bank.get(question['id'])['correct']}))
+            update = await recv_until(other, lambda m: m['type'] == 'game_state_update')
+            latencies.append(time.perf_counter() - sent)
+            question = update['game_state']['current_question']
+            await recv_until(creator, lambda m: m['type'] == 'game_state_update')
+
+
+async def run_clients(ports: list, rooms: int, answers: int):
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(play_room(i, ports, answers, latencies) for i in range(rooms)))
+    elapsed = time.perf_counter() - start
+    return latencies, elapsed
+
+
+def run_nodes(nodes: int, options) -> dict:
+    """Start a fake Redis and ``nodes`` servers, play the games, and stop them again"""
+    redis_port = free_port()
+    ports = [free_port() for _ in range(nodes)]
+    processes = [subprocess.Popen(
+        [sys.executable, 'fake_redis.py', '--port', str(redis_port)],
+        cwd=SERVER_DIR, stdout=subprocess.DEVNULL)]
+    try:
+        wait_for_port(redis_port)
+        for i, port in enumerate(ports):
+            env = dict(
+                os.environ,
+                ROOM_BUS='redis',
+                ROOM_EXECUTION=options.execution,
+                NODE_ID=f'node{i}',
+                # The fake Redis speaks RESP2 only
+                REDIS_URL=f'redis://127.0.0.1:{redis_port}/0?protocol=2',
+            )
+            processes.append(subprocess.Popen(
+                [sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(port), '--log-level', 'warning'],
+                cwd=SERVER_DIR, env=env, stdout=subprocess.DEVNULL))
+        for port in ports:
+            wait_for_http(f'http://127.0.0.1:{port}/')
+
+        latencies, elapsed = asyncio.run(run_clients(ports, options.rooms, options.answers))
+        buses = [json.load(urllib.request.urlopen(f'http://127.0.0.1:{port}/stats'))['bus'] for port in ports]
+    finally:
+        # Stop the servers before the fake Redis they flush to
+        for process in reversed(processes):
+            process.terminate()
+            process.wait()
+
+    latencies.sort()
+    return {
+        'nodes': nodes,
+        'answers': len(latencies),
+        'throughput': len(latencies) / elapsed,
+        'p50': statistics.median(latencies) * 1000,
+        'p95': latencies[int(len(latencies) * 0.95)] * 1000,
+        'max': latencies[-1] * 1000,
+        'buses': buses,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--nodes', type=int, nargs='+', default=[2],
+                        help='node counts to run, one after another, e.g. 1 2 4')
+    parser.add_argument('--rooms', type=int, default=20)
+    parser.add_argument('--answers', type=int, default=20)
+    parser.add_argument('--execution', choices=('direct', 'actor'), default='direct',
+                        help='ROOM_EXECUTION of the nodes')
+    options = parser.parse_args()
+    question_bank.load()
+
+    print(f"rooms={options.rooms} answers per room={options.answers} execution={options.execution} "
+          f"cpus={os.cpu_count()}\n")
+    print(f"{'nodes':>5} {'answers/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'bus errors':>11}")
+    for nodes in options.nodes:
+        r = run_nodes(nodes, options)
+        errors = sum(bus['errors'] for bus in r['buses'])
+        print(f"{r['nodes']:>5} {r['throughput']:>10.0f} {r['p50']:>8.2f} {r['p95']:>8.2f} {r['max']:>8.2f} {errors:>11}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Question bank load time and per-request draw cost at 100k+ questions.
+
+Compares the old ``get_question`` approach (filtering the pool against the
+list of dicts already asked, then ``random.choice``) with ``PoolSampler``
+as the number of questions a player has already seen grows.
+
+    python -m benchmarks.question_bank --questions 100000
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from question_bank import QuestionBank
+
+JOB_TITLES = ['software_engineer', 'data_scientist', 'analyst', 'accountant', 'designer']
+LEVELS = 4
+
+
+def write_bank(path: str, count: int):
+    with open(path, 'w', encoding='utf-8') as f:
+        for question_id in range(1, count + 1):
+            f.write(json.dumps({
+                'id': question_id,
+                'job_title': JOB_TITLES[question_id % len(JOB_TITLES)],
+                'level': question_id % LEVELS + 1,
+                'question': f'Question {question_id}?',
+                'options': ['A', 'B', 'C', 'D'],
+                'correct': question_id % 4
+            }) + '\n')
+
+
+def legacy_request(pool: list, asked: list):
+    available = [q for q in pool if q not in asked]
+    question = random.choice(available)
+    asked.append(question)
+    return question
+
+
+def time_per_call(func, calls: int) -> float:
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - start) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--questions', type=int, default=100_000)
+    parser.add_argument('--asked', type=int, nargs='+', default=[0, 10, 100, 500])
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'questions.jsonl')
+        write_bank(path, options.questions)
+        bank = QuestionBank(path)
+        start = time.perf_counter()
+        bank.load()
+        print(f"load: {(time.perf_counter() - start) * 1000:.1f} ms for {options.questions} questions")
+
+        job_title = JOB_TITLES[0]
+        pool_ids = bank.pool(job_title, 1)
+        pool_dicts = [bank.get(question_id) for question_id in pool_ids]
+        print(f"pool ({job_title}, 1): {len(pool_ids)} questions\n")
+        if not pool_dicts:
+            parser.error("the pool is empty: use more --questions")
+
+        # Both approaches need a question left to draw, so at most all but one can have been asked
+        most = len(pool_dicts) - 1
+        asked_counts = list(dict.fromkeys(min(count, most) for count in options.asked))
+        if max(options.asked) > most:
+            print(f"--asked capped at {most}, one less than the pool\n")
+
+        print(f"{'already asked':>14} {'legacy (us/req)':>16} {'sampler (us/req)':>17}")
+        for asked_count in asked_counts:
+            asked = random.sample(pool_dicts, asked_count)
+            legacy = time_per_call(lambda: legacy_request(pool_dicts, list(asked)), 3)
+
+            sampler = bank.sampler(job_title, 1)
+            for _ in range(asked_count):
+                sampler.draw()
+            draws = min(1000, sampler.remaining)
+            sampled = time_per_call(sampler.draw, draws)
+            print(f"{asked_count:>14} {legacy * 1e6:>16.1f} {sampled * 1e6:>17.3f}")
+
+
+if __name__ == '__main__':
+    main()
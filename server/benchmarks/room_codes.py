@@ -0,0 +1,120 @@
+"""Room code allocation latency as the code space fills up.
+
+Fills a small code space (3 characters, 46,656 codes, so the run is quick)
+to 99.5% occupancy. Reports per-allocation latency in each occupancy band for:
+
+- legacy: ``random.choices`` until the code is not in use
+- allocator: ``RoomCodeAllocator`` against the in-process fake Redis
+
+It then churns at that occupancy, releasing one code and allocating one,
+with no cooldown so released codes are reused at once, to show that reuse
+costs the same as a fresh code.
+
+    python -m benchmarks.room_codes --length 3 --fill 0.995
+"""
+import argparse
+import asyncio
+import random
+import string
+import time
+
+from fake_redis import FakeRedis
+from room_codes import RoomCodeAllocator
+
+BANDS = [0.0, 0.5, 0.8, 0.9, 0.95, 0.99]
+
+
+def legacy_allocate(in_use: set, length: int) -> str:
+    while True:
+        code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=length))
+        if code not in in_use:
+            return code
+
+
+def band_of(occupancy: float) -> float:
+    return max(band for band in BANDS if occupancy >= band)
+
+
+def summarize(samples: dict) -> dict:
+    summary = {}
+    for band, values in samples.items():
+        values.sort()
+        summary[band] = (values[len(values) // 2], values[int(len(values) * 0.99)], values[-1])
+    return summary
+
+
+async def fill(allocate, size: int, target: int) -> dict:
+    in_use = set()
+    samples = {band: [] for band in BANDS}
+    for _ in range(target):
+        start = time.perf_counter()
+        code = await allocate(in_use)
+        elapsed = time.perf_counter() - start
+        assert code not in in_use
+        in_use.add(code)
+        samples[band_of(len(in_use) / size)].append(elapsed)
+    return summarize({band: values for band, values in samples.items() if values})
+
+
+async def churn(allocator: RoomCodeAllocator, in_use: set, rounds: int) -> list:
+    timings = []
+    for _ in range(rounds):
+        code = random.choice(tuple(in_use))
+        in_use.discard(code)
+        allocator.release(code)
+        await asyncio.sleep(0)  # Let the release reach Redis
+        start = time.perf_counter()
+        new_code = await allocator.allocate()
+        timings.append(time.perf_counter() - start)
+        assert new_code not in in_use
+        in_use.add(new_code)
+    timings.sort()
+    return timings
+
+
+async def run(length: int, fill_to: float, churn_rounds: int):
+    size = 36 ** length
+    target = int(size * fill_to)
+
+    async def legacy(in_use):
+        return legacy_allocate(in_use, length)
+
+    allocator = RoomCodeAllocator(FakeRedis(), length=length, cooldown=0.0)
+    await allocator.load()
+
+    async def allocated(in_use):
+        return await allocator.allocate()
+
+    print(f"code space {size}, filling to {target} codes ({fill_to:.1%})\n")
+    results = {'legacy': await fill(legacy, size, target), 'allocator': await fill(allocated, size, target)}
+
+    print(f"{'occupancy':>10} {'method':>10} {'p50 us':>8} {'p99 us':>8} {'max us':>9}")
+    for band in BANDS:
+        for method, summary in results.items():
+            if band in summary:
+                p50, p99, worst = summary[band]
+                print(f"{band:>9.0%}+ {method:>10} {p50 * 1e6:>8.2f} {p99 * 1e6:>8.2f} {worst * 1e6:>9.2f}")
+
+    # Rebuild the allocator's in-use set for the churn phase
+    in_use = set()
+    allocator = RoomCodeAllocator(FakeRedis(), length=length, cooldown=0.0)
+    await allocator.load()
+    for _ in range(target):
+        in_use.add(await allocator.allocate())
+    timings = await churn(allocator, in_use, churn_rounds)
+    print(f"\nchurn at {fill_to:.1%}: {churn_rounds} release+allocate, "
+          f"p50 {timings[len(timings) // 2] * 1e6:.2f} us, max {timings[-1] * 1e6:.2f} us, "
+          f"reused {allocator.reused}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--length', type=int, default=3)
+    parser.add_argument('--fill', type=float, default=0.995)
+    parser.add_argument('--churn', type=int, default=5_000)
+    options = parser.parse_args()
+    asyncio.run(run(options.length, options.fill, options.churn))
+
+
+if __name__ == '__main__':
+    main()
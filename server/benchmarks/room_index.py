@@ -0,0 +1,58 @@
+"""Per-message room lookup cost as the number of live rooms grows.
+
+Compares a linear scan over every room's players with the room code kept
+on each ``Player`` record by ``ConnectionManager``. Also reports what
+``add_player_to_room`` costs while the rooms are built, which covers the
+bookkeeping a join does besides the index (idle timer, spectating,
+matchmaking).
+
+    python -m benchmarks.room_index
+"""
+import time
+import timeit
+
+from fake_redis import FakeRedis
+from main import ConnectionManager
+from models import Player
+
+ROOM_COUNTS = [10, 1_000, 10_000, 100_000]
+LOOKUPS = 10_000
+
+
+def build_manager(room_count: int):
+    """A manager with ``room_count`` rooms of three, and the seconds one add_player_to_room took"""
+    # A whole manager, so everything add_player_to_room touches is set up; nothing is started
+    manager = ConnectionManager(redis=FakeRedis())
+    joining = 0.0
+    for i in range(room_count):
+        room_code = f"R{i:06d}"
+        for j in range(3):
+            player_id = f"p{i}-{j}"
+            manager.players[player_id] = Player(player_id)
+            start = time.perf_counter()
+            manager.add_player_to_room(player_id, room_code)
+            joining += time.perf_counter() - start
+    return manager, joining / (room_count * 3)
+
+
+def scan_lookup(manager: ConnectionManager, client_id: str):
+    for room_code, room in manager.rooms.items():
+        if client_id in room.players:
+            return room_code
+    return None
+
+
+def main():
+    print(f"{'rooms':>8} {'scan (us/msg)':>15} {'index (us/msg)':>15} {'join (us)':>10}")
+    for room_count in ROOM_COUNTS:
+        manager, join = build_manager(room_count)
+        # Worst case for the scan: the sender sits in the most recently created room
+        client_id = f"p{room_count - 1}-0"
+        scan_runs = max(1, LOOKUPS // room_count * 10)
+        scan = timeit.timeit(lambda: scan_lookup(manager, client_id), number=scan_runs) / scan_runs
+        index = timeit.timeit(lambda: manager.get_player_room(client_id), number=LOOKUPS) / LOOKUPS
+        print(f"{room_count:>8} {scan * 1e6:>15.3f} {index * 1e6:>15.3f} {join * 1e6:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Spectator fan-out cost as the audience of one room grows.
+
+Plays ``--seconds`` of a game that changes state ``--rate`` times a second
+in front of N spectators, on a simulated clock, three ways:
+
+- per-recipient: every change is encoded for and queued on each spectator
+  in turn, as ``broadcast`` would do for room members
+- shared: ``SpectatorHub`` with no interval. Every change is built and
+  encoded once and the same frame is queued for everyone.
+- sampled: ``SpectatorHub`` ticking every ``--interval`` seconds. Changes
+  within a tick are folded into one frame, and the interval stretches when
+  fan-out takes too long.
+
+Reports the fan-out time per second of game and the frames each spectator
+receives per second.
+
+    python -m benchmarks.spectators --spectators 100 1000 10000
+"""
+import argparse
+import time
+
+from spectators import SpectatorHub
+from wire import JSON, Frame
+
+ROOM = 'ROOM1'
+
+
+class NullChannel:
+    """Encodes frames as a client channel would, then drops them"""
+
+    depth = 0
+
+    def __init__(self):
+        self.frames = 0
+
+    def send(self, frame, kind: str = None) -> bool:
+        frame.encode(JSON)
+        self.frames += 1
+        return True
+
+
+class Game:
+    """A room whose state changes on every step"""
+
+    def __init__(self):
+        self.step = 0
+
+    def advance(self):
+        self.step += 1
+
+    def view(self, room_code: str) -> dict:
+        return {
+            'type': 'spectator_update',
+            'room_code': room_code,
+            'players': {f'p{i}': {'name': f'Player {i}', 'score': self.step * (i + 1), 'level': 1,
+                                  'ready': True, 'isCreator': i == 0} for i in range(3)},
+            'game': {'status': 'active', 'current_round': self.step, 'question_deadline': 0,
+                     'current_question': {'id': self.step, 'question': 'Which of these is a noun?',
+                                          'options': ['Run', 'Table', 'Quickly', 'Blue'], 'level': 1}},
+        }
+
+
+def per_recipient(game: Game, channels: list, changes: int) -> float:
+    elapsed = 0.0
+    for _ in range(changes):
+        game.advance()
+        start = time.perf_counter()
+        for channel in channels:
+            channel.send(Frame(game.view(ROOM)), 'spectator_update')
+        elapsed += time.perf_counter() - start
+    return elapsed
+
+
+def shared(game: Game, channels: list, changes: int) -> float:
+    hub = SpectatorHub(game.view, interval=0)
+    for i, channel in enumerate(channels):
+        hub.add(ROOM, f's{i}', channel)
+    elapsed = 0.0
+    for _ in range(changes):
+        game.advance()
+        start = time.perf_counter()
+        hub.mark(ROOM)
+        elapsed += time.perf_counter() - start
+    return elapsed
+
+
+def sampled(game: Game, channels: list, changes: int, rate: float, interval: float) -> float:
+    hub = SpectatorHub(game.view, interval=interval)
+    for i, channel in enumerate(channels):
+        hub.add(ROOM, f's{i}', channel)
+    hub.ticking = True  # Ticked by hand below, on the simulated clock
+    elapsed, next_tick = 0.0, interval
+    for step in range(changes):
+        now = step / rate
+        while next_tick <= now:
+            start = time.perf_counter()
+            next_tick += hub.tick()
+            elapsed += time.perf_counter() - start
+        game.advance()
+        hub.mark(ROOM)
+    start = time.perf_counter()
+    hub.tick()
+    return elapsed + time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--spectators', type=int, nargs='+', default=[100, 1_000, 10_000])
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--rate', type=float, default=20, help='state changes per second of game')
+    parser.add_argument('--interval', type=float, default=0.2, help='sampled tick, in seconds')
+    options = parser.parse_args()
+
+    changes = int(options.seconds * options.rate)
+    print(f"{changes} state changes over {options.seconds:g}s of game\n")
+    print(f"{'spectators':>10} {'mode':>14} {'fan-out ms/s':>13} {'frames/spectator/s':>19}")
+    for count in options.spectators:
+        cases = {
+            'per-recipient': lambda channels: per_recipient(Game(), channels, changes),
+            'shared': lambda channels: shared(Game(), channels, changes),
+            'sampled': lambda channels: sampled(Game(), channels, changes, options.rate, options.interval),
+        }
+        for mode, run in cases.items():
+            channels = [NullChannel() for _ in range(count)]
+            elapsed = run(channels)
+            frames = sum(channel.frames for channel in channels) / count / options.seconds
+            print(f"{count:>10} {mode:>14} {elapsed * 1000 / options.seconds:>13.2f} {frames:>19.1f}")
+
+
+if __name__ == '__main__':
+    main()
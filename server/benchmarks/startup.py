@@ -0,0 +1,133 @@
+"""Startup time-to-first-accept for different Redis hydration strategies.
+
+Seeds a fake Redis (with simulated network latency per round trip) with N
+rooms of three players and times how long startup hydration takes before
+the app could accept its first connection:
+
+- legacy: the old sequential SMEMBERS-per-room / HGETALL-per-player loop
+- eager: SSCAN plus pipelined batches of reads
+- lazy: room codes only; each room is loaded when first joined
+- journal: the local journal after ``--journal-updates`` score changes per
+  player, read from a snapshot plus a log tail of ``--journal-tail`` more
+- journal-log: the same history with no snapshot, so every record is replayed
+
+    python -m benchmarks.startup --rooms 1000 10000 50000 --latency 0.0002
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+
+from fake_redis import FakeRedis
+from journal import JournalStore
+from main import ConnectionManager
+
+
+def seed(redis: FakeRedis, rooms: int, players_per_room: int = 3):
+    room_codes = set()
+    for i in range(rooms):
+        room_code = f'R{i:06d}'.encode()
+        room_codes.add(room_code)
+        members = set()
+        for j in range(players_per_room):
+            player_id = f'p{i}-{j}'.encode()
+            members.add(player_id)
+            redis.data[b'player:' + player_id] = {
+                b'name': b'player', b'score': b'10', b'level': b'1', b'ready': b'false'}
+        redis.data[b'room:' + room_code + b':players'] = members
+    redis.data[b'room_codes'] = room_codes
+
+
+async def seed_journal(directory: str, rooms: int, updates: int, tail: int, snapshot: bool,
+                       players_per_room: int = 3):
+    members, fields = {}, {}
+    store = JournalStore(directory, player_record=fields.get, room_record=members.get, max_batch=5_000)
+    if not snapshot:
+        store.snapshot_bytes = store.snapshot_interval = float('inf')
+    store.recover()
+    for i in range(rooms):
+        room_code = f'R{i:06d}'
+        members[room_code] = [f'p{i}-{j}' for j in range(players_per_room)]
+        for player_id in members[room_code]:
+            fields[player_id] = {'name': 'player', 'score': '10', 'level': '1', 'ready': 'false'}
+            store.mark_player(player_id)
+        store.mark_room(room_code)
+    await store.flush()
+
+    async def update(count: int):
+        ids = list(fields)
+        for n in range(count):
+            player_id = ids[n % len(ids)]
+            fields[player_id] = {**fields[player_id], 'score': str(10 + n)}
+            store.mark_player(player_id)
+            if len(store.dirty_players) >= store.max_batch:
+                await store.flush()
+        await store.flush()
+
+    await update(updates * len(fields))
+    if snapshot:
+        await store.snapshot()
+    await update(tail)
+    store._sync_close(store._detach_log())
+
+
+async def legacy_hydrate(redis: FakeRedis):
+    for room_code in await redis.smembers('room_codes'):
+        players = await redis.smembers(f"room:{room_code.decode()}:players")
+        for player_id in players:
+            await redis.hgetall(f"player:{player_id.decode()}")
+
+
+async def measure(rooms: int, latency: float, legacy_max: int, journal_updates: int, journal_tail: int):
+    redis = FakeRedis(latency=latency)
+    seed(redis, rooms)
+    results = {}
+
+    if rooms <= legacy_max:
+        start = time.perf_counter()
+        await legacy_hydrate(redis)
+        results['legacy'] = (time.perf_counter() - start, None)
+
+    for mode in ('eager', 'lazy'):
+        manager = ConnectionManager(redis=redis)
+        start = time.perf_counter()
+        await manager.hydrate(mode)
+        ready = time.perf_counter() - start
+        start = time.perf_counter()
+        await manager.ensure_room_loaded('R000000')
+        first_join = time.perf_counter() - start
+        results[mode] = (ready, first_join)
+
+    for mode, snapshot in (('journal', True), ('journal-log', False)):
+        with tempfile.TemporaryDirectory() as directory:
+            await seed_journal(directory, rooms, journal_updates, journal_tail, snapshot)
+            manager = ConnectionManager(redis=redis, persistence='journal', journal_dir=directory)
+            start = time.perf_counter()
+            await manager.hydrate()
+            results[mode] = (time.perf_counter() - start, None)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rooms', type=int, nargs='+', default=[1_000, 10_000, 50_000])
+    parser.add_argument('--latency', type=float, default=0.0002, help='seconds per Redis round trip')
+    parser.add_argument('--legacy-max', type=int, default=10_000,
+                        help='skip the slow legacy loop above this many rooms')
+    parser.add_argument('--journal-updates', type=int, default=5,
+                        help='score changes per player before the last journal snapshot')
+    parser.add_argument('--journal-tail', type=int, default=10_000,
+                        help='log records written after the last journal snapshot')
+    options = parser.parse_args()
+
+    print(f"{'rooms':>8} {'mode':>11} {'first accept (ms)':>18} {'first join load (ms)':>21}")
+    for rooms in options.rooms:
+        results = asyncio.run(measure(rooms, options.latency, options.legacy_max,
+                                      options.journal_updates, options.journal_tail))
+        for mode, (ready, first_join) in results.items():
+            join = f"{first_join * 1000:.3f}" if first_join is not None else '-'
+            print(f"{rooms:>8} {mode:>11} {ready * 1000:>18.1f} {join:>21}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Static file serving: Starlette's ``StaticFiles`` versus ``StaticAssets``.
+
+Calls both ASGI apps directly, with no server or socket in between, and
+simulates page loads of ``index.html`` plus everything it references:
+
+- first visit: an empty browser cache, sending ``Accept-Encoding: gzip``
+- repeat visit: the browser revalidates with ``If-None-Match``. Under
+  ``StaticAssets`` the hashed files are ``immutable``, so only the page is
+  requested again.
+
+Reports requests per second and the body bytes sent per page load.
+
+    python -m benchmarks.static --loads 2000
+"""
+import argparse
+import asyncio
+import gzip
+import os
+import re
+import time
+
+from starlette.staticfiles import StaticFiles
+
+from assets import StaticAssets
+
+DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static')
+_REFERENCE = re.compile(r'(?:href|src)="([^"?#]+)"')
+
+
+async def request(app, path: str, headers: dict) -> tuple:
+    """One GET through the app; returns (status, response headers, body)"""
+    scope = {
+        'type': 'http', 'method': 'GET', 'path': path, 'root_path': '', 'query_string': b'',
+        'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()],
+    }
+    response = {'body': []}
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+            response['headers'] = {name.decode('latin-1'): value.decode('latin-1')
+                                   for name, value in message['headers']}
+        elif message['type'] == 'http.response.body':
+            response['body'].append(message.get('body', b''))
+
+    await app(scope, receive, send)
+    return response['status'], response['headers'], b''.join(response['body'])
+
+
+async def page_load(app, cache: dict) -> tuple:
+    """Load index.html and its references as a browser would; returns (requests, bytes)"""
+    requests = sent = 0
+    queue, seen = ['/index.html'], set()
+    while queue:
+        path = queue.pop(0)
+        seen.add(path)
+        cached = cache.get(path)
+        if cached and cached['cache-control'].endswith('immutable'):
+            continue
+        headers = {'accept-encoding': 'gzip'}
+        if cached and 'etag' in cached:
+            headers['if-none-match'] = cached['etag']
+        status, response_headers, body = await request(app, path, headers)
+        requests += 1
+        sent += len(body)
+        if status == 200:
+            if response_headers.get('content-encoding') == 'gzip':
+                body = gzip.decompress(body)
+            cached = cache[path] = {'etag': response_headers.get('etag'),
+                                    'cache-control': response_headers.get('cache-control', ''),
+                                    'body': body}
+        elif status != 304:
+            raise RuntimeError(f"{path}: HTTP {status}")
+        if path.endswith('.html'):
+            for reference in _REFERENCE.findall(cached['body'].decode('utf-8')):
+                if '/' + reference not in seen:
+                    queue.append('/' + reference)
+    return requests, sent
+
+
+async def measure(app, loads: int, repeat: bool) -> tuple:
+    warm = {}
+    if repeat:
+        await page_load(app, warm)
+    requests = sent = 0
+    start = time.perf_counter()
+    for _ in range(loads):
+        cache = {path: dict(entry) for path, entry in warm.items()}
+        count, length = await page_load(app, cache)
+        requests += count
+        sent += length
+    elapsed = time.perf_counter() - start
+    return requests / elapsed, requests / loads, sent / loads
+
+
+async def run(loads: int):
+    apps = {'StaticFiles': StaticFiles(directory=DIRECTORY), 'StaticAssets': StaticAssets(DIRECTORY)}
+    print(f"{'visit':>7} {'app':>13} {'req/s':>9} {'req/load':>9} {'bytes/load':>11}")
+    for repeat in (False, True):
+        for label, app in apps.items():
+            rate, per_load, sent = await measure(app, loads, repeat)
+            visit = 'repeat' if repeat else 'first'
+            print(f"{visit:>7} {label:>13} {rate:>9.0f} {per_load:>9.1f} {sent:>11.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--loads', type=int, default=2000, help='page loads per case')
+    options = parser.parse_args()
+    asyncio.run(run(options.loads))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""Cost of tracking one deadline per room: timer wheel versus per-room handles.
+
+Schedules a question deadline (``--limit`` seconds plus jitter) for each of
+N rooms, then restarts every deadline once, as an answer does. Reports
+the cost per operation and the heap held per pending deadline for:
+
+- task: one ``asyncio`` task sleeping per room
+- call_later: one ``loop.call_later`` handle per room
+- wheel: ``TimerWheel``, with one driving task for every room
+
+It then runs the wheel on a simulated clock through all the deadlines,
+checking that each one fires on its own tick, and reports the time spent
+per tick.
+
+    python -m benchmarks.timers --rooms 200000
+"""
+import argparse
+import asyncio
+import gc
+import random
+import time
+import tracemalloc
+
+from timer_wheel import TimerWheel
+
+
+def noop(*args):
+    pass
+
+
+async def sleeper(delay: float):
+    await asyncio.sleep(delay)
+
+
+class TaskTimers:
+    def schedule(self, delay, callback, *args):
+        return asyncio.ensure_future(sleeper(delay))
+
+
+class LoopTimers:
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+
+    def schedule(self, delay, callback, *args):
+        return self.loop.call_later(delay, callback, *args)
+
+
+async def measure(timers, delays) -> tuple:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    handles = [timers.schedule(delay, noop, i) for i, delay in enumerate(delays)]
+    schedule_s = time.perf_counter() - start
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for i, delay in enumerate(delays):
+        handles[i].cancel()
+        handles[i] = timers.schedule(delay, noop, i)
+    reschedule_s = time.perf_counter() - start
+
+    for handle in handles:
+        handle.cancel()
+    await asyncio.sleep(0)  # Let cancelled tasks finish
+    return schedule_s, reschedule_s, held
+
+
+def simulate(delays, resolution: float) -> tuple:
+    now = [0.0]
+    wheel = TimerWheel(resolution=resolution, clock=lambda: now[0])
+    late = []
+
+    def fired(expected_tick):
+        late.append(wheel._tick - expected_tick)
+
+    for delay in delays:
+        wheel.schedule(delay, fired, int(delay / resolution + 0.999999))
+
+    ticks = int(max(delays) / resolution) + 2
+    tick_times = []
+    for _ in range(ticks):
+        now[0] += resolution
+        start = time.perf_counter()
+        wheel.advance()
+        tick_times.append(time.perf_counter() - start)
+    tick_times.sort()
+    return late, tick_times
+
+
+async def run(rooms: int, limit: float, resolution: float):
+    delays = [limit + random.uniform(0, limit) for _ in range(rooms)]
+
+    print(f"{rooms} rooms, deadlines {limit:.0f}-{2 * limit:.0f}s\n")
+    print(f"{'method':>10} {'schedule us':>12} {'restart us':>11} {'bytes/room':>11}")
+    for label, timers in (('task', TaskTimers()), ('call_later', LoopTimers()),
+                          ('wheel', TimerWheel(resolution=resolution))):
+        schedule_s, reschedule_s, held = await measure(timers, delays)
+        print(f"{label:>10} {schedule_s / rooms * 1e6:>12.2f} {reschedule_s / rooms * 1e6:>11.2f} "
+              f"{held / rooms:>11.0f}")
+
+    late, tick_times = simulate(delays, resolution)
+    print(f"\nwheel on a simulated clock: {len(late)} of {rooms} fired, "
+          f"{sum(1 for t in late if t)} off their tick")
+    print(f"per tick ({resolution}s): p50 {tick_times[len(tick_times) // 2] * 1e6:.0f} us, "
+          f"p99 {tick_times[int(len(tick_times) * 0.99)] * 1e6:.0f} us, max {tick_times[-1] * 1e6:.0f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rooms', type=int, default=200_000)
+    parser.add_argument('--limit', type=float, default=30.0)
+    parser.add_argument('--resolution', type=float, default=0.1)
+    options = parser.parse_args()
+    asyncio.run(run(options.rooms, options.limit, options.resolution))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Client message handlers, looked up by message type, with precompiled schemas.
+
+Handlers register for one message type along with the fields they need:
+
+    handlers = HandlerRegistry()
+
+    @handlers.on('join_room', required={'username': str, 'room': str},
+                 optional={'job_title': str},
+                 error='Missing username or room in join request')
+    async def join_room(client_id: str, message: dict):
+        ...
+
+Each schema is compiled once into a tuple of checks, so validating a
+message costs a dict lookup and an ``isinstance`` per declared field. A
+message that fails validation never reaches its handler. Optional fields
+may be left out or sent as ``null``.
+"""
+from typing import Awaitable, Callable, Dict, Optional
+
+HandlerFunc = Callable[[str, dict], Awaitable[None]]
+
+_MISSING = object()
+
+
+def _as_types(types) -> tuple:
+    return tuple(types) if isinstance(types, (tuple, list)) else (types,)
+
+
+class MessageSchema:
+    """Required and optional fields of one message type, with their types"""
+
+    __slots__ = ('message_type', 'checks', 'error')
+
+    def __init__(self, message_type: str, required: Dict[str, type] = None,
+                 optional: Dict[str, type] = None, error: str = None):
+        self.message_type = message_type
+        self.error = error  # Sent instead of the generic text when a required field is missing
+        checks = []
+        for field, types in (required or {}).items():
+            types = _as_types(types)
+            checks.append((field, types, True, bool in types))
+        for field, types in (optional or {}).items():
+            types = _as_types(types)
+            checks.append((field, types, False, bool in types))
+        self.checks = tuple(checks)
+
+    def validate(self, message: dict) -> Optional[str]:
+        """Return an error message, or None if the message is valid"""
+        for field, types, required, allow_bool in self.checks:
+            value = message.get(field, _MISSING)
+            if value is _MISSING or value is None:
+                if required:
+                    return self.error or f"Missing {field} in {self.message_type} request"
+                continue
+            # bool is an int subclass; only accept it where it was asked for
+            if not isinstance(value, types) or (value.__class__ is bool and not allow_bool):
+                return f"Invalid {field} in {self.message_type} request"
+        return None
+
+
+class Handler:
+    __slots__ = ('message_type', 'func', 'schema')
+
+    def __init__(self, message_type: str, func: HandlerFunc, schema: MessageSchema):
+        self.message_type = message_type
+        self.func = func
+        self.schema = schema
+
+
+class HandlerRegistry:
+    def __init__(self):
+        self.handlers: Dict[str, Handler] = {}
+
+    def on(self, message_type: str, required: Dict[str, type] = None,
+           optional: Dict[str, type] = None, error: str = None):
+        """Decorator registering the handler for ``message_type``"""
+        def register(func: HandlerFunc) -> HandlerFunc:
+            if message_type in self.handlers:
+                raise ValueError(f"A handler for {message_type} is already registered")
+            schema = MessageSchema(message_type, required, optional, error)
+            self.handlers[message_type] = Handler(message_type, func, schema)
+            return func
+        return register
+
+    def get(self, message_type) -> Optional[Handler]:
+        return self.handlers.get(message_type)
+
+    def __contains__(self, message_type) -> bool:
+        return message_type in self.handlers
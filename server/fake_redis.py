@@ -0,0 +1,469 @@
+"""In-process stand-in for the subset of Redis the game server uses.
+
+``FakeRedis`` mirrors the ``redis.asyncio`` client API closely enough for
+the persistence layer and the benchmarks: values come back as bytes and
+``pipeline()`` queues commands until ``execute()``.
+
+Running this module serves the same data over the Redis wire protocol, so
+several server processes can share it as a local Redis stand-in:
+
+    python fake_redis.py --port 6399
+"""
+import argparse
+import asyncio
+import heapq
+import math
+import time
+from collections import deque
+
+from sortedcontainers import SortedList
+
+
+def _b(value) -> bytes:
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode('utf-8')
+
+
+class FakePipeline:
+    def __init__(self, redis: 'FakeRedis'):
+        self._redis = redis
+        self._commands = []
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def queue(*args, **kwargs):
+            self._commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    def __len__(self):
+        return len(self._commands)
+
+    async def execute(self):
+        commands, self._commands = self._commands, []
+        await self._redis._round_trip()
+        return [self._redis._execute(name, *args, **kwargs) for name, args, kwargs in commands]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self._commands = []
+
+
+class FakePubSub:
+    def __init__(self, redis: 'FakeRedis'):
+        self._redis = redis
+        self._channels = set()
+        self._queue = asyncio.Queue()
+
+    def _deliver(self, channel: bytes, message: bytes):
+        self._queue.put_nowait({'type': 'message', 'pattern': None, 'channel': channel, 'data': message})
+
+    async def subscribe(self, *channels):
+        for channel in channels:
+            channel = _b(channel)
+            self._channels.add(channel)
+            self._redis._subscribe(channel, self._deliver)
+            self._queue.put_nowait({'type': 'subscribe', 'pattern': None, 'channel': channel, 'data': len(self._channels)})
+
+    async def unsubscribe(self, *channels):
+        for channel in [_b(c) for c in channels] or list(self._channels):
+            self._channels.discard(channel)
+            self._redis._unsubscribe(channel, self._deliver)
+
+    async def listen(self):
+        while True:
+            yield await self._queue.get()
+
+    async def aclose(self):
+        await self.unsubscribe()
+
+
+class FakeRedis:
+    """Async, in-memory Redis with optional simulated network latency"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.data = {}
+        self.expires = {}  # key -> monotonic time it expires at
+        self._expiry_heap = []  # (expires_at, key); entries go stale when a TTL changes
+        self.round_trips = 0
+        self.commands = 0
+        self._subscribers = {}  # channel -> list of callbacks(channel, message)
+
+    def __getattr__(self, name):
+        if name.startswith('_') or not hasattr(type(self), f'_cmd_{name}'):
+            raise AttributeError(name)
+
+        async def call(*args, **kwargs):
+            await self._round_trip()
+            return self._execute(name, *args, **kwargs)
+        return call
+
+    def pipeline(self, transaction: bool = True):
+        return FakePipeline(self)
+
+    def pubsub(self):
+        return FakePubSub(self)
+
+    def _subscribe(self, channel: bytes, callback):
+        self._subscribers.setdefault(channel, []).append(callback)
+
+    def _unsubscribe(self, channel: bytes, callback):
+        callbacks = self._subscribers.get(channel, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+        if not callbacks:
+            self._subscribers.pop(channel, None)
+
+    async def _round_trip(self):
+        self.round_trips += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def _execute(self, name, *args, **kwargs):
+        self.commands += 1
+        if self._expiry_heap:
+            self._evict_expired()
+        return getattr(self, f'_cmd_{name}')(*args, **kwargs)
+
+    async def close(self):
+        pass
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            expires_at, key = heapq.heappop(heap)
+            if self.expires.get(key) == expires_at:
+                self._remove(key)
+
+    def _remove(self, key: bytes):
+        self.expires.pop(key, None)
+        return self.data.pop(key, None)
+
+    # Keys
+
+    def _cmd_delete(self, *keys):
+        return sum(1 for key in keys if self._remove(_b(key)) is not None)
+
+    def _cmd_exists(self, *keys):
+        return sum(1 for key in keys if _b(key) in self.data)
+
+    def _cmd_expire(self, key, seconds):
+        key = _b(key)
+        if key not in self.data:
+            return 0
+        expires_at = time.monotonic() + float(seconds)
+        self.expires[key] = expires_at
+        heapq.heappush(self._expiry_heap, (expires_at, key))
+        return 1
+
+    def _cmd_ttl(self, key):
+        key = _b(key)
+        if key not in self.data:
+            return -2
+        if key not in self.expires:
+            return -1
+        return math.ceil(self.expires[key] - time.monotonic())
+
+    def _cmd_flushall(self):
+        self.data.clear()
+        self.expires.clear()
+        self._expiry_heap.clear()
+        return True
+
+    def _cmd_ping(self):
+        return b'PONG'
+
+    # Strings
+
+    def _cmd_get(self, key):
+        return self.data.get(_b(key))
+
+    def _cmd_set(self, key, value, nx=False, ex=None):
+        if nx and _b(key) in self.data:
+            return None
+        self.data[_b(key)] = _b(value)
+        self.expires.pop(_b(key), None)  # SET clears any TTL, as in Redis
+        if ex is not None:
+            self._cmd_expire(key, ex)
+        return True
+
+    def _cmd_incrby(self, key, amount=1):
+        value = int(self.data.get(_b(key), b'0')) + int(amount)
+        self.data[_b(key)] = _b(value)
+        return value
+
+    # Lists
+
+    def _cmd_rpush(self, key, *values):
+        items = self.data.setdefault(_b(key), deque())
+        items.extend(_b(v) for v in values)
+        return len(items)
+
+    def _cmd_lpush(self, key, *values):
+        items = self.data.setdefault(_b(key), deque())
+        items.extendleft(_b(v) for v in values)
+        return len(items)
+
+    def _cmd_lpop(self, key):
+        items = self.data.get(_b(key))
+        if not items:
+            return None
+        value = items.popleft()
+        if not items:
+            self._remove(_b(key))
+        return value
+
+    def _cmd_llen(self, key):
+        return len(self.data.get(_b(key), ()))
+
+    # Sets
+
+    def _cmd_sadd(self, key, *members):
+        members_set = self.data.setdefault(_b(key), set())
+        before = len(members_set)
+        members_set.update(_b(m) for m in members)
+        return len(members_set) - before
+
+    def _cmd_srem(self, key, *members):
+        members_set = self.data.get(_b(key))
+        if not members_set:
+            return 0
+        before = len(members_set)
+        members_set.difference_update(_b(m) for m in members)
+        if not members_set:
+            self._remove(_b(key))
+        return before - len(members_set)
+
+    def _cmd_smembers(self, key):
+        return set(self.data.get(_b(key), set()))
+
+    def _cmd_sscan(self, key, cursor=0, match=None, count=None):
+        # The cursor is an offset into the set's iteration order, which is
+        # stable as long as the set is not modified mid-scan
+        members = list(self.data.get(_b(key), set()))
+        cursor = int(cursor)
+        end = cursor + int(count or 10)
+        next_cursor = end if end < len(members) else 0
+        return next_cursor, members[cursor:end]
+
+    async def sscan_iter(self, name, match=None, count=None):
+        cursor = None
+        while cursor != 0:
+            await self._round_trip()
+            cursor, members = self._execute('sscan', name, cursor or 0, count=count)
+            for member in members:
+                yield member
+
+    # Hashes
+
+    def _cmd_hset(self, name, key=None, value=None, mapping=None):
+        fields = self.data.setdefault(_b(name), {})
+        items = dict(mapping or {})
+        if key is not None:
+            items[key] = value
+        added = 0
+        for field, field_value in items.items():
+            if _b(field) not in fields:
+                added += 1
+            fields[_b(field)] = _b(field_value)
+        return added
+
+    def _cmd_hmset(self, name, mapping):
+        self._cmd_hset(name, mapping=mapping)
+        return True
+
+    def _cmd_hgetall(self, name):
+        return dict(self.data.get(_b(name), {}))
+
+    def _cmd_hget(self, name, key):
+        return self.data.get(_b(name), {}).get(_b(key))
+
+    def _cmd_hmget(self, name, keys, *args):
+        fields = self.data.get(_b(name), {})
+        keys = [keys] if isinstance(keys, (bytes, str)) else list(keys)
+        return [fields.get(_b(key)) for key in keys + list(args)]
+
+    # Sorted sets: (scores by member, SortedList of (score, member))
+
+    def _cmd_zincrby(self, name, amount, value):
+        scores, order = self.data.setdefault(_b(name), ({}, SortedList()))
+        member = _b(value)
+        score = scores.get(member)
+        if score is not None:
+            order.remove((score, member))
+        score = scores[member] = (score or 0.0) + float(amount)
+        order.add((score, member))
+        return score
+
+    def _cmd_zscore(self, name, value):
+        entry = self.data.get(_b(name))
+        return entry[0].get(_b(value)) if entry else None
+
+    def _cmd_zrevrank(self, name, value):
+        entry = self.data.get(_b(name))
+        if not entry or _b(value) not in entry[0]:
+            return None
+        scores, order = entry
+        member = _b(value)
+        return len(order) - 1 - order.index((scores[member], member))
+
+    def _cmd_zrevrange(self, name, start, end, withscores=False):
+        entry = self.data.get(_b(name))
+        if not entry:
+            return []
+        order = entry[1]
+        start, end = int(start), int(end)
+        end = len(order) - 1 if end < 0 else min(end, len(order) - 1)
+        if start > end:
+            return []
+        rows = order[len(order) - 1 - end:len(order) - start][::-1]
+        if withscores:
+            return [(member, score) for score, member in rows]
+        return [member for _, member in rows]
+
+    def _cmd_zcard(self, name):
+        entry = self.data.get(_b(name))
+        return len(entry[0]) if entry else 0
+
+    # Pub/sub
+
+    def _cmd_publish(self, channel, message):
+        callbacks = list(self._subscribers.get(_b(channel), []))
+        for callback in callbacks:
+            callback(_b(channel), _b(message))
+        return len(callbacks)
+
+
+# Redis wire protocol (RESP2) server
+
+class _RespError(Exception):
+    pass
+
+
+def _encode(value) -> bytes:
+    if value is True:
+        return b'+OK\r\n'
+    if value is None:
+        return b'$-1\r\n'
+    if isinstance(value, float):
+        value = repr(value)  # Scores go over the wire as bulk strings
+    if isinstance(value, int):
+        return b':%d\r\n' % value
+    if isinstance(value, _RespError):
+        return b'-ERR %s\r\n' % str(value).encode('utf-8')
+    if isinstance(value, (bytes, str)):
+        value = _b(value)
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+    if isinstance(value, dict):
+        value = [item for pair in value.items() for item in pair]
+    items = list(value)
+    return b'*%d\r\n' % len(items) + b''.join(_encode(item) for item in items)
+
+
+async def _read_command(reader: asyncio.StreamReader):
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b'*'):
+        return line.split()  # Inline command, e.g. from telnet
+    args = []
+    for _ in range(int(line[1:])):
+        length = int((await reader.readline())[1:])
+        args.append((await reader.readexactly(length + 2))[:-2])
+    return args
+
+
+class RespServer:
+    """Serves a FakeRedis to real Redis clients over TCP"""
+
+    def __init__(self, redis: FakeRedis = None):
+        self.redis = redis or FakeRedis()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        channels = set()
+
+        def deliver(channel, message):
+            writer.write(_encode([b'message', channel, message]))
+
+        try:
+            while True:
+                args = await _read_command(reader)
+                if args is None:
+                    break
+                if not args:
+                    continue
+                name, args = args[0].decode('utf-8').lower(), args[1:]
+                if name in ('subscribe', 'unsubscribe'):
+                    targets = args or list(channels)
+                    for channel in targets:
+                        if name == 'subscribe' and channel not in channels:
+                            channels.add(channel)
+                            self.redis._subscribe(channel, deliver)
+                        elif name == 'unsubscribe' and channel in channels:
+                            channels.discard(channel)
+                            self.redis._unsubscribe(channel, deliver)
+                        writer.write(_encode([name.encode('utf-8'), channel, len(channels)]))
+                    if not targets:
+                        writer.write(_encode([name.encode('utf-8'), None, 0]))
+                else:
+                    writer.write(_encode(self.execute(name, args)))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for channel in channels:
+                self.redis._unsubscribe(channel, deliver)
+            writer.close()
+
+    # Wire command names that differ from the client method names
+    ALIASES = {'del': 'delete'}
+
+    def execute(self, name: str, args: list):
+        name = self.ALIASES.get(name, name)
+        try:
+            if name in ('client', 'select'):
+                return True
+            if name == 'set':
+                options = [a.lower() for a in args[2:]]
+                ex = args[2:][options.index(b'ex') + 1] if b'ex' in options else None
+                return self.redis._execute('set', args[0], args[1], nx=b'nx' in options, ex=ex)
+            if name == 'sscan':
+                options = {a.lower(): b for a, b in zip(args[2::2], args[3::2])}
+                cursor, members = self.redis._execute('sscan', args[0], args[1], count=options.get(b'count'))
+                return [str(cursor), members]
+            if name == 'zrevrange':
+                withscores = any(a.lower() == b'withscores' for a in args[3:])
+                rows = self.redis._execute('zrevrange', *args[:3], withscores=withscores)
+                return [item for row in rows for item in row] if withscores else rows
+            if name == 'hmget':
+                return self.redis._execute('hmget', args[0], args[1:])
+            if name in ('hset', 'hmset'):
+                mapping = dict(zip(args[1::2], args[2::2]))
+                result = self.redis._execute('hset', args[0], mapping=mapping)
+                return True if name == 'hmset' else result
+            if not hasattr(FakeRedis, f'_cmd_{name}'):
+                return _RespError(f"unknown command '{name}'")
+            return self.redis._execute(name, *args)
+        except Exception as e:
+            return _RespError(str(e))
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 6399):
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6399)
+    options = parser.parse_args()
+    print(f"Fake Redis listening on {options.host}:{options.port}")
+    asyncio.run(RespServer().serve(options.host, options.port))
@@ -0,0 +1,114 @@
+"""Pre-encoded pieces of the full game state sent to legacy clients.
+
+``game_started`` and ``game_state_update`` carry the whole ``game_state``,
+but between two of them only the round, the deadline and one player's
+score change. So the two costly parts are encoded once and reused:
+
+- a question, as clients see it (the game state never holds its answer).
+  Keyed by question id and level, and dropped when the question bank is
+  reloaded.
+- a player's entry, kept on the ``Player`` and re-encoded only when the
+  entry's score, level or name differs from the one encoded
+
+Frames are put together from this JSON text. The small values that change
+every round are written directly rather than through the JSON backend,
+which costs more to call than they take to write. A frame is parsed again
+only for a client that wants another wire format.
+
+With orjson, one call encodes a whole state faster than Python can join
+cached pieces, so the cache is not used: the frame holds the message and
+is encoded in one go.
+"""
+from json.encoder import encode_basestring
+from typing import Dict, Optional, Tuple
+
+from models import Player
+from wire import JSON, Frame
+
+
+class FragmentCache:
+    def __init__(self, players: Dict[str, Player], question_bank, codec=JSON):
+        self.players = players  # The manager's players, whose entries are cached on them
+        self.question_bank = question_bank
+        self.encode = codec.encode  # Either JSON backend; the fragments are JSON text
+        self.assemble = codec.backend != 'orjson'  # Join JSON fragments, or encode whole messages
+        self.version = question_bank.version
+        self.questions: Dict[Tuple[int, int], str] = {}  # (question id, level) -> JSON
+        self.hits = 0
+        self.misses = 0
+
+    def question(self, question: Optional[dict]) -> str:
+        """JSON of a game's current question"""
+        if question is None:
+            return 'null'
+        if self.version != self.question_bank.version:
+            self.questions.clear()
+            self.version = self.question_bank.version
+        key = (question['id'], question['level'])
+        fragment = self.questions.get(key)
+        if fragment is None:
+            fragment = self.questions[key] = self.encode(question)
+            self.misses += 1
+        else:
+            self.hits += 1
+        return fragment
+
+    def player(self, entry: dict) -> str:
+        """JSON of one entry of ``game_state['players']``"""
+        player = self.players.get(entry['id'])
+        if player is None:
+            return self.encode(entry)
+        cached = player.fragment
+        if (cached is not None and cached[0] == entry['score'] and cached[1] == entry['level']
+                and cached[2] == entry['name']):
+            self.hits += 1
+            return cached[3]
+        text = self.encode(entry)
+        player.fragment = (entry['score'], entry['level'], entry['name'], text)
+        self.misses += 1
+        return text
+
+    def value(self, value) -> str:
+        """JSON of a small value: scalars are written here, anything else by the backend"""
+        kind = type(value)
+        if kind is str:
+            return encode_basestring(value)
+        if kind is int:
+            return str(value)
+        if kind is float:
+            return repr(value)
+        if value is None:
+            return 'null'
+        if kind is bool:
+            return 'true' if value else 'false'
+        if kind is dict:
+            return '{' + ','.join([f'{encode_basestring(key)}:{self.value(item)}' for key, item in value.items()]) + '}'
+        return self.encode(value)
+
+    def game_state(self, game_state: dict) -> str:
+        parts = []
+        for key, value in game_state.items():
+            if key == 'players':
+                text = '[' + ','.join([self.player(entry) for entry in value]) + ']'
+            elif key == 'current_question':
+                text = self.question(value)
+            else:
+                text = self.value(value)
+            parts.append(f'"{key}":{text}')
+        return '{' + ','.join(parts) + '}'
+
+    def frame(self, message_type: str, game_state: dict, **fields) -> Frame:
+        """A ``{"type", "game_state", **fields}`` frame, built from cached fragments unless orjson is faster"""
+        if not self.assemble:
+            return Frame({'type': message_type, 'game_state': game_state, **fields})
+        text = f'{{"type":"{message_type}","game_state":{self.game_state(game_state)}'
+        for key, value in fields.items():
+            text += f',"{key}":{self.value(value)}'
+        return Frame(text=text + '}')
+
+    def stats(self) -> dict:
+        return {
+            'questions': len(self.questions),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
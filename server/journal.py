@@ -0,0 +1,377 @@
+"""Local persistence: an append-only log plus periodic binary snapshots.
+
+``JournalStore`` is a drop-in for ``WriteBehindStore`` that needs no Redis.
+It marks and coalesces dirty rooms and players the same way. Each flush
+appends one record per entity to the current log file:
+
+- ``["r", code, [member, ...]]`` or ``["r", code, null]`` when the room is gone
+- ``["p", id, {field: value}]`` or ``["p", id, null]`` when the player is gone
+
+A record holds the entity's whole new state, not the change, so replaying
+one twice is harmless. Records are framed as ``<length><crc32><json>``, so a
+record torn by a crash is detected and the replay stops there.
+
+Once the log has grown by ``snapshot_bytes``, or ``snapshot_interval``
+seconds after a write, the store starts a new log file (generation N+1) and
+writes every room and player to ``snapshot.bin`` as of generation N. Logs up
+to N are then deleted. Startup maps the snapshot with ``mmap``, reads it in
+place and replays only the logs written after it. Restart time therefore
+depends on the number of live rooms and players plus at most about
+``snapshot_bytes`` of log, not on how long the server has been running.
+
+Log writes go to the OS on every flush, so they survive the process dying.
+They are only fsynced when a snapshot is taken and on shutdown.
+"""
+import array
+import asyncio
+import itertools
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from persistence import WriteBehindStore
+from wire import JSON
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT = 'snapshot.bin'
+SNAPSHOT_MAGIC = b'QUIZSNP1'
+LOG_PREFIX = 'log.'
+
+_FRAME = struct.Struct('<II')  # payload length, crc32 of the payload
+_HEADER = struct.Struct('<8sQIIII')  # magic, generation, players, rooms, strings, separator
+_CRC = struct.Struct('<I')
+
+
+def _log_name(generation: int) -> str:
+    return f'{LOG_PREFIX}{generation:08d}'
+
+
+def _separator(text: str) -> str:
+    """A character that does not occur in the text, preferring control characters"""
+    for code in itertools.chain(range(0, 32), range(0xE000, 0xF900)):
+        if chr(code) not in text:
+            return chr(code)
+    raise ValueError("no free separator character")
+
+
+def encode_snapshot(generation: int, rooms: Dict[str, List[str]], players: Dict[str, dict]) -> bytes:
+    """Header, a count per player and room, then every string in one UTF-8 block, and a crc32.
+
+    The counts are each player's number of fields, then each room's number
+    of members. The strings are each player's id and field names and values,
+    then each room's code and member ids, joined by a separator that occurs
+    in none of them, so the block is decoded and split in two calls.
+    """
+    counts, strings = [], []
+    for player_id, fields in players.items():
+        counts.append(len(fields))
+        strings.append(player_id)
+        for name, value in fields.items():
+            strings.append(name)
+            strings.append(value)
+    for room_code, members in rooms.items():
+        counts.append(len(members))
+        strings.append(room_code)
+        strings.extend(members)
+
+    separator = _separator(''.join(strings))
+    counts = array.array('I', counts)
+    if sys.byteorder == 'big':
+        counts.byteswap()  # Stored little-endian
+    out = bytearray(_HEADER.pack(SNAPSHOT_MAGIC, generation, len(players), len(rooms), len(strings), ord(separator)))
+    out += counts.tobytes()
+    out += separator.join(strings).encode('utf-8')
+    out += _CRC.pack(zlib.crc32(out))
+    return bytes(out)
+
+
+def decode_snapshot(buffer) -> Tuple[int, Dict[str, List[str]], Dict[str, dict]]:
+    """Read a snapshot from any buffer, such as an mmap of the file"""
+    size = len(buffer)
+    if size < _HEADER.size + _CRC.size:
+        raise ValueError("snapshot is truncated")
+    with memoryview(buffer) as view, view[:-_CRC.size] as body:
+        if zlib.crc32(body) != _CRC.unpack_from(buffer, size - _CRC.size)[0]:
+            raise ValueError("snapshot checksum mismatch")
+    magic, generation, player_count, room_count, string_count, separator = _HEADER.unpack_from(buffer, 0)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError("not a snapshot file")
+
+    pos = _HEADER.size + 4 * (player_count + room_count)
+    counts = array.array('I')
+    counts.frombytes(buffer[_HEADER.size:pos])
+    if sys.byteorder == 'big':
+        counts.byteswap()
+    strings = str(buffer[pos:size - _CRC.size], 'utf-8').split(chr(separator)) if string_count else []
+    if len(strings) != string_count:
+        raise ValueError("snapshot string count mismatch")
+
+    strings = iter(strings)
+    players = {}
+    for count in counts[:player_count]:
+        player_id = next(strings)
+        fields = itertools.islice(strings, 2 * count)
+        players[player_id] = dict(zip(fields, fields))
+    rooms = {}
+    for count in counts[player_count:]:
+        room_code = next(strings)
+        rooms[room_code] = list(itertools.islice(strings, count))
+    return generation, rooms, players
+
+
+def read_log(path: str) -> Iterable[list]:
+    """Records of a log file in order, stopping at the first torn or corrupt one"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    pos, end = 0, len(data)
+    while pos < end:
+        if end - pos < _FRAME.size:
+            logger.warning("Ignoring torn record at the end of %s", path)
+            return
+        length, crc = _FRAME.unpack_from(data, pos)
+        start = pos + _FRAME.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            logger.warning("Ignoring torn or corrupt record at offset %d of %s", pos, path)
+            return
+        yield JSON.decode(payload)
+        pos = start + length
+
+
+class JournalStore(WriteBehindStore):
+    target = 'the journal'
+
+    def __init__(self, directory: str, player_record, room_record,
+                 flush_interval: float = 0.05,
+                 max_batch: int = 500,
+                 snapshot_interval: float = 60.0,
+                 snapshot_bytes: int = 16 * 1024 * 1024):
+        super().__init__(None, player_record, room_record, flush_interval=flush_interval, max_batch=max_batch)
+        self.directory = directory
+        self.snapshot_interval = snapshot_interval  # Seconds after a write before a snapshot is taken
+        self.snapshot_bytes = snapshot_bytes  # Log bytes that trigger a snapshot straight away
+
+        # What the snapshot plus the logs hold, kept to write the next snapshot from
+        self.rooms: Dict[str, List[str]] = {}
+        self.player_fields: Dict[str, dict] = {}
+
+        self.generation = 0  # Generation of the log being appended to
+        self._log = None
+        self._recovered = False
+        self._unsnapshotted_since: Optional[float] = None  # Time of the first write since the last snapshot
+        self._snapshotting = False
+
+        self.log_bytes = 0  # Bytes appended since the last snapshot
+        self.snapshots = 0
+        self.snapshot_size = 0
+        self.last_snapshot_ms = 0.0
+        self.recovered_records = 0
+        self.recovery_ms = 0.0
+
+    def recover(self) -> Tuple[Dict[str, List[str]], Dict[str, dict]]:
+        """Load the snapshot and replay newer logs. Returns (room members, player fields)."""
+        start = time.perf_counter()
+        os.makedirs(self.directory, exist_ok=True)
+        rooms, players, generation = {}, {}, 0
+        path = os.path.join(self.directory, SNAPSHOT)
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            try:
+                with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                    generation, rooms, players = decode_snapshot(buffer)
+            except (OSError, ValueError) as e:
+                logger.error("Error reading journal snapshot %s, replaying logs only: %s", path, e)
+
+        replayed = 0
+        logs = self._log_generations()
+        for log_generation in logs:
+            if log_generation <= generation:
+                continue
+            for kind, key, value in read_log(os.path.join(self.directory, _log_name(log_generation))):
+                target = rooms if kind == 'r' else players
+                if value is None:
+                    target.pop(key, None)
+                else:
+                    target[key] = value
+                replayed += 1
+
+        self.rooms, self.player_fields = rooms, players
+        # Never append to an existing log: its tail may be torn
+        self.generation = max([generation, *logs]) + 1
+        self._recovered = True
+        if replayed:
+            # Fold the replayed logs into the next snapshot
+            self._unsnapshotted_since = time.monotonic()
+        self.recovered_records = replayed
+        self.recovery_ms = (time.perf_counter() - start) * 1000
+        logger.info("Recovered %d rooms and %d players from the journal (%d log records, %.1f ms)",
+                    len(rooms), len(players), replayed, self.recovery_ms)
+        return rooms, players
+
+    def _log_generations(self) -> List[int]:
+        generations = []
+        for name in os.listdir(self.directory):
+            if name.startswith(LOG_PREFIX) and name[len(LOG_PREFIX):].isdigit():
+                generations.append(int(name[len(LOG_PREFIX):]))
+        return sorted(generations)
+
+    def _open_log(self):
+        if not self._recovered:
+            # Writing before recovering would let the next snapshot drop what is on disk
+            self.recover()
+        self._log = open(os.path.join(self.directory, _log_name(self.generation)), 'ab')
+
+    def _detach_log(self):
+        """Stop appending to the current log. Returns its file for ``_sync_close``, or None."""
+        log, self._log = self._log, None
+        return log
+
+    @staticmethod
+    def _sync_close(log):
+        """fsync and close a detached log; blocking, so run in a worker thread"""
+        if log is not None:
+            os.fsync(log.fileno())
+            log.close()
+
+    def _abandon_log(self):
+        """Move on to a new log after a failed write, leaving any torn record behind"""
+        if self._log is not None:
+            try:
+                self._log.close()
+            except OSError:
+                pass
+            self._log = None
+        self.generation += 1
+
+    def _append(self, out: bytearray, kind: str, key: str, value):
+        payload = JSON.encode([kind, key, value]).encode('utf-8')
+        out += _FRAME.pack(len(payload), zlib.crc32(payload))
+        out += payload
+
+    async def _write(self, rooms: Iterable[str], players: Iterable[str]) -> int:
+        out = bytearray()
+        records = 0
+        room_updates, player_updates = {}, {}
+        for room_code in rooms:
+            members = self.room_record(room_code)
+            members = sorted(members) if members is not None else None
+            self._append(out, 'r', room_code, members)
+            room_updates[room_code] = members
+            records += 1
+        for player_id in players:
+            fields = self.player_record(player_id)
+            self._append(out, 'p', player_id, fields)
+            player_updates[player_id] = fields
+            records += 1
+
+        try:
+            if self._log is None:
+                self._open_log()
+            self._log.write(out)
+            self._log.flush()
+        except OSError:
+            self._abandon_log()
+            raise
+
+        # Only apply the batch once it is in the log
+        for target, updates in ((self.rooms, room_updates), (self.player_fields, player_updates)):
+            for key, value in updates.items():
+                if value is None:
+                    target.pop(key, None)
+                else:
+                    target[key] = value
+        self.log_bytes += len(out)
+        if self._unsnapshotted_since is None:
+            self._unsnapshotted_since = time.monotonic()
+        return records
+
+    def snapshot_due(self) -> bool:
+        if self._unsnapshotted_since is None or self._snapshotting:
+            return False
+        return (self.log_bytes >= self.snapshot_bytes
+                or time.monotonic() - self._unsnapshotted_since >= self.snapshot_interval)
+
+    async def flush(self) -> int:
+        written = await super().flush()
+        if self.snapshot_due():
+            try:
+                await self.snapshot()
+            except OSError as e:
+                logger.error("Error writing journal snapshot: %s", e)
+                self.errors += 1
+        return written
+
+    async def snapshot(self):
+        """Start a new log, then write everything up to the old one to the snapshot"""
+        if self._snapshotting:
+            return
+        self._snapshotting = True
+        start = time.perf_counter()
+        try:
+            # Rotating and copying happen without yielding, so the copy holds
+            # exactly what the closed logs hold. Values are replaced, never
+            # mutated, so shallow copies are enough.
+            covered = self.generation
+            log = self._detach_log()
+            self.generation += 1
+            rooms, players = dict(self.rooms), dict(self.player_fields)
+            self.log_bytes = 0
+            self._unsnapshotted_since = None
+
+            # The fsyncs block, so they run off the event loop
+            await asyncio.to_thread(self._sync_close, log)
+            self.snapshot_size = await asyncio.to_thread(self._write_snapshot, covered, rooms, players)
+        finally:
+            self._snapshotting = False
+        self.snapshots += 1
+        self.last_snapshot_ms = (time.perf_counter() - start) * 1000
+
+    def _write_snapshot(self, generation: int, rooms: dict, players: dict) -> int:
+        data = encode_snapshot(generation, rooms, players)
+        path = os.path.join(self.directory, SNAPSHOT)
+        temp = f'{path}.tmp'
+        with open(temp, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, path)
+        directory = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+        for log_generation in self._log_generations():
+            if log_generation <= generation:
+                os.remove(os.path.join(self.directory, _log_name(log_generation)))
+        return len(data)
+
+    async def stop(self):
+        """Flush, then leave a snapshot behind so the next start replays nothing"""
+        await super().stop()
+        if self._unsnapshotted_since is not None:
+            try:
+                await self.snapshot()
+            except OSError as e:
+                logger.error("Error writing journal snapshot: %s", e)
+                self.errors += 1
+        await asyncio.to_thread(self._sync_close, self._detach_log())
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            'backend': 'journal',
+            'generation': self.generation,
+            'rooms': len(self.rooms),
+            'players': len(self.player_fields),
+            'log_bytes': self.log_bytes,
+            'snapshots': self.snapshots,
+            'snapshot_bytes': self.snapshot_size,
+            'last_snapshot_ms': round(self.last_snapshot_ms, 3),
+            'recovered_records': self.recovered_records,
+            'recovery_ms': round(self.recovery_ms, 3),
+        }
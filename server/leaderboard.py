@@ -0,0 +1,213 @@
+"""Global leaderboard of points won across every room.
+
+Each correct ``submit_answer`` adds its points to the player's total.
+Totals are kept in an ordered structure, so a rank lookup or a top-K read
+costs O(log n + k) however many players there are:
+
+- ``RedisLeaderboard``: a sorted set (``leaderboard``) and a hash of display
+  names (``leaderboard:names``), shared by every worker. Increments are
+  buffered and written in one pipeline per flush, like the write-behind
+  store, so answering never waits on Redis.
+- ``MemoryLeaderboard``: a ``SortedList`` of ``(score, player_id)`` for a
+  single process.
+
+``ResponseCache`` keeps encoded HTTP responses for a short time. A page
+polling the leaderboard is then served from memory, and concurrent misses
+for the same key share one read.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from sortedcontainers import SortedList
+
+logger = logging.getLogger(__name__)
+
+LEADERBOARD_MEMORY = 'memory'
+LEADERBOARD_REDIS = 'redis'
+
+
+def _entry(rank: int, player_id: str, name: Optional[str], score: float) -> dict:
+    return {'rank': rank, 'id': player_id, 'name': name or 'Unknown Player', 'score': int(score)}
+
+
+class MemoryLeaderboard:
+    def __init__(self):
+        self.scores: Dict[str, int] = {}
+        self.names: Dict[str, str] = {}
+        self.order = SortedList()  # (score, player_id), lowest first
+        self.updates = 0
+
+    def add(self, player_id: str, name: Optional[str], points: int):
+        score = self.scores.get(player_id)
+        if score is not None:
+            self.order.remove((score, player_id))
+        score = self.scores[player_id] = (score or 0) + points
+        self.order.add((score, player_id))
+        if name:
+            self.names[player_id] = name
+        self.updates += 1
+
+    async def top(self, k: int) -> List[dict]:
+        entries = self.order[-k:] if k > 0 else []
+        return [_entry(rank, player_id, self.names.get(player_id), score)
+                for rank, (score, player_id) in enumerate(reversed(entries), 1)]
+
+    async def rank(self, player_id: str) -> Optional[dict]:
+        score = self.scores.get(player_id)
+        if score is None:
+            return None
+        rank = len(self.order) - self.order.index((score, player_id))
+        return _entry(rank, player_id, self.names.get(player_id), score)
+
+    def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def stats(self) -> dict:
+        return {'backend': LEADERBOARD_MEMORY, 'players': len(self.scores), 'updates': self.updates}
+
+
+class RedisLeaderboard:
+    def __init__(self, client, key: str = 'leaderboard', flush_interval: float = 0.05):
+        self.client = client
+        self.key = key
+        self.names_key = f'{key}:names'
+        self.flush_interval = flush_interval
+        self.pending: Dict[str, int] = {}  # player_id -> points not yet written
+        self.pending_names: Dict[str, str] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.updates = 0
+        self.flushes = 0
+        self.errors = 0
+
+    def add(self, player_id: str, name: Optional[str], points: int):
+        self.pending[player_id] = self.pending.get(player_id, 0) + points
+        if name:
+            self.pending_names[player_id] = name
+        self.updates += 1
+
+    async def flush(self):
+        if not self.pending and not self.pending_names:
+            return
+        pending, self.pending = self.pending, {}
+        names, self.pending_names = self.pending_names, {}
+        pipe = self.client.pipeline(transaction=False)
+        for player_id, points in pending.items():
+            pipe.zincrby(self.key, points, player_id)
+        if names:
+            pipe.hset(self.names_key, mapping=names)
+        try:
+            await pipe.execute()
+            self.flushes += 1
+        except Exception as e:
+            logger.error("Error flushing leaderboard to Redis: %s", e)
+            self.errors += 1
+            # Fold the batch back in with anything added since
+            for player_id, points in pending.items():
+                self.pending[player_id] = self.pending.get(player_id, 0) + points
+            self.pending_names = {**names, **self.pending_names}
+
+    async def top(self, k: int) -> List[dict]:
+        if k <= 0:
+            return []
+        rows = await self.client.zrevrange(self.key, 0, k - 1, withscores=True)
+        if not rows:
+            return []
+        names = await self.client.hmget(self.names_key, [member for member, _ in rows])
+        return [_entry(rank, member.decode('utf-8'), name.decode('utf-8') if name else None, score)
+                for rank, ((member, score), name) in enumerate(zip(rows, names), 1)]
+
+    async def rank(self, player_id: str) -> Optional[dict]:
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zrevrank(self.key, player_id)
+        pipe.zscore(self.key, player_id)
+        pipe.hget(self.names_key, player_id)
+        rank, score, name = await pipe.execute()
+        if rank is None:
+            return None
+        return _entry(rank + 1, player_id, name.decode('utf-8') if name else None, score)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            'backend': LEADERBOARD_REDIS,
+            'pending': len(self.pending),
+            'updates': self.updates,
+            'flushes': self.flushes,
+            'errors': self.errors,
+        }
+
+
+def create_leaderboard(backend: str, client, flush_interval: float = 0.05):
+    if backend == LEADERBOARD_REDIS:
+        return RedisLeaderboard(client, flush_interval=flush_interval)
+    if backend == LEADERBOARD_MEMORY:
+        return MemoryLeaderboard()
+    raise ValueError(f"Unknown leaderboard backend: {backend}")
+
+
+class ResponseCache:
+    """Encoded responses kept for ``ttl`` seconds, with one load in flight per key"""
+
+    def __init__(self, ttl: float = 2.0, max_entries: int = 10_000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: Dict[str, tuple] = {}  # key -> (expires_at, value)
+        self._loading: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str, load: Callable[[], Awaitable]):
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > now:
+            self.hits += 1
+            return entry[1]
+        loading = self._loading.get(key)
+        if loading is not None:
+            # Someone is already reading this key; wait for their result
+            self.hits += 1
+            return await asyncio.shield(loading)
+
+        self.misses += 1
+        loading = self._loading[key] = asyncio.get_running_loop().create_future()
+        try:
+            value = await load()
+        except Exception as e:
+            loading.set_exception(e)
+            loading.exception()  # Mark retrieved; the waiters re-raise it
+            raise
+        finally:
+            del self._loading[key]
+        if len(self._entries) >= self.max_entries:
+            self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+            if len(self._entries) >= self.max_entries:
+                self._entries.clear()
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        loading.set_result(value)
+        return value
+
+    def stats(self) -> dict:
+        return {'ttl': self.ttl, 'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
@@ -1,583 +1,1686 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, APIRouter
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
-from typing import Dict, List, Set, Optional
-import json
-import random
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from typing import Dict, List, Optional
+import logging
 import asyncio
-import string
-import redis
+import redis.asyncio as aioredis
 import os
+import socket
+import time
 from dotenv import load_dotenv
+from persistence import WriteBehindStore
+from journal import JournalStore
+from outbound import REPLACED_CLOSE_CODE, ClientChannel, OutboundMetrics
+from protocol import PROTOCOL_LEGACY, PROTOCOL_DELTA, SUPPORTED_PROTOCOLS, RoomSequencer
+from room_bus import RemoteChannel, create_room_bus
+from question_bank import QuestionBank
+from metrics import REGISTRY, COUNT_BUCKETS, SIZE_BUCKETS, InstrumentedRedis, LoopLagMonitor
+from dispatch import HandlerRegistry
+from wire import CODECS, Frame, decode_message, dumps
+from models import Player, Room
+from room_codes import RoomCodeAllocator, RoomCodesExhausted
+from timer_wheel import TimerWheel
+from room_updates import RoomUpdateScheduler
+from spectators import SpectatorHub
+from matchmaking import Matchmaker, Ticket
+from fragments import FragmentCache
+from admission import DEFAULT_RATE_LIMITS, AdmissionController, parse_limits
+from leaderboard import ResponseCache, create_leaderboard
+from actors import RoomActors
+from assets import StaticAssets
 
 # Load environment variables
 load_dotenv()
 
+# Per-event logging (room updates, ready toggles) is at DEBUG; set LOG_LEVEL=DEBUG to see it
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+logger = logging.getLogger(__name__)
+
+# Metrics served at /metrics
+REDIS_SECONDS = REGISTRY.histogram('quiz_redis_command_seconds', 'Redis command latency', ['command'])
+REDIS_ERRORS = REGISTRY.counter('quiz_redis_command_errors_total', 'Redis commands that raised', ['command'])
+HANDLER_SECONDS = REGISTRY.histogram('quiz_handler_seconds', 'Client message handler latency', ['type'])
+HANDLER_ERRORS = REGISTRY.counter('quiz_handler_errors_total', 'Client message handlers that raised', ['type'])
+BROADCAST_SECONDS = REGISTRY.histogram('quiz_broadcast_seconds', 'Time to build and enqueue a room broadcast', ['kind'])
+BROADCAST_BYTES = REGISTRY.histogram('quiz_broadcast_bytes', 'Size of a broadcast frame', ['kind'], buckets=SIZE_BUCKETS)
+BROADCAST_RECIPIENTS = REGISTRY.histogram('quiz_broadcast_recipients', 'Clients a broadcast was queued for', ['kind'], buckets=COUNT_BUCKETS)
+LOOP_LAG_SECONDS = REGISTRY.histogram('quiz_event_loop_lag_seconds', 'How late the event loop woke a sleeping task')
+LOOP_LAG = REGISTRY.gauge('quiz_event_loop_lag_last_seconds', 'Most recent event loop lag sample')
+LOOP_LAG_INTERVAL = float(os.getenv('LOOP_LAG_INTERVAL', '0.5'))  # seconds between lag samples
+QUESTION_TIMEOUTS = REGISTRY.counter('quiz_question_timeouts_total', 'Questions that ran out of time unanswered')
+ROOMS_CLOSED = REGISTRY.counter('quiz_rooms_closed_total', 'Rooms closed by the server', ['reason'])
+SESSIONS = REGISTRY.counter('quiz_sessions_total', 'Dropped connections by what became of the session', ['event'])
+MATCH_WAIT_SECONDS = REGISTRY.histogram('quiz_match_wait_seconds', 'Time matched players spent in the matchmaking queue',
+                                        buckets=(0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120))
+
 # Initialize Redis connection
 REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379')
-redis_client = redis.from_url(REDIS_URL)
+if REDIS_URL.startswith('memory://'):
+    # In-process stand-in, for local runs and benchmarks without a Redis server
+    from fake_redis import FakeRedis
+    redis_client = FakeRedis()
+else:
+    redis_client = aioredis.from_url(REDIS_URL)
+redis_client = InstrumentedRedis(redis_client, REDIS_SECONDS, REDIS_ERRORS)
+
+# Startup hydration: 'eager' loads every room, 'lazy' loads rooms on first use
+REDIS_HYDRATION = os.getenv('REDIS_HYDRATION', 'eager')
+REDIS_HYDRATION_BATCH = int(os.getenv('REDIS_HYDRATION_BATCH', '500'))
+
+# Write-behind persistence tuning
+REDIS_FLUSH_INTERVAL = float(os.getenv('REDIS_FLUSH_INTERVAL', '0.05'))  # seconds
+REDIS_FLUSH_BATCH = int(os.getenv('REDIS_FLUSH_BATCH', '500'))
+# Seconds until room and player keys that are not written again expire; 0 keeps them forever
+REDIS_KEY_TTL = int(os.getenv('REDIS_KEY_TTL', '86400'))
+
+# Where rooms and players are persisted: 'redis', or 'journal' for an append-only
+# log and snapshots on local disk that restart without Redis
+PERSISTENCE_BACKEND = os.getenv('PERSISTENCE_BACKEND', 'redis')
+JOURNAL_DIR = os.getenv('JOURNAL_DIR', 'journal')
+JOURNAL_SNAPSHOT_INTERVAL = float(os.getenv('JOURNAL_SNAPSHOT_INTERVAL', '60'))  # seconds
+JOURNAL_SNAPSHOT_BYTES = int(os.getenv('JOURNAL_SNAPSHOT_BYTES', str(16 * 1024 * 1024)))
+
+# Per-connection send queues
+SEND_QUEUE_SIZE = int(os.getenv('SEND_QUEUE_SIZE', '256'))
+SEND_OVERFLOW_POLICY = os.getenv('SEND_OVERFLOW_POLICY', 'drop_stale')  # or 'disconnect'
+
+# Seconds between flushes of coalesced room_update broadcasts; 0 sends each one at once
+ROOM_UPDATE_INTERVAL = float(os.getenv('ROOM_UPDATE_INTERVAL', '0.025'))
+
+# Seconds between spectator_update frames; the hub stretches it while fan-out is slow
+SPECTATOR_INTERVAL = float(os.getenv('SPECTATOR_INTERVAL', '0.2'))
+
+# Admission control: most concurrent connections (0 is no cap), messages per second and
+# burst per client across all types, per-type limits as "type=rate/burst,...", and seconds
+# of event-loop lag above which new sessions and non-game messages are shed (0 never sheds)
+MAX_CONNECTIONS = int(os.getenv('MAX_CONNECTIONS', '10000'))
+CLIENT_RATE_LIMIT = float(os.getenv('CLIENT_RATE_LIMIT', '20'))
+CLIENT_RATE_BURST = float(os.getenv('CLIENT_RATE_BURST', '40'))
+RATE_LIMITS = parse_limits(os.getenv('RATE_LIMITS', DEFAULT_RATE_LIMITS))
+SHED_LAG_THRESHOLD = float(os.getenv('SHED_LAG_THRESHOLD', '0.2'))
+
+# Delta frames kept per room for replay to clients that missed some
+DELTA_HISTORY = int(os.getenv('DELTA_HISTORY', '64'))
+
+# Room bus used to share rooms between workers: 'memory' (single process) or 'redis'
+ROOM_BUS = os.getenv('ROOM_BUS', 'memory')
+NODE_ID = os.getenv('NODE_ID') or f"{socket.gethostname()}-{os.getpid()}"
+# Seconds a room stays claimed by a node that stops refreshing its ownership, e.g. after a crash
+ROOM_OWNER_TTL = int(os.getenv('ROOM_OWNER_TTL', '30'))
+
+# How room commands run: 'direct' in the connection's own coroutine, or 'actor'
+# through an ordered per-room inbox so commands for one room never interleave
+ROOM_EXECUTION = os.getenv('ROOM_EXECUTION', 'direct')
+
+# Room codes: length, and seconds before a code from a closed room is handed out again
+ROOM_CODE_LENGTH = int(os.getenv('ROOM_CODE_LENGTH', '5'))
+ROOM_CODE_COOLDOWN = float(os.getenv('ROOM_CODE_COOLDOWN', '300'))
+ROOM_SIZE = 3  # Players a room holds
+
+# Matchmaking: seconds between matcher runs, seconds in the queue per extra level of
+# difference accepted, and the most levels apart players in one matched room may be
+MATCHMAKING_INTERVAL = float(os.getenv('MATCHMAKING_INTERVAL', '0.25'))
+MATCHMAKING_WIDEN_AFTER = float(os.getenv('MATCHMAKING_WIDEN_AFTER', '5'))
+MATCHMAKING_MAX_SPREAD = int(os.getenv('MATCHMAKING_MAX_SPREAD', '3'))
+
+# Server-driven rounds: seconds to answer a question, and seconds without a client
+# message before a room is closed; 0 disables either
+QUESTION_TIME_LIMIT = float(os.getenv('QUESTION_TIME_LIMIT', '30'))
+ROOM_IDLE_TIMEOUT = float(os.getenv('ROOM_IDLE_TIMEOUT', '600'))
+
+# Seconds a dropped player's session is kept for the client to reconnect and
+# resume; 0 tears the player down as soon as the socket closes
+RECONNECT_GRACE = float(os.getenv('RECONNECT_GRACE', '30'))
+
+# Global leaderboard: 'redis' (a sorted set shared by every worker) or 'memory' (this process only)
+LEADERBOARD = os.getenv('LEADERBOARD', 'redis')
+LEADERBOARD_CACHE_TTL = float(os.getenv('LEADERBOARD_CACHE_TTL', '2'))  # seconds HTTP responses are reused
+LEADERBOARD_MAX = 100  # Most entries one request can ask for
+
+# Question bank (JSONL or SQLite), checked for changes every QUESTIONS_RELOAD_INTERVAL seconds
+QUESTIONS_PATH = os.getenv('QUESTIONS_PATH', 'data/questions.jsonl')
+QUESTIONS_RELOAD_INTERVAL = float(os.getenv('QUESTIONS_RELOAD_INTERVAL', '5'))
+
+question_bank = QuestionBank(QUESTIONS_PATH)
+question_bank.load()
 
 app = FastAPI()
 router = APIRouter()
+handlers = HandlerRegistry()
 
-# Mount the static files directory
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Static files, held in memory with gzip variants and content-hashed names
+static_assets = StaticAssets("static")
+app.mount("/static", static_assets, name="static")
 
 # Store active connections and game states
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections = {}
-        self.game_rooms = {}
-        self.player_scores = {}
-        self.player_levels = {}
-        self.player_questions = {}
-        self.player_names = {}
-        self.room_players = {}
-        self.room_codes = set()
-        self.player_ready_states = {}  # Track ready states
-        self.active_games = {}
-        
-        # Load existing rooms from Redis
-        self._load_from_redis()
-        print("Initialized ConnectionManager with Redis")
+    def __init__(self, redis=None, persistence: str = PERSISTENCE_BACKEND, journal_dir: str = JOURNAL_DIR):
+        self.redis = redis or redis_client
+        self.persistence = persistence
+        self.players: Dict[str, Player] = {}  # Connected players, plus players restored from Redis
+        self.rooms: Dict[str, Room] = {}  # Loaded rooms
+        self.outbound_metrics = OutboundMetrics()
+        self.room_codes = set()  # Every known room code, loaded or not
+        self.remote_rooms = {}  # client_id -> node owning the room of a local client
+        self.unloaded_rooms = set()  # Room codes known from Redis but not loaded yet
+        self._loading_rooms = {}  # room_code -> in-flight lazy load
+        self.hydration_stats = {}
+        self.bus = create_room_bus(ROOM_BUS, self.redis, NODE_ID, ROOM_OWNER_TTL)
+        if persistence == 'journal':
+            self.store = JournalStore(
+                journal_dir,
+                player_record=self._player_record,
+                room_record=self._room_record,
+                flush_interval=REDIS_FLUSH_INTERVAL,
+                max_batch=REDIS_FLUSH_BATCH,
+                snapshot_interval=JOURNAL_SNAPSHOT_INTERVAL,
+                snapshot_bytes=JOURNAL_SNAPSHOT_BYTES,
+            )
+        elif persistence == 'redis':
+            self.store = WriteBehindStore(
+                self.redis,
+                player_record=self._player_record,
+                room_record=self._room_record,
+                flush_interval=REDIS_FLUSH_INTERVAL,
+                max_batch=REDIS_FLUSH_BATCH,
+                ttl=REDIS_KEY_TTL,
+            )
+        else:
+            raise ValueError(f"Unknown persistence backend: {persistence}")
+        self.room_code_allocator = RoomCodeAllocator(self.redis, ROOM_CODE_LENGTH, ROOM_CODE_COOLDOWN)
+        # Question deadlines and idle checks for every room share one timer task
+        self.timers = TimerWheel()
+        self.room_updates = RoomUpdateScheduler(self._send_room_update, ROOM_UPDATE_INTERVAL)
+        self.spectators = SpectatorHub(self._spectator_view, SPECTATOR_INTERVAL)
+        self.fragments = FragmentCache(self.players, question_bank)
+        self.matchmaker = Matchmaker(self.form_match, ROOM_SIZE, MATCHMAKING_INTERVAL,
+                                     MATCHMAKING_WIDEN_AFTER, MATCHMAKING_MAX_SPREAD)
+        self.leaderboard = create_leaderboard(LEADERBOARD, self.redis, REDIS_FLUSH_INTERVAL)
+        self.actors = RoomActors()
 
-    def _load_from_redis(self):
-        """Load existing game state from Redis"""
+    async def hydrate(self, mode: str = REDIS_HYDRATION):
+        """Load existing game state before accepting connections"""
+        start = time.perf_counter()
         try:
-            # Load room codes
-            room_codes = redis_client.smembers('room_codes')
-            self.room_codes = {code.decode('utf-8') for code in room_codes}
-            
-            # Load room players
-            for room_code in self.room_codes:
-                players = redis_client.smembers(f'room:{room_code}:players')
-                self.room_players[room_code] = {p.decode('utf-8') for p in players}
-                
-                # Load player data for this room
-                for player_id in self.room_players[room_code]:
-                    player_data = redis_client.hgetall(f'player:{player_id}')
-                    if player_data:
-                        self.player_names[player_id] = player_data.get(b'name', b'Unknown').decode('utf-8')
-                        self.player_scores[player_id] = int(player_data.get(b'score', b'0'))
-                        self.player_levels[player_id] = int(player_data.get(b'level', b'1'))
-                        self.player_ready_states[player_id] = player_data.get(b'ready', b'false').decode('utf-8') == 'true'
-            
-            print(f"Loaded {len(self.room_codes)} rooms from Redis")
+            if self.persistence == 'journal':
+                # Everything is read from local disk at once, so there is no lazy mode
+                mode = 'journal'
+                self._restore_rooms(*self.store.recover())
+                await self.bus.claim_rooms(list(self.rooms))
+            else:
+                # Load room codes
+                room_codes = set()
+                async for code in self.redis.sscan_iter('room_codes', count=REDIS_HYDRATION_BATCH):
+                    room_codes.add(code.decode('utf-8'))
+                self.room_codes = room_codes
+                self.unloaded_rooms = set(room_codes)
+
+                if mode == 'eager':
+                    await self._load_rooms(list(room_codes))
+
+            logger.info("Loaded %d rooms from %s (%s)", len(self.room_codes), self.store.target, mode)
         except Exception as e:
-            print(f"Error loading from Redis: {e}")
+            logger.error("Error loading from %s: %s", self.store.target, e)
             # Reset state if loading fails
             self.room_codes = set()
-            self.room_players = {}
+            self.rooms = {}
+            self.players = {}
+            self.unloaded_rooms = set()
+
+        self.hydration_stats = {
+            'mode': mode,
+            'rooms': len(self.room_codes),
+            'loaded_rooms': len(self.rooms),
+            'players': len(self.players),
+            'duration_ms': round((time.perf_counter() - start) * 1000, 3),
+        }
+
+    async def _load_rooms(self, room_codes: List[str]):
+        """Load room membership and player data with pipelined reads"""
+        for i in range(0, len(room_codes), REDIS_HYDRATION_BATCH):
+            # Only rooms this node owns are loaded. Another node serves the rest:
+            # a copy here would never see their traffic, go idle and close them
+            # under their owner. They stay unloaded until a join finds them free.
+            batch = await self.bus.claim_rooms(room_codes[i:i + REDIS_HYDRATION_BATCH])
+            if not batch:
+                continue
+            pipe = self.redis.pipeline(transaction=False)
+            for room_code in batch:
+                pipe.smembers(f'room:{room_code}:players')
+            memberships = await pipe.execute()
+
+            player_ids = [
+                [member.decode('utf-8') for member in members]
+                for members in memberships
+            ]
+            pipe = self.redis.pipeline(transaction=False)
+            for ids in player_ids:
+                for player_id in ids:
+                    pipe.hgetall(f'player:{player_id}')
+            player_data = iter(await pipe.execute())
+
+            for room_code, ids in zip(batch, player_ids):
+                if not ids:
+                    # Membership key expired: drop the code from Redis too
+                    self.room_codes.discard(room_code)
+                    self._delete_room_from_redis(room_code)
+                    self.bus.release_room(room_code)
+                    self.room_code_allocator.release(room_code)
+                    continue
+                members = {}
+                for player_id in ids:
+                    data = next(player_data)
+                    player = self.players.get(player_id)
+                    if player is None:
+                        player = Player.from_record(player_id, data) if data else Player(player_id)
+                        self.players[player_id] = player
+                    elif player.room is not None:
+                        # Live here and already in another room: it left this one
+                        continue
+                    members[player_id] = player
+                if not members:
+                    self.room_codes.discard(room_code)
+                    self._delete_room_from_redis(room_code)
+                    self.bus.release_room(room_code)
+                    self.room_code_allocator.release(room_code)
+                    continue
+                room = self.rooms[room_code] = Room(room_code)
+                self._watch_idle(room)
+                for player_id, player in members.items():
+                    player.room = room_code
+                    room.players[player_id] = player
+                if len(members) < len(ids):
+                    self._save_room_to_redis(room_code)
+            self.unloaded_rooms.difference_update(batch)
+
+    def _restore_rooms(self, rooms: Dict[str, List[str]], players: Dict[str, dict]):
+        """Build rooms and players from the state recovered from the journal"""
+        for room_code, ids in rooms.items():
+            if not ids:
+                self._delete_room_from_redis(room_code)
+                self.room_code_allocator.release(room_code)
+                continue
+            self.room_codes.add(room_code)
+            room = self.rooms[room_code] = Room(room_code)
+            self._watch_idle(room)
+            for player_id in ids:
+                fields = players.get(player_id)
+                player = Player.from_fields(player_id, fields) if fields else Player(player_id)
+                self.players[player_id] = player
+                player.room = room_code
+                room.players[player_id] = player
+        # Players who were in no room have nothing to come back to. Redis expires
+        # their keys; the journal has no TTL, so delete them rather than carry them
+        # into every snapshot from now on.
+        self.store.mark_players([player_id for player_id in players if player_id not in self.players])
+
+    async def ensure_room_loaded(self, room_code: str):
+        """Load a room from Redis the first time a client touches it (lazy hydration)"""
+        if room_code in self.unloaded_rooms:
+            self.unloaded_rooms.discard(room_code)
+            load = self._loading_rooms[room_code] = asyncio.ensure_future(self._load_rooms([room_code]))
+            try:
+                await load
+            except Exception as e:
+                logger.error("Error loading room %s from Redis: %s", room_code, e)
+            finally:
+                self._loading_rooms.pop(room_code, None)
+            if room_code in self.room_codes and room_code not in self.rooms:
+                # Failed, or another node owns it: try again on the next join
+                self.unloaded_rooms.add(room_code)
+        elif room_code in self._loading_rooms:
+            try:
+                await asyncio.shield(self._loading_rooms[room_code])
+            except Exception:
+                pass  # Reported by the caller that started the load
+
+    def _room_record(self, room_code: str):
+        """Current membership of a room as persisted to Redis, or None if it is gone"""
+        room = self.rooms.get(room_code)
+        return set(room.players) if room is not None else None
+
+    def _player_record(self, player_id: str):
+        """Current hash fields of a player as persisted to Redis, or None if it is gone"""
+        player = self.players.get(player_id)
+        return player.record() if player is not None else None
 
     def _save_room_to_redis(self, room_code: str):
-        """Save room data to Redis"""
-        try:
-            # Save room code
-            redis_client.sadd('room_codes', room_code)
-            
-            # Save room players
-            if room_code in self.room_players:
-                redis_client.delete(f'room:{room_code}:players')  # Clear existing players
-                if self.room_players[room_code]:
-                    redis_client.sadd(f'room:{room_code}:players', *self.room_players[room_code])
-        except Exception as e:
-            print(f"Error saving room to Redis: {e}")
+        """Queue room data for the next Redis flush"""
+        self.store.mark_room(room_code)
 
     def _save_player_to_redis(self, player_id: str):
-        """Save player data to Redis"""
-        try:
-            player_data = {
-                'name': self.player_names.get(player_id, 'Unknown'),
-                'score': str(self.player_scores.get(player_id, 0)),
-                'level': str(self.player_levels.get(player_id, 1)),
-                'ready': str(self.player_ready_states.get(player_id, False)).lower()
-            }
-            redis_client.hmset(f'player:{player_id}', player_data)
-        except Exception as e:
-            print(f"Error saving player to Redis: {e}")
+        """Queue player data for the next Redis flush"""
+        self.store.mark_player(player_id)
 
     def _delete_room_from_redis(self, room_code: str):
-        """Delete room data from Redis"""
+        """Queue deletion of room data from Redis"""
+        self.store.mark_room(room_code)
+        # Player hashes follow their in-memory state, which is removed once they leave
+        if room_code in self.rooms:
+            self.store.mark_players(self.rooms[room_code].players)
+
+    def get_player_room(self, client_id: str) -> Optional[str]:
+        """Return the code of the room a client is in, or None"""
+        player = self.players.get(client_id)
+        return player.room if player is not None else None
+
+    def add_player_to_room(self, client_id: str, room_code: str):
+        """Add a client to a room, creating the room if it is new"""
+        player = self.players[client_id]
+        if player.room is not None and player.room != room_code:
+            self.depart(client_id)
+            player.ready = False
+        if player.spectating is not None:
+            self.stop_spectating(client_id)
+        self.matchmaker.cancel(client_id)
+        room = self.rooms.get(room_code)
+        if room is None:
+            room = self.rooms[room_code] = Room(room_code)
+            self._watch_idle(room)
+        if room.game and client_id not in room.players:
+            room.game['players'].append(self.game_entry(player))
+        room.players[client_id] = player
+        player.room = room_code
+
+    def remove_player_from_room(self, client_id: str, room_id: str = None) -> Optional[str]:
+        """Remove a client from its room, deleting the room if it is now empty.
+
+        ``room_id`` names the room instead, for a removal queued on a room's
+        actor that runs after the client has moved on to another room, or
+        has gone altogether.
+
+        Returns the room code if the room still has players, otherwise None.
+        """
+        player = self.players.get(client_id)
+        if room_id is None:
+            if player is None or player.room is None:
+                return None
+            room_id = player.room
+        if player is not None and player.room == room_id:
+            player.room = None
+            player.ready = False
+        room = self.rooms.get(room_id)
+        if room is None or client_id not in room.players:
+            return None
+
+        del room.players[client_id]
+        if room.players:
+            if room.game:
+                room.game['players'] = [entry for entry in room.game['players'] if entry['id'] != client_id]
+            self._save_room_to_redis(room_id)
+            return room_id
+
+        # Room is empty, remove it
+        room.cancel_timers()
+        self._close_audience(room_id, "empty")
+        self._delete_room_from_redis(room_id)
+        del self.rooms[room_id]
+        self.room_codes.discard(room_id)
+        self.bus.release_room(room_id)
+        self.room_code_allocator.release(room_id)
+        return None
+
+    def in_room(self, room_code: Optional[str], func, *args):
+        """Run ``func(*args)`` as a command of a room: queued on its actor in actor mode, otherwise now"""
+        if ROOM_EXECUTION == "actor" and room_code is not None:
+            self.actors.post(room_code, func, *args)
+            return None
+        return func(*args)
+
+    def touch_room(self, client_id: str):
+        """Record client activity in the client's room, which keeps it from expiring"""
+        player = self.players.get(client_id)
+        room = self.rooms.get(player.room) if player is not None and player.room else None
+        if room is not None:
+            room.last_active = time.monotonic()
+
+    def _watch_idle(self, room: Room, delay: float = ROOM_IDLE_TIMEOUT):
+        if ROOM_IDLE_TIMEOUT > 0:
+            room.idle_timer = self.timers.schedule(delay, self.in_room, room.code, self._check_idle, room.code)
+
+    def _check_idle(self, room_code: str):
+        """Close a room that has had no client messages for ROOM_IDLE_TIMEOUT"""
+        room = self.rooms.get(room_code)
+        if room is None:
+            return
+        if not self.bus.owns(room_code):
+            # Another node took the room over and serves it: drop this stale
+            # copy, leaving its Redis keys to the owner
+            self.unload_room(room_code)
+            return
+        idle = time.monotonic() - room.last_active
+        if idle < ROOM_IDLE_TIMEOUT:
+            # Still in use: check again when it could next be idle, and
+            # rewrite its keys so their Redis TTL does not run out under it
+            self._watch_idle(room, ROOM_IDLE_TIMEOUT - idle)
+            self._save_room_to_redis(room_code)
+            self.store.mark_players(room.players)
+            return
+        self.close_room(room_code, "idle")
+
+    def unload_room(self, room_code: str):
+        """Forget a room's local copy without closing it or touching its Redis keys"""
+        room = self.rooms.pop(room_code)
+        room.cancel_timers()
+        self._close_audience(room_code, "moved")
+        for player in room.players.values():
+            if player.room == room_code:
+                player.room = None
+                player.ready = False
+            if player.channel is None and player.grace is None and self.players.get(player.id) is player:
+                del self.players[player.id]  # Restored from Redis and never reconnected
+        self.unloaded_rooms.add(room_code)
+
+    def close_room(self, room_code: str, reason: str):
+        """Remove every player from a room, which deletes it here and in Redis"""
+        room = self.rooms.get(room_code)
+        if room is None:
+            return
+        logger.info("Closing room %s: %s", room_code, reason)
+        ROOMS_CLOSED.labels(reason).inc()
+        self._close_audience(room_code, reason)
+        frame = Frame({"type": "room_closed", "room_code": room_code, "reason": reason})
+        for player in list(room.players.values()):
+            moved = player.room != room_code  # Moved to another room, whose actor has it now
+            self.remove_player_from_room(player.id, room_code)
+            if moved:
+                continue
+            if player.channel is not None:
+                player.channel.send(frame, "room_closed")
+            elif player.grace is None and self.players.get(player.id) is player:
+                # Restored from Redis and never reconnected
+                del self.players[player.id]
+                self._save_player_to_redis(player.id)
+
+    def leave_room(self, client_id: str, room_id: str = None):
+        """Take a client out of the room it plays in, or ``room_id``, telling the players left behind"""
+        room_id = self.remove_player_from_room(client_id, room_id)
+        if room_id:
+            update = self.room_updates.mark(room_id)
+            if update is not None:
+                asyncio.create_task(update)
+
+    def depart(self, client_id: str):
+        """Leave the room a client plays in as a command of that room.
+
+        Called from a command of another room (joining or spectating it), so
+        in actor mode the old room's side of the move waits its turn on the
+        old room's inbox rather than running in the middle of its commands.
+        """
+        room_id = self.get_player_room(client_id)
+        if room_id is not None:
+            self.in_room(room_id, self.leave_room, client_id, room_id)
+
+    def spectate(self, client_id: str, room_code: str):
+        """Make a client a spectator of a room, leaving any room it played in"""
+        player = self.players[client_id]
+        self.depart(client_id)
+        self.matchmaker.cancel(client_id)
+        if player.spectating is not None:
+            self.stop_spectating(client_id)
+        player.spectating = room_code
+        self.spectators.add(room_code, client_id, player.channel)
+
+    def stop_spectating(self, client_id: str):
+        player = self.players.get(client_id)
+        if player is not None and player.spectating is not None:
+            self.spectators.remove(player.spectating, client_id)
+            player.spectating = None
+
+    def _close_audience(self, room_code: str, reason: str):
+        if room_code not in self.spectators.audiences:
+            return
+        frame = Frame({"type": "room_closed", "room_code": room_code, "reason": reason})
+        for client_id in self.spectators.close_room(room_code, frame):
+            player = self.players.get(client_id)
+            if player is not None:
+                player.spectating = None
+
+    def _spectator_view(self, room_code: str) -> Optional[dict]:
+        """The spectator_update message for a room: the same view delta clients get"""
+        room = self.rooms.get(room_code)
+        if room is None:
+            return None
+        players, game = self._room_view(room)
+        return {
+            "type": "spectator_update",
+            "room_code": room_code,
+            "players": players,
+            "game": game,
+            "spectators": self.spectators.count(room_code)
+        }
+
+    def find_match(self, client_id: str) -> Ticket:
+        """Queue a client for matchmaking on its job title and level, leaving any room it is in"""
+        player = self.players[client_id]
+        self.leave_room(client_id)
+        self.stop_spectating(client_id)
+        job_title = player.job_title or question_bank.default_job_title
+        return self.matchmaker.enqueue(client_id, job_title, player.level)
+
+    async def form_match(self, tickets: List[Ticket]):
+        """Put a matched group in a new room and start its game"""
+        players = [self.players.get(ticket.player_id) for ticket in tickets]
         try:
-            redis_client.srem('room_codes', room_code)
-            redis_client.delete(f'room:{room_code}:players')
-            
-            # Clean up player data if this was their only room
-            if room_code in self.room_players:
-                for player_id in self.room_players[room_code]:
-                    # Check if player is in any other rooms
-                    in_other_rooms = False
-                    for other_room, players in self.room_players.items():
-                        if other_room != room_code and player_id in players:
-                            in_other_rooms = True
-                            break
-                    
-                    if not in_other_rooms:
-                        redis_client.delete(f'player:{player_id}')
-        except Exception as e:
-            print(f"Error deleting room from Redis: {e}")
+            room_code = await self.allocate_room_code()
+        except RoomCodesExhausted:
+            logger.warning("No room code for a matched group of %d, requeueing it", len(tickets))
+            for ticket in tickets:
+                self.matchmaker.requeue(ticket)
+            return
+
+        # Anyone who dropped, or found another room, while the code was allocated stays out
+        ready = [ticket for ticket, player in zip(tickets, players) if self._matchable(ticket, player)]
+        if len(ready) < 2:
+            for ticket in ready:
+                self.matchmaker.requeue(ticket)
+            self.bus.release_room(room_code)
+            self.room_code_allocator.release(room_code)
+            return
+
+        now = self.matchmaker.clock()
+        for ticket in ready:
+            MATCH_WAIT_SECONDS.observe(now - ticket.enqueued_at)
+        players = [self.players[ticket.player_id] for ticket in ready]
+        logger.debug("Matched %d players into room %s", len(players), room_code)
+        if ROOM_EXECUTION == "actor":
+            await self.actors.call(room_code, self._start_match, room_code, players)
+        else:
+            await self._start_match(room_code, players)
+
+    def _matchable(self, ticket: Ticket, player: Player) -> bool:
+        return (player is not None and self.players.get(ticket.player_id) is player and player.channel is not None
+                and player.room is None and player.spectating is None
+                and ticket.player_id not in self.matchmaker)
+
+    async def _start_match(self, room_code: str, players: List[Player]):
+        self.room_codes.add(room_code)
+        for player in players:
+            self.add_player_to_room(player.id, room_code)
+            player.ready = True
+        self._save_room_to_redis(room_code)
+
+        members = [{"id": player.id, "name": player.name or "Unknown Player", "level": player.level}
+                   for player in players]
+        frame = Frame({"type": "match_found", "room_code": room_code, "players": members})
+        for player in players:
+            player.channel.send(frame, "match_found")
+            if player.protocol == PROTOCOL_DELTA:
+                await self.send_room_sync(player.id)
+
+        game_state = self.start_game(room_code)
+        await self.broadcast_room_update(room_code)
+        await self.publish_room_state(room_code, self.fragments.frame("game_started", game_state),
+                                      kind="game_started")
 
-    async def connect(self, websocket: WebSocket, client_id: str):
+    async def allocate_room_code(self) -> str:
+        """A room code unique across all nodes, claimed for this one. Raises RoomCodesExhausted."""
+        # The allocator never repeats a code in use; the checks only matter for codes restored from Redis
+        while True:
+            room_code = await self.room_code_allocator.allocate()
+            if room_code not in self.room_codes and await self.bus.claim_room(room_code):
+                return room_code
+
+    async def connect(self, websocket: WebSocket, client_id: str, codec=CODECS["json"]) -> bool:
+        """Attach a new connection. Returns True if it resumes a suspended session."""
         await websocket.accept()
-        self.active_connections[client_id] = websocket
-        self.player_scores[client_id] = 0
-        self.player_levels[client_id] = 1
+        player = self.players.get(client_id)
+        if player is None:
+            player = self.players[client_id] = Player(client_id)
+        resumed = player.grace is not None or player.channel is not None
+        if player.grace is not None:
+            player.grace.cancel()
+            player.grace = None
+        if isinstance(player.channel, ClientChannel):
+            # A new socket for a session whose old one has not closed yet takes the
+            # session over; closing the old one also ends its receive loop
+            player.channel.close(REPLACED_CLOSE_CODE)
+        elif player.channel is not None:
+            player.channel.close()
+        player.channel = ClientChannel(
+            websocket,
+            client_id,
+            self.outbound_metrics,
+            max_queue=SEND_QUEUE_SIZE,
+            overflow_policy=SEND_OVERFLOW_POLICY,
+            codec=codec,
+        )
+        if resumed:
+            SESSIONS.labels("resumed").inc()
+            return True
+        player.score = 0
+        player.level = 1
         self._save_player_to_redis(client_id)
+        self.update_game_entry(player)
+        return False
+
+    def attach_remote(self, client_id: str, node_id: str, protocol: int = None):
+        """Register a client connected to another node whose room this node owns"""
+        player = self.players.get(client_id)
+        if player is None:
+            player = self.players[client_id] = Player(client_id)
+        if player.grace is not None:
+            player.grace.cancel()
+            player.grace = None
+        channel = player.channel
+        if not isinstance(channel, RemoteChannel) or channel.node_id != node_id:
+            player.channel = RemoteChannel(client_id, node_id, self.bus)
+        if protocol == PROTOCOL_DELTA:
+            player.protocol = protocol
+
+    def connection_lost(self, client_id: str, channel):
+        """A client's socket closed: suspend its session, or end it if resuming is off"""
+        player = self.players.get(client_id)
+        if player is None or player.channel is not channel:
+            return  # Already replaced by a newer connection
+        if RECONNECT_GRACE <= 0:
+            self.end_session(client_id)
+            return
+        owner = self.remote_rooms.get(client_id)
+        if owner is not None:
+            self.bus.post(owner, {"op": "suspend", "client_id": client_id})
+        self.suspend(client_id)
+
+    def suspend(self, client_id: str):
+        """Detach a player's connection but keep its room, score and Redis record for
+        RECONNECT_GRACE seconds. O(1): the room is not told and nothing is written."""
+        player = self.players.get(client_id)
+        if player is None or player.channel is None:
+            return
+        # A spectator has nothing to resume but the audience it has to rejoin, and a
+        # queued player would be matched into a room it is not there to play in
+        self.stop_spectating(client_id)
+        self.matchmaker.cancel(client_id)
+        player.channel.close()
+        player.channel = None
+        if player.grace is not None:
+            player.grace.cancel()
+        player.grace = self.timers.schedule(RECONNECT_GRACE, self._grace_expired, client_id)
+        SESSIONS.labels("suspended").inc()
+
+    def _grace_expired(self, client_id: str):
+        player = self.players.get(client_id)
+        if player is None or player.grace is None:
+            return None
+        return self.in_room(player.room, self._end_grace, client_id)
+
+    def _end_grace(self, client_id: str):
+        player = self.players.get(client_id)
+        if player is None or player.grace is None:
+            return  # Resumed while this was queued
+        SESSIONS.labels("expired").inc()
+        self.end_session(client_id)
+
+    def end_session(self, client_id: str):
+        """Tear a client down for good, here and on the node owning its room"""
+        owner = self.remote_rooms.pop(client_id, None)
+        if owner is not None:
+            self.bus.post(owner, {"op": "disconnect", "client_id": client_id})
+        self.disconnect(client_id)
 
     def disconnect(self, client_id: str):
-        if client_id in self.active_connections:
-            # Remove from rooms and clean up empty rooms
-            rooms_to_remove = []
-            for room_id, players in self.room_players.items():
-                if client_id in players:
-                    players.remove(client_id)
-                    if client_id in self.player_ready_states:
-                        del self.player_ready_states[client_id]
-                    # If room is empty, mark it for removal
-                    if not players:
-                        rooms_to_remove.append(room_id)
-                    else:
-                        self._save_room_to_redis(room_id)
-                        # Notify other players about disconnection
-                        asyncio.create_task(self.broadcast_room_update(room_id))
-            
-            # Remove empty rooms
-            for room_id in rooms_to_remove:
-                del self.room_players[room_id]
-                self.room_codes.remove(room_id)
-                self._delete_room_from_redis(room_id)
-            
-            # Clean up player data
-            del self.active_connections[client_id]
-            if client_id in self.player_scores:
-                del self.player_scores[client_id]
-            if client_id in self.player_levels:
-                del self.player_levels[client_id]
-            if client_id in self.player_names:
-                del self.player_names[client_id]
-            redis_client.delete(f'player:{client_id}')
-
-    async def broadcast(self, message: str, room_id: str):
-        if room_id in self.room_players:
-            for client_id in self.room_players[room_id]:
-                if client_id in self.active_connections:
-                    await self.active_connections[client_id].send_text(message)
+        player = self.players.get(client_id)
+        if player is not None and (player.channel is not None or player.grace is not None):
+            if player.grace is not None:
+                player.grace.cancel()
+                player.grace = None
+            self.stop_spectating(client_id)
+            self.matchmaker.cancel(client_id)
+
+            # Remove from room and clean up if it is now empty
+            room_id = self.remove_player_from_room(client_id)
+            if room_id:
+                # Notify other players about disconnection
+                update = self.room_updates.mark(room_id)
+                if update is not None:
+                    asyncio.create_task(update)
+
+            # Dropping the record drops all of the player's state
+            if player.channel is not None:
+                player.channel.close()
+            del self.players[client_id]
+            self._save_player_to_redis(client_id)
+
+    async def resume_session(self, client_id: str, since: int = None):
+        """Catch a reattached client up: missed deltas for protocol 2, the current state otherwise"""
+        owner = self.remote_rooms.get(client_id)
+        player = self.players.get(client_id)
+        if owner is not None:
+            # The room lives on another node, which sends the catch-up
+            self.bus.post(owner, {"op": "resume", "client_id": client_id, "since": since,
+                                  "origin": self.bus.node_id, "protocol": player.protocol})
+            return
+        if player is None or player.channel is None:
+            return
+
+        room = self.rooms.get(player.room) if player.room else None
+        await self.send_personal_message(client_id, {
+            "type": "resumed",
+            "room_code": room.code if room is not None else None,
+            "protocol": player.protocol,
+            "score": player.score,
+            "level": player.level
+        })
+        if room is None:
+            return
+        if player.protocol == PROTOCOL_DELTA:
+            await self.send_room_sync(client_id, since)
+        else:
+            player.channel.send(self._room_update_frame(room), "room_update")
+            if room.game:
+                player.channel.send(self.fragments.frame("game_state_update", room.game),
+                                    "game_state_update")
+
+    def channels(self):
+        """Channels of every connected player"""
+        return [player.channel for player in self.players.values() if player.channel is not None]
+
+    async def send_personal_message(self, client_id: str, message: dict):
+        """Queue a message for a single client"""
+        player = self.players.get(client_id)
+        if player is not None and player.channel is not None:
+            player.channel.send(Frame(message), message.get("type"))
+
+    async def broadcast(self, message, room_id: str, kind: str = None):
+        """Queue a message (a Frame or JSON text) for every player in a room; never waits on a socket"""
+        room = self.rooms.get(room_id)
+        if room is not None:
+            start = time.perf_counter()
+            if isinstance(message, str):
+                message = Frame(text=message)
+            recipients = 0
+            for player in room.players.values():
+                if player.channel is not None:
+                    player.channel.send(message, kind)
+                    recipients += 1
+            label = kind or "message"
+            BROADCAST_BYTES.labels(label).observe(message.size)
+            BROADCAST_RECIPIENTS.labels(label).observe(recipients)
+            BROADCAST_SECONDS.labels(label).observe(time.perf_counter() - start)
+
+    def outbound_stats(self) -> dict:
+        depths = [channel.depth for channel in self.channels()]
+        metrics = self.outbound_metrics
+        return {
+            'connections': len(depths),
+            'queued_frames': sum(depths),
+            'max_queue_depth': max(depths, default=0),
+            'peak_queue_depth': metrics.max_depth,
+            'enqueued': metrics.enqueued,
+            'sent': metrics.sent,
+            'dropped': metrics.dropped,
+            'slow_disconnects': metrics.slow_disconnects,
+        }
+
+    def _room_update_frame(self, room: Room) -> Frame:
+        room_creator = room.creator
+        player_info = [
+            {
+                "id": player.id,
+                "name": player.name or "Unknown Player",
+                "score": player.score,
+                "ready": player.ready,
+                "isCreator": player.id == room_creator
+            }
+            for player in room.present_players()
+        ]
+        return Frame({
+            "type": "room_update",
+            "players": player_info
+        })
 
     async def broadcast_room_update(self, room_id: str):
-        if room_id in self.room_players:
+        """Send a room's player list, coalesced with other changes in the same tick"""
+        update = self.room_updates.mark(room_id)
+        if update is not None:
+            await update
+
+    async def _send_room_update(self, room_id: str):
+        room = self.rooms.get(room_id)
+        if room is not None:
             try:
-                # Get all active players in the room
-                active_players = [client_id for client_id in self.room_players[room_id] if client_id in self.active_connections]
-                
-                # Get the room creator (first player)
-                room_creator = list(self.room_players[room_id])[0] if self.room_players[room_id] else None
-                
-                # Create player info list
-                player_info = []
-                for client_id in active_players:
-                    is_creator = client_id == room_creator
-                    ready_state = self.player_ready_states.get(client_id, False)
-                    print(f"Player {client_id} - Creator: {is_creator}, Ready: {ready_state}")
-                    player_info.append({
-                        "id": client_id,
-                        "name": self.player_names.get(client_id, "Unknown Player"),
-                        "score": self.player_scores.get(client_id, 0),
-                        "ready": ready_state,
-                        "isCreator": is_creator
-                    })
-                
                 # Send update to all players
-                message = json.dumps({
-                    "type": "room_update",
-                    "players": player_info
-                })
-                print(f"Broadcasting room update: {message}")
-                await self.broadcast(message, room_id)
+                frame = self._room_update_frame(room)
+                logger.debug("Broadcasting room update to %s: %s", room_id, frame.message["players"])
+                await self.publish_room_state(room_id, frame, kind="room_update")
             except Exception as e:
-                print(f"Error in broadcast_room_update: {str(e)}")
+                logger.exception("Error sending room update for %s: %s", room_id, e)
+
+    def _room_view(self, room: Room):
+        """Room state as seen by delta protocol clients: (players by id, game)"""
+        room_creator = room.creator
+        players = {
+            player.id: {
+                "name": player.name or "Unknown Player",
+                "score": player.score,
+                "level": player.level,
+                "ready": player.ready,
+                "isCreator": player.id == room_creator
+            }
+            for player in room.present_players()
+        }
+
+        game = None
+        game_state = room.game
+        if game_state:
+            question = game_state['current_question']
+            game = {
+                "status": game_state['status'],
+                "current_round": game_state['current_round'],
+                "question_deadline": game_state['question_deadline'],
+                "current_question": {
+                    "id": question['id'],
+                    "question": question['question'],
+                    "options": question['options'],
+                    "level": question['level']
+                } if question else None
+            }
+        return players, game
+
+    def _protocol_split(self, room: Room):
+        """Split a room's connected players into legacy and delta protocol clients.
+
+        The third value is True if a delta client is suspended, in which case
+        delta frames must still be sequenced so it can replay them on resume.
+        """
+        legacy, delta = [], []
+        suspended = False
+        for player in room.players.values():
+            if player.channel is not None:
+                if player.protocol == PROTOCOL_DELTA:
+                    delta.append(player.channel)
+                else:
+                    legacy.append(player.channel)
+            elif player.grace is not None and player.protocol == PROTOCOL_DELTA:
+                suspended = True
+        return legacy, delta, suspended
+
+    async def publish_room_state(self, room_id: str, legacy_message: Frame = None, kind: str = None, extra: dict = None):
+        """Send a full-state frame to legacy clients and a delta frame to delta clients"""
+        room = self.rooms.get(room_id)
+        if room is None:
+            return
+        if kind != "room_update":
+            # Keep the order clients see changes in
+            await self.room_updates.flush_room(room_id)
+        start = time.perf_counter()
+        label = kind or "room_state"
+        legacy, delta, suspended = self._protocol_split(room)
+        recipients = 0
+        if legacy_message is not None and legacy:
+            for channel in legacy:
+                channel.send(legacy_message, kind)
+            recipients += len(legacy)
+            BROADCAST_BYTES.labels(label).observe(legacy_message.size)
+
+        if delta or suspended:
+            if room.sequencer is None:
+                room.sequencer = RoomSequencer(DELTA_HISTORY)
+            text = room.sequencer.next_frame(*self._room_view(room), extra=extra)
+            if text is not None:
+                frame = Frame(text=text)
+                for channel in delta:
+                    channel.send(frame, "delta")
+                recipients += len(delta)
+                BROADCAST_BYTES.labels("delta").observe(len(text))
+
+        BROADCAST_RECIPIENTS.labels(label).observe(recipients)
+        BROADCAST_SECONDS.labels(label).observe(time.perf_counter() - start)
+        self.spectators.mark(room_id)
+
+    async def send_room_sync(self, client_id: str, since: int = None):
+        """Bring a delta client up to date: replay missed frames or send a snapshot"""
+        player = self.players.get(client_id)
+        if player is None or player.channel is None or player.room not in self.rooms:
+            return
+
+        room = self.rooms[player.room]
+        if room.sequencer is None:
+            room.sequencer = RoomSequencer(DELTA_HISTORY)
+        frames = room.sequencer.frames_since(since) if since is not None else None
+        if frames is None:
+            player.channel.send(room.sequencer.snapshot(*self._room_view(room)), "snapshot")
+        else:
+            for frame in frames:
+                player.channel.send(frame, "delta")
 
     def start_game(self, room_id: str):
         """Initialize a new game session"""
-        if room_id not in self.room_players:
-            return None
-
-        players = list(self.room_players[room_id])
-        if len(players) < 2:
+        room = self.rooms.get(room_id)
+        if room is None or len(room.players) < 2:
             return None
 
         # Reset scores and levels for all players
-        for player_id in players:
-            self.player_scores[player_id] = 0
-            self.player_levels[player_id] = 1
+        players = list(room.players.values())
+        for player in players:
+            player.score = 0
+            player.level = 1
+        self.store.mark_players(room.players)
 
         # Initialize game state
         game_state = {
             'status': 'active',
             'current_round': 1,
-            'players': [
-                {
-                    'id': player_id,
-                    'name': self.player_names[player_id],
-                    'score': self.player_scores[player_id],
-                    'level': self.player_levels[player_id]
-                }
-                for player_id in players
-            ],
-            'current_question': self.get_next_question(players[0])  # Start with first player
+            'players': [self.game_entry(player) for player in players],
+            'current_question': None,
+            'question_deadline': None
         }
 
-        self.active_games[room_id] = game_state
+        room.game = game_state
+        self.set_question(room, self.get_next_question(players[0].id))  # Start with first player
+        self.schedule_deadline(room)
         return game_state
 
+    def game_entry(self, player: Player) -> dict:
+        """A player's entry in the ``players`` list of a game state"""
+        return {
+            'id': player.id,
+            'name': player.name,
+            'score': player.score,
+            'level': player.level
+        }
+
+    def update_game_entry(self, player: Player):
+        """Copy a player's name, score and level into its entry in its room's game state"""
+        room = self.rooms.get(player.room) if player.room else None
+        if room is None or not room.game:
+            return
+        for entry in room.game['players']:
+            if entry['id'] == player.id:
+                entry['name'] = player.name
+                entry['score'] = player.score
+                entry['level'] = player.level
+                return
+
+    def set_question(self, room: Room, question: Optional[dict]):
+        """Make ``question`` the current one of the room's game, keeping its answer off the game state"""
+        room.answer = question.pop('correct') if question else None
+        room.game['current_question'] = question
+
+    def schedule_deadline(self, room: Room):
+        """Start the clock on the room's current question, replacing any earlier deadline"""
+        if room.deadline is not None:
+            room.deadline.cancel()
+            room.deadline = None
+        game_state = room.game
+        game_state['question_deadline'] = None
+        if QUESTION_TIME_LIMIT > 0 and game_state['current_question']:
+            # Wall-clock time, so clients can show a countdown
+            game_state['question_deadline'] = round(time.time() + QUESTION_TIME_LIMIT, 3)
+            room.deadline = self.timers.schedule(
+                QUESTION_TIME_LIMIT, self.in_room, room.code,
+                self._question_expired, room.code, game_state['current_round'])
+
+    def advance_round(self, room: Room, player_id: str):
+        """Move the room's game on to a new question drawn for ``player_id``"""
+        game_state = room.game
+        self.set_question(room, self.get_next_question(player_id))
+        game_state['current_round'] += 1
+        self.schedule_deadline(room)
+
+    def _question_expired(self, room_code: str, round_number: int):
+        """Nobody answered in time: move on to the next question"""
+        room = self.rooms.get(room_code)
+        if room is None or not room.game or room.game['current_round'] != round_number:
+            return None
+        room.deadline = None
+        QUESTION_TIMEOUTS.inc()
+        self.advance_round(room, room.creator)
+        answer_result = {
+            "correct": False,
+            "player_id": None,
+            "timed_out": True
+        }
+        return self.publish_room_state(room_code, self.fragments.frame(
+            "game_state_update", room.game, answer_result=answer_result
+        ), kind="game_state_update", extra={"answer_result": answer_result})
+
+    def draw_question(self, player_id: str, job_title: str, level: int) -> Optional[dict]:
+        """Draw a question the player has not had yet from the (job_title, level) pool"""
+        player = self.players[player_id]
+        sampler = player.sampler
+        if sampler is None or sampler.key != (job_title, level, question_bank.version):
+            sampler = player.sampler = question_bank.sampler(job_title, level)
+        question_id = sampler.draw()
+        return question_bank.get(question_id) if question_id is not None else None
+
     def get_next_question(self, player_id: str):
         """Get the next question for a player"""
-        level = self.player_levels.get(player_id, 1)
-        job_titles = list(QUESTIONS.keys())
-        
-        if job_titles:
-            job_title = job_titles[0]  # For now, use the first job title
-            if job_title in QUESTIONS and level in QUESTIONS[job_title]:
-                questions = QUESTIONS[job_title][level]
-                if questions:
-                    # Pick a random question
-                    question = random.choice(questions)
-                    return {
-                        'question': question['question'],
-                        'options': question['options'],
-                        'correct': question['correct'],
-                        'level': level
-                    }
-        return None
+        player = self.players[player_id]
+        level = player.level
+        job_title = player.job_title or question_bank.default_job_title
+        if not question_bank.has_pool(job_title, level):
+            return None
+
+        question = self.draw_question(player_id, job_title, level)
+        if question is None:
+            # Pool exhausted: start a fresh pass so the game can go on
+            player.sampler = None
+            question = self.draw_question(player_id, job_title, level)
+        if question is None:
+            return None
+        return {
+            'id': question['id'],
+            'question': question['question'],
+            'options': question['options'],
+            'correct': question['correct'],
+            'level': level
+        }
 
 manager = ConnectionManager()
+leaderboard_cache = ResponseCache(LEADERBOARD_CACHE_TTL)
+loop_lag_monitor = LoopLagMonitor(LOOP_LAG_SECONDS, LOOP_LAG, LOOP_LAG_INTERVAL)
+admission = AdmissionController(MAX_CONNECTIONS, CLIENT_RATE_LIMIT, CLIENT_RATE_BURST, RATE_LIMITS,
+                                SHED_LAG_THRESHOLD, lag=lambda: loop_lag_monitor.last)
 
-# Sample questions database (you can expand this)
-QUESTIONS = {
-    "software_engineer": {
-        1: [  # Level 1
-            {"question": "What does EBITDA stand for?", "options": ["Earnings Before Interest, Taxes, Depreciation, and Amortization", "Earnings Before Income, Taxes, Depreciation, and Amortization", "Earnings Before Interest, Taxes, Dividends, and Amortization", "Earnings Before Income, Taxes, Dividends, and Amortization"], "correct": 0},
-            {"question": "Which of the following is a current asset?", "options": ["Long-term investments", "Accounts receivable", "Property, plant, and equipment", "Goodwill"], "correct": 1},
-            {"question": "What does the current ratio measure?", "options": ["A company's long-term debt obligations", "A company's ability to meet short-term liabilities with short-term assets", "A company's profitability over time", "A company's return on investment"], "correct": 1},
-            {"question": "Which of the following is a key component of shareholders' equity?", "options": ["Accounts payable", "Retained earnings", "Short-term debt", "Accrued expenses"], "correct": 1},
-            {"question": "What does a net profit margin of 2.74% indicate about a company?", "options": ["The company is highly leveraged", "The company is efficient in converting sales into profit", "The company has high operating expenses", "The company is not profitable"], "correct": 1},
-            {"question": "Which of the following is a non-current liability?", "options": ["Accounts payable", "Short-term debt", "Long-term debt", "Accrued expenses"], "correct": 2},
-            {"question": "What is the formula for Return on Assets (ROA)?", "options": ["Net Income / Total Assets", "Net Income / Revenue", "Total Assets / Net Income", "Revenue / Total Assets"], "correct": 0},
-            {"question": "Which of the following is NOT part of a balance sheet?", "options": ["Assets", "Liabilities", "Revenue", "Shareholders' equity"], "correct": 2},
-            {"question": "What is the primary purpose of horizontal analysis?", "options": ["To compare financial data across different companies", "To compare financial data across different time periods", "To calculate profitability ratios", "To assess a company's liquidity"], "correct": 1},
-            {"question": "Which of the following is an example of an intangible asset?", "options": ["Cash", "Inventory", "Patents", "Accounts receivable"], "correct": 2}
-        ],
-        2: [  # Level 2
-            {"question": "What is a closure in programming?", "options": ["A function with access to its outer scope", "A closed program", "A type of loop", "A database connection"], "correct": 0},
-            {"question": "What is the difference between == and === in JavaScript?", "options": ["No difference", "=== checks type and value", "== is faster", "=== is deprecated"], "correct": 1},
-            {"question": "What is a RESTful API?", "options": ["A sleeping API", "An architectural style for APIs", "A testing framework", "A database"], "correct": 1},
-            {"question": "What is dependency injection?", "options": ["A design pattern for handling dependencies", "A type of medication", "A database query", "A testing framework"], "correct": 0}
-        ]
-    },
-    "data_scientist": {
-        1: [  # Similar structure for data scientist questions
-            {"question": "What is pandas in Python?", "options": ["A data manipulation library", "An animal", "A game", "A database"], "correct": 0},
-            {"question": "What does SQL stand for?", "options": ["Some Query Language", "Structured Query Language", "Simple Query Language", "System Query Language"], "correct": 1},
-            {"question": "What is a dataset?", "options": ["A collection of data", "A computer program", "A type of chart", "A database server"], "correct": 0},
-            {"question": "What is correlation?", "options": ["Causation", "Statistical relationship between variables", "A programming language", "A type of graph"], "correct": 1}
-        ]
-    }
-}
+REGISTRY.gauge('quiz_connections', 'Clients connected to this node, plus remote clients in its rooms',
+               function=lambda: len(manager.channels()))
+REGISTRY.gauge('quiz_rooms', 'Rooms loaded on this node', function=lambda: len(manager.rooms))
+REGISTRY.gauge('quiz_active_games', 'Rooms with a game in progress',
+               function=lambda: sum(1 for room in manager.rooms.values() if room.game))
+REGISTRY.gauge('quiz_send_queue_frames', 'Frames waiting in per-connection send queues',
+               function=lambda: manager.outbound_stats()['queued_frames'])
+REGISTRY.counter('quiz_outbound_frames_total', 'Outbound frames by outcome', ['result'], function=lambda: {
+    ('enqueued',): manager.outbound_metrics.enqueued,
+    ('sent',): manager.outbound_metrics.sent,
+    ('dropped',): manager.outbound_metrics.dropped,
+})
+REGISTRY.counter('quiz_slow_disconnects_total', 'Clients disconnected for a full send queue',
+                 function=lambda: manager.outbound_metrics.slow_disconnects)
+REGISTRY.gauge('quiz_persistence_pending', 'Dirty records waiting for the next Redis flush', ['record'], function=lambda: {
+    ('player',): len(manager.store.dirty_players),
+    ('room',): len(manager.store.dirty_rooms),
+})
+REGISTRY.counter('quiz_persistence_errors_total', 'Failed write-behind flushes', function=lambda: manager.store.errors)
+REGISTRY.counter('quiz_room_updates_requested_total', 'room_update broadcasts requested by handlers',
+                 function=lambda: manager.room_updates.requested)
+REGISTRY.counter('quiz_room_updates_sent_total', 'room_update broadcasts sent after coalescing',
+                 function=lambda: manager.room_updates.sent)
+REGISTRY.gauge('quiz_room_update_coalescing_ratio', 'room_update requests per broadcast sent',
+               function=lambda: manager.room_updates.ratio)
+REGISTRY.counter('quiz_leaderboard_cache_total', 'Leaderboard HTTP requests by cache outcome', ['result'], function=lambda: {
+    ('hit',): leaderboard_cache.hits,
+    ('miss',): leaderboard_cache.misses,
+})
+REGISTRY.gauge('quiz_spectators', 'Connected spectators across every room',
+               function=lambda: manager.spectators.spectators)
+REGISTRY.counter('quiz_spectator_frames_total', 'spectator_update frames by what happened to them', ['result'], function=lambda: {
+    ('built',): manager.spectators.frames,
+    ('sent',): manager.spectators.sent,
+    ('skipped',): manager.spectators.skipped,
+})
+REGISTRY.gauge('quiz_matchmaking_queued', 'Players waiting in the matchmaking queue',
+               function=lambda: len(manager.matchmaker))
+REGISTRY.counter('quiz_matchmaking_rooms_total', 'Rooms formed by matchmaking',
+                 function=lambda: manager.matchmaker.rooms)
+REGISTRY.counter('quiz_connections_refused_total', 'WebSocket connections refused by admission control', ['reason'],
+                 function=lambda: {(reason,): count for reason, count in admission.refused.items()})
+REGISTRY.counter('quiz_messages_dropped_total', 'Client messages dropped before their handler', ['reason'],
+                 function=lambda: {(reason,): count for reason, count in admission.dropped.items()})
+REGISTRY.counter('quiz_messages_throttled_total', 'Client frames read late because the client was over its rate',
+                 function=lambda: admission.throttled)
+REGISTRY.gauge('quiz_load_shedding', '1 while event-loop lag has new sessions and non-game messages shed',
+               function=lambda: int(admission.shedding))
+REGISTRY.gauge('quiz_room_actors_active', 'Room actors with commands queued or running',
+               function=lambda: len(manager.actors.actors))
+REGISTRY.counter('quiz_room_actor_commands_total', 'Commands run by room actors',
+                 function=lambda: manager.actors.processed)
+REGISTRY.gauge('quiz_timers_pending', 'Question deadlines and idle checks waiting to fire',
+               function=lambda: manager.timers.pending)
+
+@app.on_event("startup")
+async def start_background_tasks():
+    await manager.hydrate()
+    await manager.room_code_allocator.load()
+    manager.store.start()
+    manager.timers.start()
+    manager.room_updates.start()
+    manager.spectators.start()
+    manager.matchmaker.start()
+    manager.leaderboard.start()
+    await manager.bus.start(handle_bus_envelope)
+    loop_lag_monitor.start()
+    if QUESTIONS_RELOAD_INTERVAL > 0:
+        app.state.question_watcher = asyncio.create_task(question_bank.watch(QUESTIONS_RELOAD_INTERVAL))
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    if getattr(app.state, "question_watcher", None):
+        app.state.question_watcher.cancel()
+    await loop_lag_monitor.stop()
+    await manager.timers.stop()
+    await manager.actors.drain()
+    await manager.room_updates.stop()
+    await manager.spectators.stop()
+    await manager.matchmaker.stop()
+    await manager.leaderboard.stop()
+    await manager.bus.stop()
+    await manager.store.stop()
 
 @app.get("/")
 async def get():
     return JSONResponse(content={"message": "Career Quiz Game Server"})
 
-@app.websocket("/ws/{client_id}")
-async def websocket_endpoint(websocket: WebSocket, client_id: str):
-    await manager.connect(websocket, client_id)
+@app.get("/stats")
+async def stats():
+    return JSONResponse(content={
+        "persistence": manager.store.stats(),
+        "outbound": manager.outbound_stats(),
+        "bus": manager.bus.stats(),
+        "hydration": manager.hydration_stats,
+        "room_codes": manager.room_code_allocator.stats(),
+        "timers": manager.timers.stats(),
+        "room_updates": manager.room_updates.stats(),
+        "leaderboard": {**manager.leaderboard.stats(), "cache": leaderboard_cache.stats()},
+        "actors": {"mode": ROOM_EXECUTION, **manager.actors.stats()},
+        "spectators": manager.spectators.stats(),
+        "matchmaking": manager.matchmaker.stats(),
+        "fragments": manager.fragments.stats(),
+        "admission": admission.stats(),
+        "static": static_assets.stats(),
+    })
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+def _cached_json(body: bytes) -> Response:
+    return Response(content=body, media_type="application/json",
+                    headers={"Cache-Control": f"public, max-age={int(LEADERBOARD_CACHE_TTL)}"})
+
+@app.get("/leaderboard")
+async def leaderboard(limit: int = 10):
+    """Top players by points won across all rooms"""
+    limit = max(1, min(limit, LEADERBOARD_MAX))
+
+    async def load():
+        players = await manager.leaderboard.top(limit)
+        return dumps({"players": players}).encode('utf-8')
+
+    return _cached_json(await leaderboard_cache.get(f"top:{limit}", load))
+
+@app.get("/leaderboard/{player_id}")
+async def leaderboard_rank(player_id: str):
+    """A player's rank and total points, or 404 if they have none yet"""
+    async def load():
+        entry = await manager.leaderboard.rank(player_id)
+        return dumps(entry).encode('utf-8') if entry is not None else None
+
+    body = await leaderboard_cache.get(f"rank:{player_id}", load)
+    if body is None:
+        return JSONResponse(status_code=404, content={"message": "Player has no score yet"})
+    return _cached_json(body)
+
+async def handle_message(client_id: str, message: dict):
+    """Run the handler for one client message on the node that owns the client's room"""
+    start = time.perf_counter()
+    handler = handlers.get(message.get("type"))
+    if handler is None:
+        HANDLER_SECONDS.labels("unknown").observe(time.perf_counter() - start)
+        return
+
     try:
-        while True:
-            data = await websocket.receive_text()
-            message = json.loads(data)
+        error = handler.schema.validate(message)
+        if error:
+            await manager.send_personal_message(client_id, {
+                "type": "error",
+                "message": error
+            })
+            return
+        await handler.func(client_id, message)
+        manager.touch_room(client_id)
+    except Exception:
+        HANDLER_ERRORS.labels(handler.message_type).inc()
+        raise
+    finally:
+        HANDLER_SECONDS.labels(handler.message_type).observe(time.perf_counter() - start)
 
-            if message["type"] == "create_room":
-                if "username" not in message:
-                    await websocket.send_json({
-                        "type": "error",
-                        "message": "Missing username in create room request"
-                    })
-                    continue
-                
-                # Generate a unique room code
-                while True:
-                    room_code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=5))
-                    if room_code not in manager.room_codes:
-                        break
-                
-                manager.room_codes.add(room_code)
-                manager.room_players[room_code] = set([client_id])
-                manager.player_names[client_id] = message["username"]
+@handlers.on("create_room", required={"username": str}, optional={"job_title": str},
+             error="Missing username in create room request")
+async def on_create_room(client_id: str, message: dict):
+    try:
+        room_code = await manager.allocate_room_code()
+    except RoomCodesExhausted:
+        await manager.send_personal_message(client_id, {
+            "type": "error",
+            "message": "No room codes available, try again later"
+        })
+        return
+    
+    manager.room_codes.add(room_code)
+    manager.add_player_to_room(client_id, room_code)
+    player = manager.players[client_id]
+    player.name = message["username"]
+    if message.get("job_title"):
+        player.job_title = message["job_title"]
+    
+    await manager.send_personal_message(client_id, {
+        "type": "room_created",
+        "room_code": room_code
+    })
+    
+    manager._save_room_to_redis(room_code)
+    
+    if player.protocol == PROTOCOL_DELTA:
+        await manager.send_room_sync(client_id)
+    await manager.broadcast_room_update(room_code)
+
+@handlers.on("join_room", required={"username": str, "room": str}, optional={"job_title": str},
+             error="Missing username or room in join request")
+async def on_join_room(client_id: str, message: dict):
+    room_id = message["room"]
+    username = message["username"]
+    await manager.ensure_room_loaded(room_id)
+    
+    # Check if room exists
+    room = manager.rooms.get(room_id)
+    if room is None:
+        await manager.send_personal_message(client_id, {
+            "type": "error",
+            "message": "Room does not exist"
+        })
+        return
+    
+    # Check room capacity
+    if len(room.players) >= ROOM_SIZE:
+        await manager.send_personal_message(client_id, {
+            "type": "error",
+            "message": "Room is full"
+        })
+        return
+
+    # Store player info
+    player = manager.players[client_id]
+    player.name = username
+    if message.get("job_title"):
+        player.job_title = message["job_title"]
+    manager.add_player_to_room(client_id, room_id)
+    
+    # Send room joined confirmation to the joining player
+    player_info = [
+        {
+            "id": member.id,
+            "name": member.name or "Unknown Player",
+            "score": member.score
+        }
+        for member in room.players.values()
+    ]
+    
+    await manager.send_personal_message(client_id, {
+        "type": "room_joined",
+        "room_code": room_id,
+        "players": player_info
+    })
+    
+    manager._save_room_to_redis(room_id)
+    
+    if player.protocol == PROTOCOL_DELTA:
+        await manager.send_room_sync(client_id)
+    
+    # Broadcast room update to all players
+    await manager.broadcast_room_update(room_id)
+
+@handlers.on("spectate_room", required={"room": str}, error="Missing room in spectate request")
+async def on_spectate_room(client_id: str, message: dict):
+    room_id = message["room"]
+    await manager.ensure_room_loaded(room_id)
+    if room_id not in manager.rooms:
+        await manager.send_personal_message(client_id, {
+            "type": "error",
+            "message": "Room does not exist"
+        })
+        return
+
+    await manager.send_personal_message(client_id, {
+        "type": "spectating",
+        "room_code": room_id
+    })
+    # Followed by the room's current spectator_update
+    manager.spectate(client_id, room_id)
+
+@handlers.on("find_match", required={"username": str}, optional={"job_title": str},
+             error="Missing username in find match request")
+async def on_find_match(client_id: str, message: dict):
+    player = manager.players[client_id]
+    player.name = message["username"]
+    if message.get("job_title"):
+        player.job_title = message["job_title"]
+    ticket = manager.find_match(client_id)
+    await manager.send_personal_message(client_id, {
+        "type": "matchmaking",
+        "status": "queued",
+        "job_title": ticket.job_title,
+        "level": ticket.level
+    })
+    # Followed by match_found and game_started once a room is formed
+
+@handlers.on("cancel_match")
+async def on_cancel_match(client_id: str, message: dict):
+    if manager.matchmaker.cancel(client_id):
+        await manager.send_personal_message(client_id, {
+            "type": "matchmaking",
+            "status": "cancelled"
+        })
+
+@handlers.on("toggle_ready")
+async def on_toggle_ready(client_id: str, message: dict):
+    try:
+        room_id = manager.get_player_room(client_id)
+        
+        if room_id:
+            # Only allow non-creator players to toggle ready state
+            if client_id != manager.rooms[room_id].creator:
+                player = manager.players[client_id]
+                player.ready = not player.ready
+                logger.debug("Player %s toggled ready state to: %s", client_id, player.ready)
                 
-                await websocket.send_json({
-                    "type": "room_created",
-                    "room_code": room_code
+                # Send immediate confirmation to the player
+                await manager.send_personal_message(client_id, {
+                    "type": "ready_state_updated",
+                    "ready": player.ready
                 })
                 
-                manager._save_room_to_redis(room_code)
-                
-                await manager.broadcast_room_update(room_code)
+                manager._save_player_to_redis(client_id)
                 
-            elif message["type"] == "join_room":
-                # Validate required fields for join_room
-                if "username" not in message or "room" not in message:
-                    await websocket.send_json({
-                        "type": "error",
-                        "message": "Missing username or room in join request"
-                    })
-                    continue
-                
-                room_id = message["room"]
-                username = message["username"]
-                
-                # Check if room exists
-                if room_id not in manager.room_players:
-                    await websocket.send_json({
-                        "type": "error",
-                        "message": "Room does not exist"
-                    })
-                    continue
+                # Then broadcast to all players
+                await manager.broadcast_room_update(room_id)
+    except Exception as e:
+        logger.exception("Error in toggle_ready: %s", e)
+        await manager.send_personal_message(client_id, {
+            "type": "error",
+            "message": "Failed to update ready state"
+        })
+
+@handlers.on("start_game")
+async def on_start_game(client_id: str, message: dict):
+    try:
+        room_id = manager.get_player_room(client_id)
+        
+        if room_id:
+            room = manager.rooms[room_id]
+            if client_id == room.creator:
+                # Check if all players are ready
+                all_ready = all(player.ready for player in room.players.values() if player.id != room.creator)
                 
-                # Check room capacity
-                if len(manager.room_players[room_id]) >= 3:
-                    await websocket.send_json({
+                if all_ready and len(room.players) > 1:
+                    # Initialize game state
+                    game_state = manager.start_game(room_id)
+                    if game_state:
+                        logger.debug("Starting game in room %s", room_id)
+                        # Notify all players
+                        await manager.publish_room_state(room_id, manager.fragments.frame(
+                            "game_started", game_state
+                        ), kind="game_started")
+                    else:
+                        await manager.send_personal_message(client_id, {
+                            "type": "error",
+                            "message": "Failed to initialize game state"
+                        })
+                else:
+                    await manager.send_personal_message(client_id, {
                         "type": "error",
-                        "message": "Room is full"
+                        "message": "Cannot start game: waiting for players to be ready"
                     })
-                    continue
+    except Exception as e:
+        logger.exception("Error in start_game: %s", e)
+        await manager.send_personal_message(client_id, {
+            "type": "error",
+            "message": "Failed to start game"
+        })
 
-                # Store player info
-                manager.player_names[client_id] = username
-                manager.room_players[room_id].add(client_id)
+@handlers.on("submit_answer", required={"answer_index": int})
+async def on_submit_answer(client_id: str, message: dict):
+    try:
+        room_id = manager.get_player_room(client_id)
+
+        room = manager.rooms.get(room_id) if room_id else None
+        if room is not None and room.game:
+            game_state = room.game
+            current_question = game_state['current_question']
+            
+            if current_question:
+                is_correct = message['answer_index'] == room.answer
                 
-                # Send room joined confirmation to the joining player
-                player_info = [
-                    {
-                        "id": player_id,
-                        "name": manager.player_names.get(player_id, "Unknown Player"),
-                        "score": manager.player_scores.get(player_id, 0)
-                    }
-                    for player_id in manager.room_players[room_id]
-                ]
+                # Update score
+                player = manager.players[client_id]
+                if is_correct:
+                    points = current_question['level'] * 10
+                    player.score += points
+                    manager._save_player_to_redis(client_id)
+                    manager.leaderboard.add(client_id, player.name, points)
+                    manager.update_game_entry(player)
                 
-                await websocket.send_json({
-                    "type": "room_joined",
-                    "room_code": room_id,
-                    "players": player_info
-                })
+                # Move on to the next question and restart the clock
+                manager.advance_round(room, client_id)
                 
-                manager._save_room_to_redis(room_id)
+                answer_result = {
+                    "correct": is_correct,
+                    "player_id": client_id
+                }
                 
-                # Broadcast room update to all players
-                await manager.broadcast_room_update(room_id)
+                # Broadcast updated game state, assembled from cached question and player JSON
+                await manager.publish_room_state(room_id, manager.fragments.frame(
+                    "game_state_update", game_state, answer_result=answer_result
+                ), kind="game_state_update", extra={"answer_result": answer_result})
+    except Exception as e:
+        logger.exception("Error processing answer: %s", e)
+        await manager.send_personal_message(client_id, {
+            "type": "error",
+            "message": "Failed to process answer"
+        })
 
-            elif message["type"] == "toggle_ready":
-                try:
-                    room_id = None
-                    # Find the room this player is in
-                    for rid, players in manager.room_players.items():
-                        if client_id in players:
-                            room_id = rid
-                            break
-                    
-                    if room_id:
-                        room_creator = list(manager.room_players[room_id])[0]
-                        # Only allow non-creator players to toggle ready state
-                        if client_id != room_creator:
-                            current_state = manager.player_ready_states.get(client_id, False)
-                            manager.player_ready_states[client_id] = not current_state
-                            print(f"Player {client_id} toggled ready state to: {manager.player_ready_states[client_id]}")
-                            
-                            # Send immediate confirmation to the player
-                            await websocket.send_json({
-                                "type": "ready_state_updated",
-                                "ready": manager.player_ready_states[client_id]
-                            })
-                            
-                            manager._save_player_to_redis(client_id)
-                            
-                            # Then broadcast to all players
-                            await manager.broadcast_room_update(room_id)
-                except Exception as e:
-                    print(f"Error in toggle_ready: {str(e)}")
-                    await websocket.send_json({
-                        "type": "error",
-                        "message": "Failed to update ready state"
-                    })
-                    
-            elif message["type"] == "start_game":
-                try:
-                    room_id = None
-                    # Find the room this player is in
-                    for rid, players in manager.room_players.items():
-                        if client_id in players:
-                            room_id = rid
-                            break
-                    
-                    if room_id:
-                        room_creator = list(manager.room_players[room_id])[0]
-                        if client_id == room_creator:
-                            # Check if all players are ready
-                            non_creator_players = [pid for pid in manager.room_players[room_id] if pid != room_creator]
-                            all_ready = all(manager.player_ready_states.get(pid, False) for pid in non_creator_players)
-                            
-                            if all_ready and len(manager.room_players[room_id]) > 1:
-                                # Initialize game state
-                                game_state = manager.start_game(room_id)
-                                if game_state:
-                                    print(f"Starting game in room {room_id}")
-                                    # Notify all players
-                                    await manager.broadcast(json.dumps({
-                                        "type": "game_started",
-                                        "game_state": game_state
-                                    }), room_id)
-                                else:
-                                    await websocket.send_json({
-                                        "type": "error",
-                                        "message": "Failed to initialize game state"
-                                    })
-                            else:
-                                await websocket.send_json({
-                                    "type": "error",
-                                    "message": "Cannot start game: waiting for players to be ready"
-                                })
-                except Exception as e:
-                    print(f"Error in start_game: {str(e)}")
-                    await websocket.send_json({
-                        "type": "error",
-                        "message": "Failed to start game"
-                    })
+@handlers.on("hello", optional={"protocol": int})
+async def on_hello(client_id: str, message: dict):
+    protocol = message.get("protocol", PROTOCOL_LEGACY)
+    if protocol not in SUPPORTED_PROTOCOLS:
+        await manager.send_personal_message(client_id, {
+            "type": "error",
+            "message": f"Unsupported protocol version: {protocol}"
+        })
+        return
+    
+    manager.players[client_id].protocol = protocol
+    
+    await manager.send_personal_message(client_id, {
+        "type": "hello",
+        "protocol": protocol
+    })
+    if protocol == PROTOCOL_DELTA:
+        await manager.send_room_sync(client_id)
 
-            elif message["type"] == "submit_answer":
-                try:
-                    room_id = None
-                    for rid, players in manager.room_players.items():
-                        if client_id in players:
-                            room_id = rid
-                            break
-
-                    if room_id and room_id in manager.active_games:
-                        game_state = manager.active_games[room_id]
-                        current_question = game_state['current_question']
-                        
-                        if current_question and 'answer_index' in message:
-                            is_correct = message['answer_index'] == current_question['correct']
-                            
-                            # Update score
-                            if is_correct:
-                                manager.player_scores[client_id] += current_question['level'] * 10
-                            
-                            # Get next question
-                            next_question = manager.get_next_question(client_id)
-                            
-                            # Update game state
-                            game_state['current_question'] = next_question
-                            game_state['players'] = [
-                                {
-                                    'id': pid,
-                                    'name': manager.player_names[pid],
-                                    'score': manager.player_scores[pid],
-                                    'level': manager.player_levels[pid]
-                                }
-                                for pid in manager.room_players[room_id]
-                            ]
-                            
-                            # Broadcast updated game state
-                            await manager.broadcast(json.dumps({
-                                "type": "game_state_update",
-                                "game_state": game_state,
-                                "answer_result": {
-                                    "correct": is_correct,
-                                    "player_id": client_id
-                                }
-                            }), room_id)
-                except Exception as e:
-                    print(f"Error processing answer: {str(e)}")
-                    await websocket.send_json({
-                        "type": "error",
-                        "message": "Failed to process answer"
-                    })
+@handlers.on("sync_request", optional={"since": int})
+async def on_sync_request(client_id: str, message: dict):
+    if manager.players[client_id].protocol != PROTOCOL_DELTA:
+        await manager.send_personal_message(client_id, {
+            "type": "error",
+            "message": "sync_request requires protocol 2"
+        })
+        return
+    
+    await manager.send_room_sync(client_id, message.get("since"))
 
-            elif message["type"] == "get_question":
-                job_title = message["job_title"]
-                level = manager.player_levels[client_id]
-                if job_title in QUESTIONS and level in QUESTIONS[job_title]:
-                    questions = QUESTIONS[job_title][level]
-                    if client_id not in manager.player_questions:
-                        manager.player_questions[client_id] = []
-                    
-                    available_questions = [q for q in questions if q not in manager.player_questions[client_id]]
-                    if available_questions:
-                        question = random.choice(available_questions)
-                        manager.player_questions[client_id].append(question)
-                        await websocket.send_json({
-                            "type": "question",
-                            "question": question["question"],
-                            "options": question["options"],
-                            "level": level
-                        })
-                    else:
-                        # Level completed
-                        manager.player_levels[client_id] += 1
-                        manager.player_questions[client_id] = []
-                        await websocket.send_json({
-                            "type": "level_complete",
-                            "level": level
-                        })
-            
-            elif message["type"] == "answer":
-                job_title = message["job_title"]
-                answer_idx = message["answer_idx"]
-                level = manager.player_levels[client_id]
-                
-                if client_id in manager.player_questions and manager.player_questions[client_id]:
-                    current_question = manager.player_questions[client_id][-1]
-                    is_correct = answer_idx == current_question["correct"]
-                    
-                    if is_correct:
-                        manager.player_scores[client_id] += 10
-                    
-                    await websocket.send_json({
-                        "type": "answer_result",
-                        "correct": is_correct,
-                        "correct_answer": current_question["correct"],
-                        "score": manager.player_scores[client_id]
-                    })
-                    
-                    # Broadcast updated scores to all players in the room
-                    for room_id, players in manager.room_players.items():
-                        if client_id in players:
-                            await manager.broadcast_room_update(room_id)
-                            break
-
-            elif message["type"] == "answer":
-                job_title = message["job_title"]
-                level = manager.player_levels[client_id]
-                question_idx = message["question_idx"]
-                answer_idx = message["answer_idx"]
-                
-                if job_title in QUESTIONS and level in QUESTIONS[job_title]:
-                    question = QUESTIONS[job_title][level][question_idx]
-                    is_correct = question["correct"] == answer_idx
-                    if is_correct:
-                        manager.player_scores[client_id] += level * 10
-                    
-                    await websocket.send_json({
-                        "type": "answer_result",
-                        "correct": is_correct,
-                        "score": manager.player_scores[client_id]
-                    })
+@handlers.on("get_question", required={"job_title": str})
+async def on_get_question(client_id: str, message: dict):
+    job_title = message["job_title"]
+    player = manager.players[client_id]
+    level = player.level
+    if question_bank.has_pool(job_title, level):
+        player.job_title = job_title
+        question = manager.draw_question(client_id, job_title, level)
+        if question:
+            player.current_question = question["id"]
+            await manager.send_personal_message(client_id, {
+                "type": "question",
+                "question": question["question"],
+                "options": question["options"],
+                "level": level
+            })
+        else:
+            # Level completed
+            player.level += 1
+            player.sampler = None
+            player.current_question = None
+            manager.update_game_entry(player)
+            await manager.send_personal_message(client_id, {
+                "type": "level_complete",
+                "level": level
+            })
+
+@handlers.on("answer", required={"job_title": str, "answer_idx": int})
+async def on_answer(client_id: str, message: dict):
+    answer_idx = message["answer_idx"]
+    player = manager.players[client_id]
+    
+    current_question = question_bank.get(player.current_question)
+    if current_question:
+        is_correct = answer_idx == current_question["correct"]
+        
+        if is_correct:
+            player.score += 10
+            manager._save_player_to_redis(client_id)
+            manager.update_game_entry(player)
+        
+        await manager.send_personal_message(client_id, {
+            "type": "answer_result",
+            "correct": is_correct,
+            "correct_answer": current_question["correct"],
+            "score": player.score
+        })
+        
+        # Broadcast updated scores to all players in the room
+        room_id = manager.get_player_room(client_id)
+        if room_id:
+            await manager.broadcast_room_update(room_id)
+
+async def route_message(client_id: str, message: dict):
+    """Handle a message locally, or forward it to the node that owns the client's room"""
+    message_type = message.get("type")
+    owner = manager.remote_rooms.get(client_id)
+
+    if owner is not None and message_type in ("create_room", "join_room", "spectate_room", "find_match"):
+        # Moving out of a room hosted on another node
+        manager.bus.post(owner, {"op": "disconnect", "client_id": client_id})
+        del manager.remote_rooms[client_id]
+        owner = None
+
+    if message_type in ("join_room", "spectate_room") and "room" in message:
+        room_owner = await manager.bus.room_owner(message["room"])
+        if room_owner is None and message["room"] in manager.room_codes:
+            # Room restored from Redis that no node has claimed yet. Claim it,
+            # or go to whichever node claimed it first.
+            if not await manager.bus.claim_room(message["room"]):
+                room_owner = await manager.bus.room_owner(message["room"])
+        if room_owner is not None and room_owner != manager.bus.node_id:
+            # Leave any room on this node before joining one elsewhere
+            manager.depart(client_id)
+            manager.stop_spectating(client_id)
+            manager.remote_rooms[client_id] = owner = room_owner
+
+    if owner is not None:
+        player = manager.players.get(client_id)
+        manager.bus.forward(owner, client_id, message, player.protocol if player is not None else None)
+        return
+
+    await run_message(client_id, message)
 
+async def run_message(client_id: str, message: dict):
+    """Handle a message on this node, through the room's actor in actor mode"""
+    if ROOM_EXECUTION == "actor":
+        # join_room and spectate_room act on the room named; anything else on the sender's room
+        room_id = message.get("room") if message.get("type") in ("join_room", "spectate_room") else None
+        room_id = room_id if isinstance(room_id, str) else manager.get_player_room(client_id)
+        if room_id is not None:
+            await manager.actors.call(room_id, handle_message, client_id, message)
+            return
+    await handle_message(client_id, message)
+
+async def handle_bus_envelope(envelope: dict):
+    """Handle an envelope sent to this node over the room bus"""
+    op = envelope.get("op")
+    client_id = envelope.get("client_id")
+    if op == "deliver":
+        player = manager.players.get(client_id)
+        if player is not None and player.channel is not None:
+            player.channel.send(envelope["frame"], envelope.get("kind"))
+    elif op == "command":
+        manager.attach_remote(client_id, envelope["origin"], envelope.get("protocol"))
+        await run_message(client_id, envelope["message"])
+    elif op == "disconnect":
+        manager.in_room(manager.get_player_room(client_id), manager.disconnect, client_id)
+    elif op == "suspend":
+        manager.in_room(manager.get_player_room(client_id), manager.suspend, client_id)
+    elif op == "resume":
+        manager.attach_remote(client_id, envelope["origin"], envelope.get("protocol"))
+        await manager.resume_session(client_id, envelope.get("since"))
+
+DROPPED_MESSAGES = {
+    "rate_limit": "Too many messages of this type, slow down",
+    "overload": "Server busy, try again later",
+}
+
+@app.websocket("/ws/{client_id}")
+async def websocket_endpoint(websocket: WebSocket, client_id: str, format: str = "json", since: int = None):
+    codec = CODECS.get(format)
+    if codec is None:
+        # Unsupported wire format. Closing before accept() would reach the
+        # client as an HTTP 403, so accept and close with the reason code.
+        await websocket.accept()
+        await websocket.close(code=1003)
+        return
+
+    # Only a suspended session resumes past the cap; a second socket for a live one is a new connection
+    player = manager.players.get(client_id)
+    resuming = player is not None and player.grace is not None
+    if admission.admit(resuming) is not None:
+        # Over the connection cap, or shedding load: ask the client to try again later
+        await websocket.accept()
+        await websocket.close(code=1013)
+        return
+
+    channel = None
+    try:
+        resumed = await manager.connect(websocket, client_id, codec)
+        player = manager.players[client_id]
+        channel = player.channel
+        if resumed:
+            # `since` is the last delta seq the client saw before the drop
+            await manager.resume_session(client_id, since)
+        while not channel.closed:
+            delay = admission.throttle(player)
+            if delay:
+                # Over its rate: leave the client's frames unread until a token is due
+                await asyncio.sleep(delay)
+            event = await websocket.receive()
+            if event["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(event.get("code", 1000))
+            if channel.closed:
+                # Taken over by a newer socket for this client, or cut loose as a slow
+                # consumer: nothing more from this socket is handled as the player
+                break
+            try:
+                message = decode_message(event.get("text"), event.get("bytes"), codec)
+            except ValueError as e:
+                logger.debug("Bad frame from %s: %s", client_id, e)
+                await manager.send_personal_message(client_id, {
+                    "type": "error",
+                    "message": "Malformed message"
+                })
+                continue
+            dropped = admission.check(player, message["type"])
+            if dropped is not None:
+                if dropped:
+                    await manager.send_personal_message(client_id, {
+                        "type": "error",
+                        "message": DROPPED_MESSAGES[dropped],
+                        "rejected": message["type"]
+                    })
+                continue
+            await route_message(client_id, message)
     except WebSocketDisconnect:
-        manager.disconnect(client_id)
-        for room in manager.game_rooms.values():
-            if client_id in room:
-                room.remove(client_id)
-                await manager.broadcast(json.dumps({
-                    "type": "player_disconnect",
-                    "client_id": client_id
-                }), room)
+        pass
+    finally:
+        # Whatever ended the loop, a socket that was attached leaves a session to suspend or end
+        if channel is not None:
+            manager.in_room(manager.get_player_room(client_id), manager.connection_lost, client_id, channel)
+        admission.release()
@@ -0,0 +1,195 @@
+"""Matchmaking: queue players by job title and level, and form rooms in batches.
+
+Players wait in one FIFO bucket per ``(job_title, level)``. Enqueueing and
+cancelling are O(1): a cancelled ticket is only marked, and is dropped when
+the matcher next reaches it. Every ``interval`` seconds the matcher runs
+two passes per job title:
+
+1. Full rooms of players on the same level, oldest first, straight from each
+   bucket.
+2. The players left over, in level order. A ticket accepts players up to
+   ``spread`` levels away, where the spread grows by one every
+   ``widen_after`` seconds it has waited, up to ``max_spread``. Consecutive
+   tickets form a room when every member accepts the whole group's range.
+   Once everyone in a pair has reached ``max_spread``, two players are
+   enough for a room.
+
+Matched groups are handed to ``form``, which creates the room and starts
+the game.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Ticket:
+    __slots__ = ('player_id', 'job_title', 'level', 'enqueued_at', 'live')
+
+    def __init__(self, player_id: str, job_title: str, level: int, enqueued_at: float):
+        self.player_id = player_id
+        self.job_title = job_title
+        self.level = level
+        self.enqueued_at = enqueued_at
+        self.live = True  # False once matched or cancelled
+
+
+class Matchmaker:
+    def __init__(self, form: Callable[[List[Ticket]], Awaitable[None]], room_size: int = 3,
+                 interval: float = 0.25, widen_after: float = 5.0, max_spread: int = 3,
+                 clock: Callable[[], float] = time.monotonic):
+        self.form = form  # Called with each matched group
+        self.room_size = room_size
+        self.interval = interval
+        self.widen_after = widen_after  # Seconds of waiting per extra level of spread
+        self.max_spread = max_spread
+        self.clock = clock
+        self.queues: Dict[str, Dict[int, Deque[Ticket]]] = {}  # job_title -> level -> tickets, oldest first
+        self.tickets: Dict[str, Ticket] = {}  # Player id -> its live ticket
+        self._task: Optional[asyncio.Task] = None
+        self.enqueued = 0
+        self.cancelled = 0
+        self.matched = 0
+        self.rooms = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def __len__(self) -> int:
+        return len(self.tickets)
+
+    def __contains__(self, player_id: str) -> bool:
+        return player_id in self.tickets
+
+    def enqueue(self, player_id: str, job_title: str, level: int) -> Ticket:
+        """Queue a player, replacing any ticket it already has"""
+        self.cancel(player_id)
+        ticket = self.tickets[player_id] = Ticket(player_id, job_title, level, self.clock())
+        self._bucket(ticket).append(ticket)
+        self.enqueued += 1
+        return ticket
+
+    def requeue(self, ticket: Ticket):
+        """Put back a ticket whose room could not be formed, keeping its place in line"""
+        if ticket.player_id in self.tickets:
+            return
+        ticket.live = True
+        self.tickets[ticket.player_id] = ticket
+        self._bucket(ticket).appendleft(ticket)
+
+    def cancel(self, player_id: str) -> bool:
+        ticket = self.tickets.pop(player_id, None)
+        if ticket is None:
+            return False
+        ticket.live = False
+        self.cancelled += 1
+        return True
+
+    def _bucket(self, ticket: Ticket) -> Deque[Ticket]:
+        levels = self.queues.get(ticket.job_title)
+        if levels is None:
+            levels = self.queues[ticket.job_title] = {}
+        bucket = levels.get(ticket.level)
+        if bucket is None:
+            bucket = levels[ticket.level] = deque()
+        return bucket
+
+    def spread(self, ticket: Ticket, now: float) -> int:
+        """Levels away from its own that a ticket accepts after waiting until ``now``"""
+        if self.widen_after <= 0:
+            return self.max_spread
+        return min(self.max_spread, int((now - ticket.enqueued_at) / self.widen_after))
+
+    def match(self, now: float = None) -> List[List[Ticket]]:
+        """Take every group that can be matched now out of the queues"""
+        now = self.clock() if now is None else now
+        size = self.room_size
+        groups = []
+        for job_title in list(self.queues):
+            levels = self.queues[job_title]
+            leftovers = []
+            for level in sorted(levels):
+                bucket = levels[level]
+                live = [ticket for ticket in bucket if ticket.live]
+                whole = len(live) - len(live) % size
+                for i in range(0, whole, size):
+                    groups.append(live[i:i + size])
+                leftovers.extend(live[whole:])
+
+            # Leftovers are in level order, oldest first within a level
+            remaining = self._widen(leftovers, size, now, groups)
+            remaining = self._widen(remaining, 2, now, groups, full_spread=True) if size > 2 else remaining
+
+            levels.clear()
+            for ticket in remaining:
+                self._bucket(ticket).append(ticket)
+            if not levels:
+                del self.queues[job_title]
+
+        for group in groups:
+            for ticket in group:
+                ticket.live = False
+                del self.tickets[ticket.player_id]
+                wait = now - ticket.enqueued_at
+                self.total_wait += wait
+                if wait > self.max_wait:
+                    self.max_wait = wait
+            self.matched += len(group)
+        self.rooms += len(groups)
+        return groups
+
+    def _widen(self, tickets: List[Ticket], size: int, now: float, groups: list,
+               full_spread: bool = False) -> List[Ticket]:
+        """Greedily group consecutive tickets whose spreads cover the group. Returns the rest."""
+        remaining = []
+        i = 0
+        while i + size <= len(tickets):
+            group = tickets[i:i + size]
+            spread = min(self.spread(ticket, now) for ticket in group)
+            if (not full_spread or spread >= self.max_spread) and group[-1].level - group[0].level <= spread:
+                groups.append(group)
+                i += size
+            else:
+                remaining.append(tickets[i])
+                i += 1
+        remaining.extend(tickets[i:])
+        return remaining
+
+    async def tick(self):
+        for group in self.match():
+            try:
+                await self.form(group)
+            except Exception as e:
+                logger.exception("Error forming a matched room: %s", e)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if self.tickets:
+                await self.tick()
+
+    def start(self):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            'queued': len(self.tickets),
+            'enqueued': self.enqueued,
+            'cancelled': self.cancelled,
+            'matched': self.matched,
+            'rooms': self.rooms,
+            'mean_wait_ms': round(self.total_wait / self.matched * 1000, 3) if self.matched else 0.0,
+            'max_wait_ms': round(self.max_wait * 1000, 3),
+        }
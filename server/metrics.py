@@ -0,0 +1,283 @@
+"""In-process metrics exposed in the Prometheus text format.
+
+Counters, gauges and histograms live in a ``Registry``; ``render()``
+produces the text served at ``GET /metrics``. Metrics with labels hand out
+one child per label-value tuple via ``labels(...)``, so a hot path can keep
+the child around and skip the lookup:
+
+    HANDLER_SECONDS = REGISTRY.histogram('handler_seconds', 'Handler latency', ['type'])
+    HANDLER_SECONDS.labels('join_room').observe(0.002)
+
+Gauges and counters can also be backed by a function that is called at
+scrape time, for values the app already tracks elsewhere.
+"""
+import asyncio
+import inspect
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence
+
+# Seconds; covers sub-millisecond handlers up to multi-second stalls
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# Bytes per frame
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144)
+# Recipients per broadcast
+COUNT_BUCKETS = (1, 2, 3, 5, 10, 25, 100, 1000)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(ABC):
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), function: Callable = None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.function = function  # Called at scrape time: a value, or {label tuple: value}
+        self._children = {}
+        if not self.labelnames and function is None:
+            self._default = self._children[()] = self._new_child()
+
+    @abstractmethod
+    def _new_child(self):
+        """A new child holding the value of one label combination"""
+
+    def labels(self, *values):
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            child = self._children[key] = self._new_child()
+        return child
+
+    def _samples(self):
+        """Yield (suffix, label values, extra label, value) for every sample"""
+        if self.function is not None:
+            value = self.function()
+            items = value.items() if isinstance(value, dict) else [((), value)]
+            for key, sample in items:
+                yield '', key, '', sample
+            return
+        for key, child in self._children.items():
+            yield from child.samples(key)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for suffix, key, extra, value in self._samples():
+            lines.append(f'{self.name}{suffix}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}')
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def samples(self, key):
+        yield '', key, '', self.value
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self._default.inc(amount)
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._default.set(value)
+
+
+class _HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # Per bucket, not cumulative; last is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, key):
+        cumulative = 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            cumulative += count
+            yield '_bucket', key, f'le="{_format_value(bound)}"', cumulative
+        yield '_sum', key, '', self.sum
+        yield '_count', key, '', self.count
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+
+    def _add(self, metric: _Metric) -> _Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = (), function: Callable = None) -> Counter:
+        return self._add(Counter(name, help, labelnames, function))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = (), function: Callable = None) -> Gauge:
+        return self._add(Gauge(name, help, labelnames, function))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                lines.append(f'# {metric.name} unavailable: {_escape(e)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class InstrumentedRedis:
+    """Wraps a Redis client and records how long each command takes.
+
+    Plain commands are timed by name; pipelines are timed as a single
+    ``pipeline`` call when they execute. Anything else (``pubsub()``,
+    ``sscan_iter()``) is passed through untouched.
+    """
+
+    def __init__(self, client, histogram: Histogram, errors: Counter = None):
+        self._client = client
+        self._histogram = histogram
+        self._errors = errors
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if inspect.iscoroutine(result):
+                return self._timed(name, result)
+            return result
+
+        return call
+
+    def pipeline(self, *args, **kwargs):
+        return _InstrumentedPipeline(self._client.pipeline(*args, **kwargs), self)
+
+    async def _timed(self, command: str, awaitable):
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        except Exception:
+            if self._errors is not None:
+                self._errors.labels(command).inc()
+            raise
+        finally:
+            self._histogram.labels(command).observe(time.perf_counter() - start)
+
+
+class _InstrumentedPipeline:
+    def __init__(self, pipeline, owner: InstrumentedRedis):
+        self._pipeline = pipeline
+        self._owner = owner
+
+    def __getattr__(self, name: str):
+        return getattr(self._pipeline, name)
+
+    async def execute(self, *args, **kwargs):
+        return await self._owner._timed('pipeline', self._pipeline.execute(*args, **kwargs))
+
+
+class LoopLagMonitor:
+    """Measures event-loop lag: how late a sleep wakes up past its deadline"""
+
+    def __init__(self, histogram: Histogram, gauge: Gauge, interval: float = 0.5):
+        self.histogram = histogram
+        self.gauge = gauge
+        self.interval = interval
+        self.last = 0.0  # Most recent sample, in seconds
+        self._task: Optional[asyncio.Task] = None
+
+    async def run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = self.last = max(0.0, time.perf_counter() - expected)
+            self.histogram.observe(lag)
+            self.gauge.set(lag)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,94 @@
+"""Player and room records.
+
+Each player and each room is one slotted object that owns all of its
+state, so removing a player is a matter of dropping one record rather
+than keeping a set of parallel dicts in step.
+"""
+import time
+from typing import Dict, Optional
+
+from protocol import PROTOCOL_LEGACY
+
+
+class Player:
+    __slots__ = ('id', 'name', 'score', 'level', 'ready', 'job_title', 'room',
+                 'channel', 'protocol', 'sampler', 'current_question', 'grace', 'spectating',
+                 'fragment', 'buckets')
+
+    def __init__(self, player_id: str, name: Optional[str] = None, score: int = 0,
+                 level: int = 1, ready: bool = False):
+        self.id = player_id
+        self.name = name
+        self.score = score
+        self.level = level
+        self.ready = ready
+        self.job_title = None
+        self.room = None  # Code of the room the player is in
+        self.channel = None  # ClientChannel or RemoteChannel while connected
+        self.protocol = PROTOCOL_LEGACY
+        self.sampler = None  # PoolSampler over the current question pool
+        self.current_question = None  # Id of the last question sent for get_question
+        self.grace = None  # Timer that ends the session while the player is suspended
+        self.spectating = None  # Code of the room the client watches as a spectator
+        self.fragment = None  # (score, level, name, JSON) of its last encoded game_state entry
+        self.buckets = None  # Rate limit token buckets by message type, None for all types
+
+    def record(self) -> dict:
+        """Hash fields persisted to Redis"""
+        return {
+            'name': self.name or 'Unknown',
+            'score': str(self.score),
+            'level': str(self.level),
+            'ready': str(self.ready).lower()
+        }
+
+    @classmethod
+    def from_record(cls, player_id: str, data: dict) -> 'Player':
+        """Build a player from its Redis hash (bytes keys and values)"""
+        return cls(
+            player_id,
+            name=data.get(b'name', b'Unknown').decode('utf-8'),
+            score=int(data.get(b'score', b'0')),
+            level=int(data.get(b'level', b'1')),
+            ready=data.get(b'ready', b'false').decode('utf-8') == 'true',
+        )
+
+    @classmethod
+    def from_fields(cls, player_id: str, fields: dict) -> 'Player':
+        """Build a player from the fields of ``record()``, as the journal keeps them"""
+        return cls(
+            player_id,
+            name=fields.get('name', 'Unknown'),
+            score=int(fields.get('score', '0')),
+            level=int(fields.get('level', '1')),
+            ready=fields.get('ready', 'false') == 'true',
+        )
+
+
+class Room:
+    __slots__ = ('code', 'players', 'game', 'answer', 'sequencer', 'last_active', 'deadline', 'idle_timer')
+
+    def __init__(self, code: str):
+        self.code = code
+        self.players: Dict[str, Player] = {}  # In join order; the first player is the creator
+        self.game = None  # State of the game in progress, as sent to clients
+        self.answer = None  # Correct option of the game's current question, which clients are not sent
+        self.sequencer = None  # RoomSequencer, once a delta protocol client is in the room
+        self.last_active = time.monotonic()  # Last client message handled for the room
+        self.deadline = None  # Timer that ends the current question
+        self.idle_timer = None  # Timer that checks whether the room has gone idle
+
+    def cancel_timers(self):
+        for timer in (self.deadline, self.idle_timer):
+            if timer is not None:
+                timer.cancel()
+        self.deadline = self.idle_timer = None
+
+    @property
+    def creator(self) -> Optional[str]:
+        return next(iter(self.players), None)
+
+    def present_players(self):
+        """Players with a live connection or a suspended session that may resume"""
+        return [player for player in self.players.values()
+                if player.channel is not None or player.grace is not None]
@@ -0,0 +1,138 @@
+"""Per-connection outbound queues.
+
+Every WebSocket gets a bounded queue drained by its own writer task, so a
+broadcast only enqueues frames and a slow or stalled client can never hold
+up the rest of its room or the handler that triggered the broadcast.
+"""
+import asyncio
+import logging
+from collections import deque
+from typing import Union
+
+from wire import JSON, Frame
+
+logger = logging.getLogger(__name__)
+
+# Frames that are superseded by the next frame of the same type and may be
+# dropped when a client falls behind
+STALE_KINDS = frozenset({'room_update', 'spectator_update'})
+
+OVERFLOW_DROP_STALE = 'drop_stale'
+OVERFLOW_DISCONNECT = 'disconnect'
+
+# WebSocket close code sent to clients that cannot keep up ("try again later")
+SLOW_CONSUMER_CLOSE_CODE = 1013
+# WebSocket close code sent to a socket whose session a newer socket for the same client took over
+REPLACED_CLOSE_CODE = 4000
+
+
+class OutboundMetrics:
+    """Counters shared by every channel"""
+
+    def __init__(self):
+        self.enqueued = 0
+        self.sent = 0
+        self.dropped = 0
+        self.slow_disconnects = 0
+        self.max_depth = 0
+
+
+class ClientChannel:
+    def __init__(self, websocket, client_id: str, metrics: OutboundMetrics,
+                 max_queue: int = 256, overflow_policy: str = OVERFLOW_DROP_STALE, codec=JSON):
+        self.websocket = websocket
+        self.codec = codec
+        self.client_id = client_id
+        self.metrics = metrics
+        self.max_queue = max_queue
+        self.overflow_policy = overflow_policy
+        self.queue = deque()
+        self.dropped = 0
+        self.closed = False
+        self._ready = asyncio.Event()
+        self._task = asyncio.create_task(self._writer())
+
+    @property
+    def depth(self) -> int:
+        return len(self.queue)
+
+    def send(self, frame: Union[Frame, str], kind: str = None) -> bool:
+        """Enqueue a frame without waiting. Returns False if the frame was not queued.
+
+        ``frame`` is a ``Frame`` or already-encoded JSON text.
+        """
+        if self.closed:
+            return False
+        if len(self.queue) >= self.max_queue and not self._make_room(kind):
+            return False
+
+        if isinstance(frame, str):
+            data = frame if self.codec.name == JSON.name else self.codec.encode(JSON.decode(frame))
+        else:
+            # Encode now: the message may be mutated after the broadcast returns
+            data = frame.encode(self.codec)
+        self.queue.append((kind, data))
+        self.metrics.enqueued += 1
+        if len(self.queue) > self.metrics.max_depth:
+            self.metrics.max_depth = len(self.queue)
+        self._ready.set()
+        return True
+
+    def _make_room(self, kind: str) -> bool:
+        """Apply the overflow policy to a full queue. Returns True if there is now space."""
+        if self.overflow_policy == OVERFLOW_DROP_STALE:
+            for i, (queued_kind, _) in enumerate(self.queue):
+                if queued_kind in STALE_KINDS:
+                    del self.queue[i]
+                    self._count_drop()
+                    return True
+            if kind in STALE_KINDS:
+                self._count_drop()
+                return False
+
+        # Nothing can be dropped safely, so cut the slow consumer loose
+        self.metrics.slow_disconnects += 1
+        for _ in range(len(self.queue) + 1):
+            self._count_drop()
+        logger.warning("Disconnecting slow consumer %s: send queue full", self.client_id)
+        self.close(SLOW_CONSUMER_CLOSE_CODE)
+        return False
+
+    def _count_drop(self):
+        self.dropped += 1
+        self.metrics.dropped += 1
+
+    async def _writer(self):
+        try:
+            while True:
+                while not self.queue:
+                    self._ready.clear()
+                    await self._ready.wait()
+                _, data = self.queue.popleft()
+                if isinstance(data, bytes):
+                    await self.websocket.send_bytes(data)
+                else:
+                    await self.websocket.send_text(data)
+                self.metrics.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # The socket is gone; the receive loop will clean up the connection
+            logger.info("Error sending to %s: %s", self.client_id, e)
+            self.closed = True
+            self.queue.clear()
+
+    async def _close_socket(self, code: int):
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+    def close(self, code: int = None):
+        """Stop the writer task and discard anything still queued. With a ``code``, also close the socket."""
+        self.closed = True
+        self.queue.clear()
+        if not self._task.done():
+            self._task.cancel()
+        if code is not None:
+            asyncio.create_task(self._close_socket(code))
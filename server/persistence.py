@@ -0,0 +1,207 @@
+"""Write-behind persistence of rooms and players to Redis.
+
+Handlers only mark entities dirty. A background task flushes the dirty set
+in pipelined batches, reading the latest in-memory state at flush time, so
+repeated updates to the same player or room between flushes coalesce into
+a single write and no Redis round trip ever blocks a WebSocket handler.
+
+With a ``ttl``, every write also refreshes the expiry of the keys it
+touches, so state that is never written again (rooms abandoned without a
+clean disconnect, or never loaded after a restart) drops out of Redis on
+its own.
+"""
+import asyncio
+import itertools
+import logging
+import time
+from typing import Callable, Dict, Iterable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+def _take(dirty: Dict[str, float], count: int) -> Dict[str, float]:
+    """Pop up to ``count`` of the oldest entries from a dirty map"""
+    batch = dict(itertools.islice(dirty.items(), count))
+    for key in batch:
+        del dirty[key]
+    return batch
+
+
+class WriteBehindStore:
+    target = 'Redis'
+
+    def __init__(self, client,
+                 player_record: Callable[[str], Optional[dict]],
+                 room_record: Callable[[str], Optional[Set[str]]],
+                 flush_interval: float = 0.05,
+                 max_batch: int = 500,
+                 ttl: int = 0):
+        self.client = client
+        self.player_record = player_record  # player_id -> hash fields, or None to delete
+        self.room_record = room_record  # room_code -> member ids, or None to delete
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.ttl = ttl  # Seconds until untouched room and player keys expire; 0 keeps them
+
+        # Entity id -> monotonic time it was first marked dirty
+        self.dirty_players = {}
+        self.dirty_rooms = {}
+
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+        self.flushes = 0
+        self.flushed_players = 0
+        self.flushed_rooms = 0
+        self.commands = 0
+        self.errors = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+
+    def mark_player(self, player_id: str):
+        """Queue a player's hash for the next flush"""
+        if player_id not in self.dirty_players:
+            self.dirty_players[player_id] = time.monotonic()
+            self._check_threshold()
+
+    def mark_room(self, room_code: str):
+        """Queue a room's membership for the next flush"""
+        if room_code not in self.dirty_rooms:
+            self.dirty_rooms[room_code] = time.monotonic()
+            self._check_threshold()
+
+    def mark_players(self, player_ids: Iterable[str]):
+        for player_id in player_ids:
+            self.mark_player(player_id)
+
+    def _check_threshold(self):
+        if len(self.dirty_players) + len(self.dirty_rooms) >= self.max_batch:
+            self._wakeup.set()
+
+    @property
+    def pending(self) -> int:
+        return len(self.dirty_players) + len(self.dirty_rooms)
+
+    def _queue_room(self, pipe, room_code: str):
+        members = self.room_record(room_code)
+        if members is None:
+            pipe.srem('room_codes', room_code)
+            pipe.delete(f'room:{room_code}:players')
+            return 2
+        pipe.sadd('room_codes', room_code)
+        pipe.delete(f'room:{room_code}:players')
+        if members:
+            pipe.sadd(f'room:{room_code}:players', *members)
+            if self.ttl:
+                pipe.expire(f'room:{room_code}:players', self.ttl)
+                return 4
+            return 3
+        return 2
+
+    def _queue_player(self, pipe, player_id: str):
+        fields = self.player_record(player_id)
+        if fields is None:
+            pipe.delete(f'player:{player_id}')
+            return 1
+        pipe.hset(f'player:{player_id}', mapping=fields)
+        if self.ttl:
+            pipe.expire(f'player:{player_id}', self.ttl)
+            return 2
+        return 1
+
+    async def _write(self, rooms: Iterable[str], players: Iterable[str]) -> int:
+        """Write one batch of dirty entities. Returns the number of commands sent."""
+        # The pipeline is built synchronously, so it captures a consistent
+        # snapshot of in-memory state
+        pipe = self.client.pipeline(transaction=False)
+        commands = 0
+        for room_code in rooms:
+            commands += self._queue_room(pipe, room_code)
+        for player_id in players:
+            commands += self._queue_player(pipe, player_id)
+        await pipe.execute()
+        return commands
+
+    async def flush(self) -> int:
+        """Write every dirty entity out. Returns the number of entities written."""
+        written = 0
+        while self.dirty_players or self.dirty_rooms:
+            rooms = _take(self.dirty_rooms, self.max_batch)
+            players = _take(self.dirty_players, self.max_batch - len(rooms))
+            oldest = min(itertools.chain(rooms.values(), players.values()))
+
+            start = time.monotonic()
+            try:
+                commands = await self._write(rooms, players)
+            except Exception as e:
+                logger.error("Error flushing to %s: %s", self.target, e)
+                self.errors += 1
+                # Put the batch back, keeping its original dirty timestamps
+                self.dirty_rooms = {**rooms, **self.dirty_rooms}
+                self.dirty_players = {**players, **self.dirty_players}
+                break
+
+            end = time.monotonic()
+            flush_ms = (end - start) * 1000
+            lag_ms = (end - oldest) * 1000
+            self.flushes += 1
+            self.flushed_rooms += len(rooms)
+            self.flushed_players += len(players)
+            self.commands += commands
+            self.last_flush_ms = flush_ms
+            self.max_flush_ms = max(self.max_flush_ms, flush_ms)
+            self.last_lag_ms = lag_ms
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            written += len(rooms) + len(players)
+        return written
+
+    async def run(self):
+        """Flush on a fixed interval, or early once the dirty set hits max_batch"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            errors = self.errors
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.exception("Error in write-behind flush loop: %s", e)
+            if self.errors > errors:
+                # Back off while the target is unavailable
+                await asyncio.sleep(self.flush_interval * 10)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Stop the flush loop and write out anything still pending"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        oldest = min(itertools.chain(self.dirty_rooms.values(), self.dirty_players.values()), default=None)
+        return {
+            'pending_players': len(self.dirty_players),
+            'pending_rooms': len(self.dirty_rooms),
+            'lag_ms': round((time.monotonic() - oldest) * 1000, 3) if oldest is not None else 0.0,
+            'flushes': self.flushes,
+            'flushed_players': self.flushed_players,
+            'flushed_rooms': self.flushed_rooms,
+            'commands': self.commands,
+            'errors': self.errors,
+            'last_flush_ms': round(self.last_flush_ms, 3),
+            'max_flush_ms': round(self.max_flush_ms, 3),
+            'last_lag_ms': round(self.last_lag_ms, 3),
+            'max_lag_ms': round(self.max_lag_ms, 3),
+        }
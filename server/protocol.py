@@ -0,0 +1,96 @@
+"""Versioned room protocol with sequence-numbered delta frames.
+
+Protocol 1 (legacy) clients keep receiving the full-state ``room_update``,
+``game_started`` and ``game_state_update`` messages. Clients that send
+``{"type": "hello", "protocol": 2}`` instead receive:
+
+- ``snapshot`` frames: ``{"type": "snapshot", "seq", "players", "game"}``
+  with the full room state as of ``seq``.
+- ``delta`` frames: ``{"type": "delta", "seq", ...}`` carrying only what
+  changed since the previous frame, e.g. ``"players": {"id": {"score": 20}}``
+  (``null`` for a player who left) or ``"game": {"current_question": ...}``,
+  plus one-off events such as ``answer_result``.
+
+``seq`` increases by one per delta frame in a room. A client that sees a
+gap sends ``{"type": "sync_request", "since": <last seq>}`` and gets the
+missing deltas replayed, or a fresh snapshot if they are no longer held.
+"""
+from collections import deque
+from typing import List, Optional
+
+import wire
+
+PROTOCOL_LEGACY = 1
+PROTOCOL_DELTA = 2
+SUPPORTED_PROTOCOLS = (PROTOCOL_LEGACY, PROTOCOL_DELTA)
+
+
+def _diff_fields(old: Optional[dict], new: Optional[dict]):
+    """Fields of ``new`` that differ from ``old``; None if nothing changed"""
+    if new is None:
+        return None
+    if old is None:
+        return dict(new)
+    changed = {key: value for key, value in new.items() if old.get(key) != value}
+    return changed or None
+
+
+class RoomSequencer:
+    """Tracks the last state sent to delta clients in one room"""
+
+    def __init__(self, history: int = 64):
+        self.seq = 0
+        self.players = {}
+        self.game = None
+        self.history = deque(maxlen=history)  # (seq, encoded frame)
+
+    def next_frame(self, players: dict, game: Optional[dict], extra: dict = None) -> Optional[str]:
+        """Encode the changes since the last frame, or return None if there are none"""
+        frame = {}
+
+        player_changes = {}
+        for player_id, fields in players.items():
+            changed = _diff_fields(self.players.get(player_id), fields)
+            if changed:
+                player_changes[player_id] = changed
+        for player_id in self.players:
+            if player_id not in players:
+                player_changes[player_id] = None
+        if player_changes:
+            frame['players'] = player_changes
+
+        if game is None:
+            if self.game is not None:
+                frame['game'] = None
+        else:
+            game_changes = _diff_fields(self.game, game)
+            if game_changes:
+                frame['game'] = game_changes
+
+        if extra:
+            frame.update(extra)
+        if not frame:
+            return None
+
+        self.players = players
+        self.game = game
+        self.seq += 1
+        text = wire.dumps({'type': 'delta', 'seq': self.seq, **frame})
+        self.history.append((self.seq, text))
+        return text
+
+    def snapshot(self, players: dict, game: Optional[dict]) -> str:
+        return wire.dumps({
+            'type': 'snapshot',
+            'seq': self.seq,
+            'players': players,
+            'game': game
+        })
+
+    def frames_since(self, since: int) -> Optional[List[str]]:
+        """Frames after ``since``, or None if some of them are no longer held"""
+        if since == self.seq:
+            return []
+        if since > self.seq or not self.history or self.history[0][0] > since + 1:
+            return None
+        return [text for seq, text in self.history if seq > since]
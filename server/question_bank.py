@@ -0,0 +1,173 @@
+"""Question bank: indexed questions with per-player sampling without replacement.
+
+Questions are loaded from a JSONL file (one JSON object per line) or a
+SQLite database with a ``questions`` table. Each question has an integer
+``id``, a ``job_title``, a ``level``, the ``question`` text, its
+``options`` and the index of the ``correct`` option.
+
+Questions are indexed by ``(job_title, level)``. A reload builds a new
+index and swaps it in at once, so a pool never changes under a sampler;
+samplers notice the new version and start over on the new pool.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_FIELDS = ('job_title', 'level', 'question', 'options', 'correct')
+
+
+class QuestionIndex:
+    """Immutable snapshot of a loaded bank"""
+
+    def __init__(self, questions: Dict[int, dict], version: int):
+        self.questions = questions
+        self.version = version
+        pools = {}
+        for question_id, question in questions.items():
+            pools.setdefault((question['job_title'], question['level']), []).append(question_id)
+        self.pools = {key: tuple(ids) for key, ids in pools.items()}
+        # Job titles in file order; the first one is the default
+        self.job_titles = list(dict.fromkeys(question['job_title'] for question in questions.values()))
+
+
+def _read_jsonl(path: str) -> List[dict]:
+    rows = []
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError as e:
+                raise ValueError(f"{path}:{line_number}: {e}") from e
+    return rows
+
+
+def _read_sqlite(path: str) -> List[dict]:
+    connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        cursor = connection.execute(
+            'SELECT id, job_title, level, question, options, correct FROM questions ORDER BY id')
+        return [
+            {'id': id_, 'job_title': job_title, 'level': level, 'question': question,
+             'options': json.loads(options), 'correct': correct}
+            for id_, job_title, level, question, options, correct in cursor
+        ]
+    finally:
+        connection.close()
+
+
+class QuestionBank:
+    def __init__(self, path: str):
+        self.path = path
+        self.index = QuestionIndex({}, 0)
+        self._mtime = None
+
+    def _read(self):
+        """Read and validate the bank file; returns (questions by id, mtime)"""
+        mtime = os.path.getmtime(self.path)
+        if self.path.endswith(('.db', '.sqlite', '.sqlite3')):
+            rows = _read_sqlite(self.path)
+        else:
+            rows = _read_jsonl(self.path)
+
+        questions = {}
+        for position, row in enumerate(rows, 1):
+            missing = [field for field in REQUIRED_FIELDS if field not in row]
+            if missing:
+                raise ValueError(f"Question {row.get('id', position)} is missing {', '.join(missing)}")
+            question_id = int(row.get('id', position))
+            questions[question_id] = {
+                'id': question_id,
+                'job_title': row['job_title'],
+                'level': int(row['level']),
+                'question': row['question'],
+                'options': list(row['options']),
+                'correct': int(row['correct'])
+            }
+        return questions, mtime
+
+    def _install(self, questions: Dict[int, dict], mtime: float):
+        self._mtime = mtime
+        self.index = QuestionIndex(questions, self.index.version + 1)
+        logger.info("Loaded %d questions from %s (version %d)", len(questions), self.path, self.index.version)
+
+    def load(self):
+        """Read the bank from disk and swap it in"""
+        self._install(*self._read())
+
+    async def reload_if_changed(self) -> bool:
+        """Reload the bank if its file changed, parsing it off the event loop"""
+        try:
+            if os.path.getmtime(self.path) == self._mtime:
+                return False
+            self._install(*await asyncio.to_thread(self._read))
+            return True
+        except Exception as e:
+            # Keep serving the previous version
+            logger.error("Error reloading questions from %s: %s", self.path, e)
+            return False
+
+    async def watch(self, interval: float):
+        """Hot-reload the bank whenever its file changes"""
+        while True:
+            await asyncio.sleep(interval)
+            await self.reload_if_changed()
+
+    @property
+    def version(self) -> int:
+        return self.index.version
+
+    @property
+    def default_job_title(self) -> Optional[str]:
+        return self.index.job_titles[0] if self.index.job_titles else None
+
+    def get(self, question_id: int) -> Optional[dict]:
+        return self.index.questions.get(question_id)
+
+    def pool(self, job_title: str, level: int) -> Tuple[int, ...]:
+        return self.index.pools.get((job_title, level), ())
+
+    def has_pool(self, job_title: str, level: int) -> bool:
+        return (job_title, level) in self.index.pools
+
+    def sampler(self, job_title: str, level: int) -> 'PoolSampler':
+        return PoolSampler(self.pool(job_title, level), (job_title, level, self.version))
+
+
+class PoolSampler:
+    """Draws ids from a pool without replacement in O(1) time per draw.
+
+    A lazy Fisher-Yates shuffle: only positions that have been swapped are
+    stored, so memory grows with the number of draws, not the pool size.
+    """
+
+    __slots__ = ('pool', 'key', 'remaining', '_swaps')
+
+    def __init__(self, pool: Tuple[int, ...], key: tuple):
+        self.pool = pool
+        self.key = key  # (job_title, level, bank version)
+        self.remaining = len(pool)
+        self._swaps = {}
+
+    def draw(self) -> Optional[int]:
+        """Return the next id, or None once every id has been drawn"""
+        if self.remaining == 0:
+            return None
+        pick = random.randrange(self.remaining)
+        last = self.remaining - 1
+        chosen = self._swaps.get(pick, pick)
+        # Move the last undrawn position into the slot just drawn
+        if pick != last:
+            self._swaps[pick] = self._swaps.pop(last, last)
+        else:
+            self._swaps.pop(last, None)
+        self.remaining = last
+        return self.pool[chosen]
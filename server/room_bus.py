@@ -0,0 +1,386 @@
+"""Room bus: routes room traffic between server nodes.
+
+Every room is owned by exactly one node (a uvicorn worker or host), which
+holds its state and runs its handlers. A client connected to a different
+node has its messages forwarded to the owner as ``command`` envelopes, and
+the owner sends frames back through a ``RemoteChannel`` that turns them
+into ``deliver`` envelopes for the client's node.
+
+Envelopes are small dicts with an ``op`` field:
+
+- ``command``: ``client_id``, ``origin`` node, ``protocol`` and ``message``
+- ``deliver``: ``client_id``, encoded ``frame`` and its ``kind``
+- ``disconnect``: ``client_id`` left its node or moved to another room
+- ``suspend``: ``client_id`` dropped its socket and may resume within the grace window
+- ``resume``: ``client_id`` reconnected to ``origin`` with ``protocol``; catch it up from ``since``
+
+``InMemoryRoomBus`` serves a single process; ``RedisRoomBus`` uses Redis
+pub/sub with one channel per node and ``room_owner:{code}`` keys. The
+owner keys expire unless their node keeps refreshing them, so the rooms
+of a node that crashed are free to be claimed again once their TTL runs
+out. Pub/sub does not keep messages: envelopes published while a node's
+subscription is being re-established are lost.
+"""
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Awaitable, Callable, List, Optional
+
+import wire
+
+logger = logging.getLogger(__name__)
+
+BUS_MEMORY = 'memory'
+BUS_REDIS = 'redis'
+
+
+class RemoteChannel:
+    """Outbound channel for a client whose socket lives on another node"""
+
+    depth = 0
+
+    def __init__(self, client_id: str, node_id: str, bus: 'RoomBus'):
+        self.client_id = client_id
+        self.node_id = node_id
+        self.bus = bus
+        self.closed = False
+
+    def send(self, frame, kind: str = None) -> bool:
+        if self.closed:
+            return False
+        self.bus.post(self.node_id, {
+            'op': 'deliver',
+            'client_id': self.client_id,
+            'frame': frame.text if isinstance(frame, wire.Frame) else frame,
+            'kind': kind
+        })
+        return True
+
+    def close(self):
+        self.closed = True
+
+
+class RoomBus(ABC):
+    """Interface shared by the bus backends"""
+
+    def __init__(self, node_id: str):
+        self.node_id = node_id
+        self.forwarded = 0
+        self.posted = 0
+        self.received = 0
+        self.errors = 0
+        self._handler = None
+
+    async def start(self, handler: Callable[[dict], Awaitable[None]]):
+        """Start receiving envelopes addressed to this node"""
+        self._handler = handler
+
+    async def stop(self):
+        pass
+
+    @abstractmethod
+    def post(self, node_id: str, envelope: dict):
+        """Queue an envelope for another node without waiting"""
+
+    def forward(self, node_id: str, client_id: str, message: dict, protocol: int = None):
+        """Forward a client message to the node that owns its room"""
+        self.forwarded += 1
+        self.post(node_id, {
+            'op': 'command',
+            'client_id': client_id,
+            'origin': self.node_id,
+            'protocol': protocol,
+            'message': message
+        })
+
+    @abstractmethod
+    async def claim_room(self, room_code: str) -> bool:
+        """Take ownership of a room. Returns False if another node owns it."""
+
+    async def claim_rooms(self, room_codes: List[str]) -> List[str]:
+        """Claim several rooms, returning the codes this node now owns"""
+        return [room_code for room_code in room_codes if await self.claim_room(room_code)]
+
+    @abstractmethod
+    def owns(self, room_code: str) -> bool:
+        """Whether this node holds the claim on a room, without a round trip"""
+
+    @abstractmethod
+    async def room_owner(self, room_code: str) -> Optional[str]:
+        """The node that owns a room, or None if no node has claimed it"""
+
+    @abstractmethod
+    def release_room(self, room_code: str):
+        """Give up ownership of a room this node owns"""
+
+    async def _dispatch(self, envelope: dict):
+        self.received += 1
+        try:
+            await self._handler(envelope)
+        except Exception as e:
+            self.errors += 1
+            logger.exception("Error handling bus envelope %s: %s", envelope.get('op'), e)
+
+    def stats(self) -> dict:
+        return {
+            'node_id': self.node_id,
+            'forwarded': self.forwarded,
+            'posted': self.posted,
+            'received': self.received,
+            'errors': self.errors,
+        }
+
+
+class InMemoryBroker:
+    """Node registry and room ownership shared by in-memory buses"""
+
+    def __init__(self):
+        self.nodes = {}
+        self.owners = {}
+
+
+class InMemoryRoomBus(RoomBus):
+    def __init__(self, node_id: str, broker: InMemoryBroker = None):
+        super().__init__(node_id)
+        self.broker = broker or InMemoryBroker()
+        self._inbox = asyncio.Queue()
+        self._task = None
+
+    async def start(self, handler):
+        await super().start(handler)
+        self.broker.nodes[self.node_id] = self
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            envelope = await self._inbox.get()
+            await self._dispatch(envelope)
+
+    async def stop(self):
+        self.broker.nodes.pop(self.node_id, None)
+        for room_code in [code for code, owner in self.broker.owners.items() if owner == self.node_id]:
+            del self.broker.owners[room_code]
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def post(self, node_id, envelope):
+        target = self.broker.nodes.get(node_id)
+        if target is not None:
+            self.posted += 1
+            target._inbox.put_nowait(envelope)
+
+    async def claim_room(self, room_code):
+        return self.broker.owners.setdefault(room_code, self.node_id) == self.node_id
+
+    def owns(self, room_code):
+        return self.broker.owners.get(room_code) == self.node_id
+
+    async def room_owner(self, room_code):
+        return self.broker.owners.get(room_code)
+
+    def release_room(self, room_code):
+        if self.broker.owners.get(room_code) == self.node_id:
+            del self.broker.owners[room_code]
+
+
+class RedisRoomBus(RoomBus):
+    def __init__(self, client, node_id: str, prefix: str = 'roombus', owner_ttl: int = 30,
+                 retry_delay: float = 1.0):
+        super().__init__(node_id)
+        self.client = client
+        self.prefix = prefix
+        self.owner_ttl = owner_ttl  # Seconds an owner key outlives the last heartbeat
+        self.retry_delay = retry_delay  # Seconds between attempts to resubscribe
+        self.owned_rooms = set()
+        self._outgoing = deque()  # (channel, encoded envelope)
+        self._ready = asyncio.Event()
+        self._pubsub = None
+        self._tasks = []
+
+    def _node_channel(self, node_id: str) -> str:
+        return f'{self.prefix}:node:{node_id}'
+
+    @staticmethod
+    def _owner_key(room_code: str) -> str:
+        return f'room_owner:{room_code}'
+
+    async def start(self, handler):
+        await super().start(handler)
+        await self._subscribe()
+        self._tasks = [
+            asyncio.create_task(self._listen()),
+            asyncio.create_task(self._publish_loop()),
+            asyncio.create_task(self._heartbeat()),
+        ]
+
+    async def _subscribe(self):
+        self._pubsub = self.client.pubsub()
+        await self._pubsub.subscribe(self._node_channel(self.node_id))
+
+    async def _close_pubsub(self):
+        pubsub, self._pubsub = self._pubsub, None
+        if pubsub is not None:
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass  # The connection is already gone
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        try:
+            if self.owned_rooms:
+                await self.client.delete(*(self._owner_key(code) for code in self.owned_rooms))
+                self.owned_rooms.clear()
+            if self._pubsub is not None:
+                await self._pubsub.unsubscribe()
+                await self._pubsub.aclose()
+        except Exception as e:
+            logger.error("Error stopping room bus: %s", e)
+
+    async def _listen(self):
+        while True:
+            try:
+                if self._pubsub is None:
+                    await self._subscribe()
+                    logger.info("Resubscribed to room bus channel %s", self._node_channel(self.node_id))
+                async for message in self._pubsub.listen():
+                    if message['type'] != 'message':
+                        continue
+                    try:
+                        envelope = wire.loads(message['data'])
+                    except ValueError as e:
+                        self.errors += 1
+                        logger.warning("Dropping malformed bus envelope: %s", e)
+                        continue
+                    await self._dispatch(envelope)
+                raise ConnectionError("subscription ended")
+            except Exception as e:
+                # Keep this node reachable: count the failure and subscribe again
+                self.errors += 1
+                logger.error("Room bus subscription failed, resubscribing in %.1fs: %s", self.retry_delay, e)
+                await self._close_pubsub()
+                await asyncio.sleep(self.retry_delay)
+
+    async def _publish_loop(self):
+        while True:
+            while not self._outgoing:
+                self._ready.clear()
+                await self._ready.wait()
+            # Publish everything queued so far in one round trip
+            pipe = self.client.pipeline(transaction=False)
+            while self._outgoing:
+                channel, data = self._outgoing.popleft()
+                pipe.publish(channel, data)
+            try:
+                await pipe.execute()
+            except Exception as e:
+                self.errors += 1
+                logger.error("Error publishing to room bus: %s", e)
+
+    async def _heartbeat(self):
+        """Refresh the owner keys of this node's rooms well before they expire"""
+        while True:
+            await asyncio.sleep(self.owner_ttl / 3)
+            rooms = list(self.owned_rooms)
+            if not rooms:
+                continue
+            try:
+                pipe = self.client.pipeline(transaction=False)
+                for room_code in rooms:
+                    pipe.expire(self._owner_key(room_code), self.owner_ttl)
+                refreshed = await pipe.execute()
+                for room_code, alive in zip(rooms, refreshed):
+                    if not alive and room_code in self.owned_rooms:
+                        await self._reclaim(room_code)
+            except Exception as e:
+                self.errors += 1
+                logger.error("Error refreshing room ownership: %s", e)
+
+    async def _reclaim(self, room_code: str):
+        """Take back an owner key that expired under us, unless another node has claimed the room"""
+        if not await self.client.set(self._owner_key(room_code), self.node_id, nx=True, ex=self.owner_ttl):
+            self.owned_rooms.discard(room_code)
+            logger.warning("Lost ownership of room %s to %s", room_code, await self.room_owner(room_code))
+
+    def post(self, node_id, envelope):
+        self.posted += 1
+        self._outgoing.append((self._node_channel(node_id), wire.dumps(envelope)))
+        self._ready.set()
+
+    async def claim_room(self, room_code):
+        if room_code in self.owned_rooms:
+            return True
+        key = self._owner_key(room_code)
+        if await self.client.set(key, self.node_id, nx=True, ex=self.owner_ttl):
+            self.owned_rooms.add(room_code)
+            return True
+        if await self.room_owner(room_code) == self.node_id:
+            # Our own key, still waiting on a pending release
+            self.owned_rooms.add(room_code)
+            await self.client.expire(key, self.owner_ttl)
+            return True
+        return False
+
+    async def claim_rooms(self, room_codes):
+        # One pipelined SET NX for the batch, then one pipelined GET for keys
+        # that were already set, some of which may be our own awaiting release
+        claimed = [room_code for room_code in room_codes if room_code in self.owned_rooms]
+        room_codes = [room_code for room_code in room_codes if room_code not in self.owned_rooms]
+        if not room_codes:
+            return claimed
+        pipe = self.client.pipeline(transaction=False)
+        for room_code in room_codes:
+            pipe.set(self._owner_key(room_code), self.node_id, nx=True, ex=self.owner_ttl)
+        results = await pipe.execute()
+        claimed.extend(room_code for room_code, ok in zip(room_codes, results) if ok)
+        taken = [room_code for room_code, ok in zip(room_codes, results) if not ok]
+        if taken:
+            pipe = self.client.pipeline(transaction=False)
+            for room_code in taken:
+                pipe.get(self._owner_key(room_code))
+            node = self.node_id.encode('utf-8')
+            ours = [room_code for room_code, owner in zip(taken, await pipe.execute()) if owner == node]
+            if ours:
+                pipe = self.client.pipeline(transaction=False)
+                for room_code in ours:
+                    pipe.expire(self._owner_key(room_code), self.owner_ttl)
+                await pipe.execute()
+                claimed.extend(ours)
+        self.owned_rooms.update(claimed)
+        return claimed
+
+    def owns(self, room_code):
+        return room_code in self.owned_rooms
+
+    async def room_owner(self, room_code):
+        if room_code in self.owned_rooms:
+            return self.node_id
+        owner = await self.client.get(self._owner_key(room_code))
+        return owner.decode('utf-8') if owner else None
+
+    def release_room(self, room_code):
+        if room_code in self.owned_rooms:
+            self.owned_rooms.discard(room_code)
+            # Nobody else can set the key while we hold it, so a plain delete is safe
+            asyncio.create_task(self._delete_owner_key(room_code))
+
+    async def _delete_owner_key(self, room_code: str):
+        if room_code in self.owned_rooms:
+            return  # Reclaimed before the release ran
+        try:
+            await self.client.delete(self._owner_key(room_code))
+        except Exception as e:
+            self.errors += 1
+            logger.error("Error releasing room %s: %s", room_code, e)
+
+
+def create_room_bus(backend: str, client, node_id: str, owner_ttl: int = 30) -> RoomBus:
+    if backend == BUS_REDIS:
+        return RedisRoomBus(client, node_id, owner_ttl=owner_ttl)
+    if backend == BUS_MEMORY:
+        return InMemoryRoomBus(node_id)
+    raise ValueError(f"Unknown room bus backend: {backend}")
@@ -0,0 +1,190 @@
+"""Room code allocation in constant time, with cooled-down reuse.
+
+Codes are ``length`` characters from A-Z and 0-9. Fresh codes come from a
+keyed permutation of the indexes ``0 .. 36**length - 1`` walked by a
+counter. Each index maps to a different code, so allocation never retries,
+however full the code space is. Released codes wait out a cooldown on a
+FIFO free list and are handed out again before any fresh code.
+
+The state lives in Redis so it survives restarts and is shared by every
+worker:
+
+- ``room_codes:seed`` - key of the permutation, set once by the first worker
+- ``room_codes:cursor`` - next unused index; workers lease blocks of indexes
+  with ``INCRBY``, so most allocations make no Redis call at all
+- ``room_codes:released`` - free list of ``code:released_at`` entries
+"""
+import asyncio
+import logging
+import math
+import random
+import secrets
+import string
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+ALPHABET = string.ascii_uppercase + string.digits
+
+
+class RoomCodesExhausted(Exception):
+    """Every code is either in use or still cooling down"""
+
+
+def _unit(rng: random.Random, n: int) -> int:
+    """Random multiplier coprime to n, so that multiplying mod n is a bijection"""
+    while True:
+        a = rng.randrange(1, n)
+        if math.gcd(a, n) == 1:
+            return a
+
+
+class CodePermutation:
+    """Keyed bijection from indexes to codes: affine map, per-digit substitution, affine map.
+
+    The substitution step keeps consecutive indexes from producing codes that
+    differ by a constant, as a plain affine map would.
+    """
+
+    def __init__(self, seed: int, length: int = 5, alphabet: str = ALPHABET):
+        rng = random.Random(seed)
+        self.length = length
+        self.alphabet = alphabet
+        self.base = len(alphabet)
+        self.size = self.base ** length
+        self.a1, self.b1 = _unit(rng, self.size), rng.randrange(self.size)
+        self.a2, self.b2 = _unit(rng, self.size), rng.randrange(self.size)
+        self.tables = []
+        for _ in range(length):
+            table = list(range(self.base))
+            rng.shuffle(table)
+            self.tables.append(table)
+
+    def __call__(self, index: int) -> str:
+        base = self.base
+        x = (self.a1 * index + self.b1) % self.size
+        y = 0
+        for table in self.tables:
+            x, digit = divmod(x, base)
+            y = y * base + table[digit]
+        x = (self.a2 * y + self.b2) % self.size
+        chars = []
+        for _ in range(self.length):
+            x, digit = divmod(x, base)
+            chars.append(self.alphabet[digit])
+        return ''.join(chars)
+
+
+class RoomCodeAllocator:
+    def __init__(self, redis, length: int = 5, cooldown: float = 300.0, block: int = 64,
+                 prefix: str = 'room_codes'):
+        self.redis = redis
+        self.length = length
+        self.cooldown = cooldown  # Seconds before a released code may be handed out again
+        self.block = block  # Indexes leased from Redis at a time
+        self.seed_key = f'{prefix}:seed'
+        self.cursor_key = f'{prefix}:cursor'
+        self.released_key = f'{prefix}:released'
+        self.permutation: Optional[CodePermutation] = None
+        self._next = 0
+        self._end = 0  # End of the leased block of indexes
+        self._reuse_after = 0.0  # No released code can be cool before this time
+        self._exhausted = False
+        self.allocated = 0
+        self.reused = 0
+        self.released = 0
+        self.errors = 0
+
+    async def load(self):
+        """Read (or create) the shared permutation key"""
+        try:
+            await self.redis.set(self.seed_key, secrets.randbits(64), nx=True)
+            seed = int(await self.redis.get(self.seed_key))
+        except Exception as e:
+            # Codes stay unique on this node; claim_room catches clashes with other nodes
+            self.errors += 1
+            logger.error("Error loading room code allocator state, using a local key: %s", e)
+            seed = secrets.randbits(64)
+        self.permutation = CodePermutation(seed, self.length)
+
+    async def allocate(self) -> str:
+        """Return an unused code in O(1); raises RoomCodesExhausted if there is none"""
+        if self.permutation is None:
+            await self.load()
+
+        code = await self._reuse()
+        if code is not None:
+            self.reused += 1
+        else:
+            if self._next >= self._end:
+                await self._lease()
+            code = self.permutation(self._next)
+            self._next += 1
+        self.allocated += 1
+        return code
+
+    async def _reuse(self) -> Optional[str]:
+        """Pop the oldest released code if its cooldown is over"""
+        now = time.time()
+        if now < self._reuse_after:
+            return None
+        try:
+            entry = await self.redis.lpop(self.released_key)
+            if entry is None:
+                # Anything released from now on cools down no earlier than this
+                self._reuse_after = now + self.cooldown
+                return None
+            code, released_at = entry.decode('utf-8').rsplit(':', 1)
+            ready_at = float(released_at) + self.cooldown
+            if ready_at > now:
+                # The oldest entry is still cooling, so is every entry behind it
+                await self.redis.lpush(self.released_key, entry)
+                self._reuse_after = ready_at
+                return None
+            return code
+        except Exception as e:
+            self.errors += 1
+            logger.error("Error reading released room codes: %s", e)
+            return None
+
+    async def _lease(self):
+        if self._exhausted:
+            raise RoomCodesExhausted()
+        size = self.permutation.size
+        try:
+            end = await self.redis.incrby(self.cursor_key, self.block)
+        except Exception as e:
+            # Fall back to a random block; the caller still checks for codes in use
+            self.errors += 1
+            logger.error("Error leasing room codes, using a random block: %s", e)
+            end = random.randrange(self.block, size + 1)
+        start = end - self.block
+        if start >= size:
+            self._exhausted = True
+            raise RoomCodesExhausted()
+        self._next, self._end = start, min(end, size)
+
+    def release(self, code: str):
+        """Put a code on the free list; it is handed out again after the cooldown"""
+        if len(code) != self.length:
+            return
+        self.released += 1
+        self._exhausted = False
+        asyncio.create_task(self._push_released(f'{code}:{time.time():.3f}'))
+
+    async def _push_released(self, entry: str):
+        try:
+            await self.redis.rpush(self.released_key, entry)
+        except Exception as e:
+            self.errors += 1
+            logger.error("Error releasing room code: %s", e)
+
+    def stats(self) -> dict:
+        return {
+            'allocated': self.allocated,
+            'reused': self.reused,
+            'released': self.released,
+            'leased_remaining': self._end - self._next,
+            'errors': self.errors,
+        }
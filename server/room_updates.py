@@ -0,0 +1,94 @@
+"""Coalescing of ``room_update`` broadcasts.
+
+Handlers mark a room dirty instead of rebuilding and sending its player
+list straight away. One task flushes the dirty rooms every ``interval``
+seconds, so any number of joins, ready toggles and disconnects in a room
+within one tick go out as a single ``room_update``. With an interval of 0,
+or before the task is started, every request is sent at once.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RoomUpdateScheduler:
+    def __init__(self, send: Callable[[str], Awaitable[None]], interval: float = 0.025):
+        self.send = send  # room_id -> coroutine that broadcasts the room's current state
+        self.interval = interval
+        self.dirty: Dict[str, None] = {}  # Rooms with an update pending, in the order they were marked
+        self._task: Optional[asyncio.Task] = None
+        self.requested = 0
+        self.sent = 0
+        self.flushes = 0
+
+    @property
+    def coalescing(self) -> bool:
+        return self.interval > 0 and self._task is not None
+
+    def mark(self, room_id: str) -> Optional[Awaitable[None]]:
+        """Request an update for a room.
+
+        Returns None if the update was queued for the next tick, or the
+        coroutine that sends it now, for the caller to await or schedule.
+        """
+        self.requested += 1
+        if self.coalescing:
+            self.dirty[room_id] = None
+            return None
+        self.sent += 1
+        return self.send(room_id)
+
+    async def flush_room(self, room_id: str):
+        """Send a room's pending update now, so it goes out before what follows it"""
+        if room_id in self.dirty:
+            del self.dirty[room_id]
+            self.sent += 1
+            await self.send(room_id)
+
+    async def flush(self):
+        dirty, self.dirty = self.dirty, {}
+        if dirty:
+            self.flushes += 1
+        for room_id in dirty:
+            self.sent += 1
+            try:
+                await self.send(room_id)
+            except Exception as e:
+                logger.exception("Error sending room update for %s: %s", room_id, e)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if self.dirty:
+                await self.flush()
+
+    def start(self):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    @property
+    def ratio(self) -> float:
+        """Update requests per room_update actually sent"""
+        return self.requested / self.sent if self.sent else 0.0
+
+    def stats(self) -> dict:
+        return {
+            'interval_ms': round(self.interval * 1000, 3),
+            'pending': len(self.dirty),
+            'requested': self.requested,
+            'sent': self.sent,
+            'flushes': self.flushes,
+            'coalescing_ratio': round(self.ratio, 3),
+        }
@@ -0,0 +1,192 @@
+"""Read-only spectators of a room.
+
+Spectators join a room with ``spectate_room`` and are kept apart from its
+players. They do not count towards its capacity, do not appear in its
+player list, and joining or leaving sends nothing to anyone else. When the
+room's state changes it is only marked dirty. One task, every ``interval``
+seconds, builds each dirty room's ``spectator_update`` once and queues that
+same ``Frame`` (encoded at most once per wire format) for every spectator.
+
+Spectators are sampled rather than sent every change:
+
+- changes within one tick go out as one frame holding the latest state
+- a spectator whose queue still holds ``max_backlog`` frames is skipped,
+  and is sent the latest state once it has caught up
+- when a tick's fan-out takes more than ``budget`` of the interval, the
+  interval is stretched, up to ``max_interval``, so a large audience gets
+  fewer frames instead of crowding out the players' own traffic
+"""
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, Optional, Set
+
+from wire import Frame
+
+logger = logging.getLogger(__name__)
+
+
+class Audience:
+    __slots__ = ('code', 'channels', 'frame', 'stale', 'behind')
+
+    def __init__(self, code: str):
+        self.code = code
+        self.channels: Dict[str, object] = {}  # Spectator id -> channel
+        self.frame: Optional[Frame] = None  # Latest spectator_update built
+        self.stale = True  # The room changed since the frame was built
+        self.behind: Set[str] = set()  # Spectators skipped since the frame was built
+
+
+class SpectatorHub:
+    def __init__(self, view: Callable[[str], Optional[dict]], interval: float = 0.2,
+                 max_interval: float = 2.0, budget: float = 0.25, max_backlog: int = 1):
+        self.view = view  # room_code -> spectator_update message, or None if the room is gone
+        self.interval = interval
+        self.max_interval = max_interval
+        self.budget = budget  # Share of each interval fan-out may use before the rate drops
+        self.max_backlog = max_backlog
+        self.delay = interval  # Current interval, stretched under load
+        self.audiences: Dict[str, Audience] = {}
+        self.dirty: Dict[str, None] = {}  # Rooms whose spectators are owed a frame
+        self._task: Optional[asyncio.Task] = None
+        self.ticking = False  # Until the task starts, changes are sent at once
+        self.frames = 0
+        self.sent = 0
+        self.skipped = 0
+        self.last_fanout_ms = 0.0
+
+    def count(self, room_code: str) -> int:
+        audience = self.audiences.get(room_code)
+        return len(audience.channels) if audience is not None else 0
+
+    @property
+    def spectators(self) -> int:
+        return sum(len(audience.channels) for audience in self.audiences.values())
+
+    def add(self, room_code: str, client_id: str, channel):
+        """Add a spectator and queue the room's current state for it"""
+        audience = self.audiences.get(room_code)
+        if audience is None:
+            audience = self.audiences[room_code] = Audience(room_code)
+        audience.channels[client_id] = channel
+        frame = self._frame(audience)
+        if frame is not None:
+            channel.send(frame, 'spectator_update')
+            self.sent += 1
+
+    def remove(self, room_code: str, client_id: str):
+        audience = self.audiences.get(room_code)
+        if audience is None:
+            return
+        audience.channels.pop(client_id, None)
+        audience.behind.discard(client_id)
+        if not audience.channels:
+            del self.audiences[room_code]
+            self.dirty.pop(room_code, None)
+
+    def mark(self, room_code: str):
+        """The room's state changed; send it to its spectators on the next tick"""
+        audience = self.audiences.get(room_code)
+        if audience is None:
+            return
+        audience.stale = True
+        if not self.ticking:
+            self._send(audience)
+        else:
+            self.dirty[room_code] = None
+
+    def close_room(self, room_code: str, frame: Frame):
+        """Send a final frame to every spectator of a room, unsampled, and forget them"""
+        audience = self.audiences.pop(room_code, None)
+        self.dirty.pop(room_code, None)
+        if audience is None:
+            return []
+        for channel in audience.channels.values():
+            channel.send(frame, 'room_closed')
+        return list(audience.channels)
+
+    def _frame(self, audience: Audience) -> Optional[Frame]:
+        if audience.stale:
+            message = self.view(audience.code)
+            if message is None:
+                return None
+            audience.frame = Frame(message)
+            audience.stale = False
+            audience.behind.clear()
+            self.frames += 1
+        return audience.frame
+
+    def _send(self, audience: Audience):
+        if audience.stale:
+            targets = audience.channels
+            frame = self._frame(audience)
+        else:
+            # Only the spectators skipped last time are owed this frame
+            targets = {client_id: audience.channels[client_id] for client_id in audience.behind
+                       if client_id in audience.channels}
+            frame = audience.frame
+            audience.behind.clear()
+        if frame is None:
+            return
+        for client_id, channel in targets.items():
+            if channel.depth >= self.max_backlog:
+                audience.behind.add(client_id)
+                self.skipped += 1
+            elif channel.send(frame, 'spectator_update'):
+                self.sent += 1
+
+    def flush(self):
+        dirty, self.dirty = self.dirty, {}
+        for room_code in dirty:
+            audience = self.audiences.get(room_code)
+            if audience is None:
+                continue
+            try:
+                self._send(audience)
+            except Exception as e:
+                logger.exception("Error sending to spectators of %s: %s", room_code, e)
+            if audience.behind:
+                self.dirty[room_code] = None
+
+    def tick(self) -> float:
+        """Flush the dirty rooms. Returns the seconds until the next tick."""
+        if not self.dirty:
+            self.delay = self.interval
+            return self.delay
+        start = time.perf_counter()
+        self.flush()
+        elapsed = time.perf_counter() - start
+        self.last_fanout_ms = elapsed * 1000
+        self.delay = min(self.max_interval, max(self.interval, elapsed / self.budget))
+        return self.delay
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.delay)
+            self.tick()
+
+    def start(self):
+        if self._task is None and self.interval > 0:
+            self.ticking = True
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.ticking = False
+
+    def stats(self) -> dict:
+        return {
+            'rooms': len(self.audiences),
+            'spectators': self.spectators,
+            'interval_ms': round(self.delay * 1000, 3),
+            'frames': self.frames,
+            'sent': self.sent,
+            'skipped': self.skipped,
+            'last_fanout_ms': round(self.last_fanout_ms, 3),
+        }
@@ -0,0 +1,13 @@
+import os
+import sys
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+# main reads its settings at import: run it against the in-process fake Redis,
+# with no background question reloads, and load static files and questions
+# relative to server/ as uvicorn does
+os.environ.setdefault('REDIS_URL', 'memory://')
+os.environ.setdefault('QUESTIONS_RELOAD_INTERVAL', '0')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+os.chdir(SERVER_DIR)
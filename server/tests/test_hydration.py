@@ -0,0 +1,98 @@
+import asyncio
+
+import main
+from fake_redis import FakeRedis
+from models import Player
+from room_bus import RedisRoomBus
+
+
+async def seed(redis, rooms, players):
+    """Write rooms and players to Redis as the write-behind store lays them out"""
+    for room_code, members in rooms.items():
+        await redis.sadd('room_codes', room_code)
+        await redis.sadd(f'room:{room_code}:players', *members)
+    for player_id, fields in players.items():
+        await redis.hset(f'player:{player_id}', mapping=fields)
+
+
+def test_restored_room_does_not_take_a_live_player_from_its_current_room():
+    async def run():
+        redis = FakeRedis()
+        await seed(redis, {'OLD01': ['x', 'y']},
+                   {'x': {'name': 'stale', 'score': '99'}, 'y': {'name': 'Yan', 'score': '5'}})
+        manager = main.ConnectionManager(redis=redis)
+        await manager.hydrate('lazy')
+
+        # x is connected and has joined another room since OLD01 was written
+        x = manager.players['x'] = Player('x', name='live')
+        manager.add_player_to_room('x', 'NEW01')
+        await manager.ensure_room_loaded('OLD01')
+
+        assert x.room == 'NEW01'
+        assert list(manager.rooms['NEW01'].players) == ['x']
+        assert list(manager.rooms['OLD01'].players) == ['y']
+        assert (x.name, x.score) == ('live', 0)
+        assert manager.players['y'].score == 5
+
+        # The restored membership is written back without x
+        await manager.store.flush()
+        assert await redis.smembers('room:OLD01:players') == {b'y'}
+    asyncio.run(run())
+
+
+def test_restored_room_whose_members_all_moved_on_is_deleted():
+    async def run():
+        redis = FakeRedis()
+        await seed(redis, {'OLD01': ['x']}, {'x': {'name': 'stale', 'score': '0'}})
+        manager = main.ConnectionManager(redis=redis)
+        await manager.hydrate('lazy')
+        manager.players['x'] = Player('x', name='live')
+        manager.add_player_to_room('x', 'NEW01')
+
+        await manager.ensure_room_loaded('OLD01')
+        assert 'OLD01' not in manager.rooms
+        assert 'OLD01' not in manager.room_codes
+        await manager.store.flush()
+        assert b'OLD01' not in await redis.smembers('room_codes')
+        assert await redis.smembers('room:OLD01:players') == set()
+    asyncio.run(run())
+
+
+def test_eager_hydration_only_loads_rooms_this_node_can_claim():
+    async def run():
+        redis = FakeRedis()
+        await seed(redis, {'MINE1': ['a'], 'THEIR': ['b']},
+                   {'a': {'name': 'A', 'score': '0'}, 'b': {'name': 'B', 'score': '0'}})
+        await redis.set('room_owner:THEIR', 'other-node')
+        manager = main.ConnectionManager(redis=redis)
+        manager.bus = RedisRoomBus(redis, 'this-node')
+        await manager.hydrate('eager')
+
+        assert set(manager.rooms) == {'MINE1'}
+        assert manager.bus.owns('MINE1') and not manager.bus.owns('THEIR')
+        assert manager.unloaded_rooms == {'THEIR'}
+        assert 'b' not in manager.players
+    asyncio.run(run())
+
+
+def test_idle_check_on_a_room_owned_elsewhere_leaves_its_keys_alone():
+    async def run():
+        redis = FakeRedis()
+        await seed(redis, {'ROOM1': ['a']}, {'a': {'name': 'A', 'score': '0'}})
+        manager = main.ConnectionManager(redis=redis)
+        manager.bus = RedisRoomBus(redis, 'this-node')
+        await manager.hydrate('eager')
+        assert 'ROOM1' in manager.rooms
+
+        # Another node took the room over, e.g. after this one missed heartbeats
+        manager.bus.owned_rooms.discard('ROOM1')
+        await redis.set('room_owner:ROOM1', 'other-node')
+        manager._check_idle('ROOM1')
+        await manager.store.flush()
+
+        assert 'ROOM1' not in manager.rooms
+        assert 'ROOM1' in manager.unloaded_rooms
+        assert await redis.smembers('room_codes') == {b'ROOM1'}
+        assert await redis.smembers('room:ROOM1:players') == {b'a'}
+        assert await redis.hgetall('player:a') == {b'name': b'A', b'score': b'0'}
+    asyncio.run(run())
@@ -0,0 +1,121 @@
+import asyncio
+import os
+
+from journal import SNAPSHOT, JournalStore, _log_name, decode_snapshot, encode_snapshot
+
+
+def make_store(directory, state, **options):
+    """A journal store persisting ``state``: {'rooms': {code: members}, 'players': {id: fields}}"""
+    return JournalStore(
+        str(directory),
+        player_record=lambda player_id: state['players'].get(player_id),
+        room_record=lambda room_code: state['rooms'].get(room_code),
+        **options,
+    )
+
+
+def test_snapshot_round_trips():
+    rooms = {'ROOM1': ['a', 'b'], 'EMPTY': []}
+    players = {'a': {'name': 'Ann', 'score': '10'}, 'b': {'name': 'line\nbreak', 'score': '0'}, 'c': {}}
+    assert decode_snapshot(encode_snapshot(3, rooms, players)) == (3, rooms, players)
+
+
+def test_recovery_replays_the_log(tmp_path):
+    async def run():
+        state = {'rooms': {'ROOM1': {'a', 'b'}}, 'players': {'a': {'name': 'Ann'}, 'b': {'name': 'Bob'}}}
+        store = make_store(tmp_path, state, snapshot_interval=3600)
+        store.recover()
+        store.mark_room('ROOM1')
+        store.mark_players(['a', 'b'])
+        await store.flush()
+
+        # b leaves and the room goes with it, then a scores
+        del state['players']['b'], state['rooms']['ROOM1']
+        state['players']['a'] = {'name': 'Ann', 'score': '10'}
+        store.mark_room('ROOM1')
+        store.mark_players(['a', 'b'])
+        await store.flush()
+        assert not os.path.exists(tmp_path / SNAPSHOT)
+        # No stop(): the process died, leaving only the log
+
+        rooms, players = make_store(tmp_path, state).recover()
+        assert rooms == {}
+        assert players == {'a': {'name': 'Ann', 'score': '10'}}
+    asyncio.run(run())
+
+
+def test_recovery_reads_the_snapshot_then_newer_logs(tmp_path):
+    async def run():
+        state = {'rooms': {'ROOM1': {'a'}}, 'players': {'a': {'name': 'Ann'}}}
+        store = make_store(tmp_path, state, snapshot_interval=3600)
+        store.recover()
+        store.mark_room('ROOM1')
+        store.mark_player('a')
+        await store.flush()
+        await store.snapshot()
+        assert os.path.exists(tmp_path / SNAPSHOT)
+        # The logs the snapshot covers are gone
+        assert not os.path.exists(tmp_path / _log_name(1))
+
+        state['rooms']['ROOM2'] = {'b'}
+        state['players']['b'] = {'name': 'Bob'}
+        store.mark_room('ROOM2')
+        store.mark_player('b')
+        await store.flush()
+
+        recovered = make_store(tmp_path, state)
+        rooms, players = recovered.recover()
+        assert rooms == {'ROOM1': ['a'], 'ROOM2': ['b']}
+        assert players == {'a': {'name': 'Ann'}, 'b': {'name': 'Bob'}}
+        assert recovered.recovered_records == 2
+    asyncio.run(run())
+
+
+def test_torn_record_at_the_end_of_the_log_is_ignored(tmp_path):
+    async def run():
+        state = {'rooms': {}, 'players': {'a': {'name': 'Ann'}, 'b': {'name': 'Bob'}}}
+        store = make_store(tmp_path, state, snapshot_interval=3600)
+        store.recover()
+        store.mark_player('a')
+        await store.flush()
+        store.mark_player('b')
+        await store.flush()
+        log = tmp_path / _log_name(store.generation)
+        data = log.read_bytes()
+        log.write_bytes(data[:-3])  # Crash in the middle of writing b
+
+        rooms, players = make_store(tmp_path, state).recover()
+        assert players == {'a': {'name': 'Ann'}}
+    asyncio.run(run())
+
+
+def test_stop_leaves_a_snapshot_and_no_log_to_replay(tmp_path):
+    async def run():
+        state = {'rooms': {'ROOM1': {'a'}}, 'players': {'a': {'name': 'Ann'}}}
+        store = make_store(tmp_path, state, snapshot_interval=3600)
+        store.recover()
+        store.start()
+        store.mark_room('ROOM1')
+        store.mark_player('a')
+        await store.stop()
+
+        recovered = make_store(tmp_path, state)
+        rooms, players = recovered.recover()
+        assert rooms == {'ROOM1': ['a']}
+        assert players == {'a': {'name': 'Ann'}}
+        assert recovered.recovered_records == 0
+    asyncio.run(run())
+
+
+def test_snapshot_is_taken_once_the_log_grows_past_snapshot_bytes(tmp_path):
+    async def run():
+        state = {'rooms': {}, 'players': {f'p{i}': {'name': 'x' * 50} for i in range(20)}}
+        store = make_store(tmp_path, state, snapshot_interval=3600, snapshot_bytes=500)
+        store.recover()
+        store.mark_players(state['players'])
+        await store.flush()
+        assert store.snapshots == 1
+        assert store.log_bytes == 0
+        rooms, players = make_store(tmp_path, state).recover()
+        assert players == state['players']
+    asyncio.run(run())
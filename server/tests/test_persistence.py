@@ -0,0 +1,110 @@
+import asyncio
+
+from fake_redis import FakeRedis
+from persistence import WriteBehindStore
+
+
+def make_store(redis, players, rooms, **options):
+    return WriteBehindStore(
+        redis,
+        player_record=lambda player_id: players.get(player_id),
+        room_record=lambda room_code: rooms.get(room_code),
+        **options,
+    )
+
+
+def test_repeated_marks_coalesce_into_one_write_of_the_latest_state():
+    async def run():
+        redis = FakeRedis()
+        players = {'p1': {'name': 'a', 'score': '0'}}
+        store = make_store(redis, players, {})
+        for score in range(100):
+            players['p1'] = {'name': 'a', 'score': str(score)}
+            store.mark_player('p1')
+        assert store.pending == 1
+
+        assert await store.flush() == 1
+        assert redis.round_trips == 1
+        assert await redis.hgetall('player:p1') == {b'name': b'a', b'score': b'99'}
+        assert store.pending == 0
+    asyncio.run(run())
+
+
+def test_flush_writes_rooms_and_deletes_gone_entities():
+    async def run():
+        redis = FakeRedis()
+        players = {'p1': {'name': 'a'}, 'p2': {'name': 'b'}}
+        rooms = {'ROOM1': {'p1', 'p2'}}
+        store = make_store(redis, players, rooms)
+        store.mark_room('ROOM1')
+        store.mark_players(['p1', 'p2'])
+        await store.flush()
+        assert await redis.smembers('room_codes') == {b'ROOM1'}
+        assert await redis.smembers('room:ROOM1:players') == {b'p1', b'p2'}
+
+        del rooms['ROOM1'], players['p1']
+        store.mark_room('ROOM1')
+        store.mark_player('p1')
+        await store.flush()
+        assert await redis.smembers('room_codes') == set()
+        assert await redis.smembers('room:ROOM1:players') == set()
+        assert await redis.hgetall('player:p1') == {}
+        assert await redis.hgetall('player:p2') == {b'name': b'b'}
+    asyncio.run(run())
+
+
+def test_flush_splits_into_batches_of_max_batch():
+    async def run():
+        redis = FakeRedis()
+        players = {f'p{i}': {'name': str(i)} for i in range(25)}
+        store = make_store(redis, players, {}, max_batch=10)
+        store.mark_players(players)
+        assert await store.flush() == 25
+        assert store.flushes == 3
+        assert redis.round_trips == 3
+    asyncio.run(run())
+
+
+def test_failed_flush_keeps_the_batch_for_the_next_one():
+    class Down(FakeRedis):
+        async def _round_trip(self):
+            raise ConnectionError('redis down')
+
+    async def run():
+        players = {'p1': {'name': 'a'}}
+        store = make_store(Down(), players, {})
+        store.mark_player('p1')
+        assert await store.flush() == 0
+        assert store.errors == 1
+        assert store.pending == 1
+
+        store.client = FakeRedis()
+        assert await store.flush() == 1
+        assert await store.client.hgetall('player:p1') == {b'name': b'a'}
+    asyncio.run(run())
+
+
+def test_stop_flushes_what_is_still_pending():
+    async def run():
+        redis = FakeRedis()
+        players = {'p1': {'name': 'a'}}
+        # Long enough that only stop() can write it
+        store = make_store(redis, players, {}, flush_interval=60)
+        store.start()
+        store.mark_player('p1')
+        await store.stop()
+        assert await redis.hgetall('player:p1') == {b'name': b'a'}
+        assert store.pending == 0
+    asyncio.run(run())
+
+
+def test_ttl_is_refreshed_on_every_write():
+    async def run():
+        redis = FakeRedis()
+        store = make_store(redis, {'p1': {'name': 'a'}}, {'ROOM1': {'p1'}}, ttl=100)
+        store.mark_room('ROOM1')
+        store.mark_player('p1')
+        await store.flush()
+        assert 0 < await redis.ttl('player:p1') <= 100
+        assert 0 < await redis.ttl('room:ROOM1:players') <= 100
+    asyncio.run(run())
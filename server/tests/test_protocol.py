@@ -0,0 +1,66 @@
+import json
+
+from protocol import RoomSequencer
+
+
+def frame(text):
+    return json.loads(text)
+
+
+def test_first_frame_carries_everything_and_later_ones_only_changes():
+    sequencer = RoomSequencer()
+    players = {'a': {'name': 'A', 'score': 0}, 'b': {'name': 'B', 'score': 0}}
+    first = frame(sequencer.next_frame(players, None))
+    assert first == {'type': 'delta', 'seq': 1, 'players': players}
+
+    players = {'a': {'name': 'A', 'score': 10}, 'b': {'name': 'B', 'score': 0}}
+    second = frame(sequencer.next_frame(players, None))
+    assert second == {'type': 'delta', 'seq': 2, 'players': {'a': {'score': 10}}}
+
+
+def test_no_frame_when_nothing_changed():
+    sequencer = RoomSequencer()
+    players = {'a': {'name': 'A'}}
+    sequencer.next_frame(players, None)
+    assert sequencer.next_frame({'a': {'name': 'A'}}, None) is None
+    assert sequencer.seq == 1
+
+
+def test_player_who_left_and_ended_game_are_null():
+    sequencer = RoomSequencer()
+    sequencer.next_frame({'a': {'name': 'A'}, 'b': {'name': 'B'}}, {'status': 'active', 'current_round': 1})
+    delta = frame(sequencer.next_frame({'a': {'name': 'A'}}, {'status': 'active', 'current_round': 2}))
+    assert delta['players'] == {'b': None}
+    assert delta['game'] == {'current_round': 2}
+    assert frame(sequencer.next_frame({'a': {'name': 'A'}}, None))['game'] is None
+
+
+def test_extra_fields_make_a_frame_even_without_state_changes():
+    sequencer = RoomSequencer()
+    sequencer.next_frame({'a': {'name': 'A'}}, None)
+    delta = frame(sequencer.next_frame({'a': {'name': 'A'}}, None, extra={'answer_result': {'correct': True}}))
+    assert delta == {'type': 'delta', 'seq': 2, 'answer_result': {'correct': True}}
+
+
+def test_frames_since_replays_the_missing_deltas_in_order():
+    sequencer = RoomSequencer(history=8)
+    for score in range(5):
+        sequencer.next_frame({'a': {'score': score}}, None)
+    replay = [frame(text) for text in sequencer.frames_since(2)]
+    assert [delta['seq'] for delta in replay] == [3, 4, 5]
+    assert [delta['players']['a']['score'] for delta in replay] == [2, 3, 4]
+    assert sequencer.frames_since(5) == []
+
+
+def test_resync_needs_a_snapshot_once_deltas_left_the_history():
+    sequencer = RoomSequencer(history=3)
+    for score in range(6):
+        sequencer.next_frame({'a': {'score': score}}, None)
+    # Deltas 4..6 are held; a client that last saw 2 missed 3
+    assert sequencer.frames_since(2) is None
+    assert [frame(text)['seq'] for text in sequencer.frames_since(3)] == [4, 5, 6]
+    # A seq from the future (e.g. another room's) also needs a snapshot
+    assert sequencer.frames_since(7) is None
+
+    snapshot = frame(sequencer.snapshot({'a': {'score': 5}}, None))
+    assert snapshot == {'type': 'snapshot', 'seq': 6, 'players': {'a': {'score': 5}}, 'game': None}
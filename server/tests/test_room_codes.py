@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from fake_redis import FakeRedis
+from room_codes import CodePermutation, RoomCodeAllocator, RoomCodesExhausted
+
+
+def test_permutation_is_a_bijection():
+    permutation = CodePermutation(seed=7, length=2)
+    codes = {permutation(index) for index in range(permutation.size)}
+    assert len(codes) == permutation.size == 36 ** 2
+    assert all(len(code) == 2 for code in codes)
+
+
+def test_workers_sharing_redis_never_hand_out_the_same_code():
+    async def run():
+        redis = FakeRedis()
+        workers = [RoomCodeAllocator(redis, length=3, block=8) for _ in range(3)]
+        codes = []
+        for _ in range(100):
+            for worker in workers:
+                codes.append(await worker.allocate())
+        assert len(set(codes)) == len(codes)
+        # Leases come in blocks: most codes cost no Redis call
+        assert redis.round_trips < len(codes) / 2
+    asyncio.run(run())
+
+
+def test_released_code_is_reused_only_after_its_cooldown():
+    async def run():
+        allocator = RoomCodeAllocator(FakeRedis(), length=4, cooldown=0.2)
+        code = await allocator.allocate()
+        allocator.release(code)
+        await asyncio.sleep(0)  # Let the release reach Redis
+        assert await allocator.allocate() != code
+
+        await asyncio.sleep(0.25)
+        assert await allocator.allocate() == code
+        assert allocator.reused == 1
+    asyncio.run(run())
+
+
+def test_exhausted_code_space_raises_until_a_code_is_released():
+    async def run():
+        allocator = RoomCodeAllocator(FakeRedis(), length=1, cooldown=0, block=10)
+        codes = [await allocator.allocate() for _ in range(36)]
+        assert len(set(codes)) == 36
+        with pytest.raises(RoomCodesExhausted):
+            await allocator.allocate()
+
+        allocator.release(codes[5])
+        await asyncio.sleep(0.01)  # Past the release time, which is kept to the millisecond
+        assert await allocator.allocate() == codes[5]
+    asyncio.run(run())
@@ -0,0 +1,77 @@
+from timer_wheel import TimerWheel
+
+# A power of two, so tick arithmetic on the fake clock is exact
+TICK = 0.125
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_wheel():
+    # 4 slots a level: level 0 spans 4 ticks, level 1 16 and level 2 64
+    clock = Clock()
+    return clock, TimerWheel(resolution=TICK, slots=4, levels=3, clock=clock)
+
+
+def run_ticks(clock, wheel, ticks):
+    """Advance a tick at a time, as the wheel's task does"""
+    for _ in range(ticks):
+        clock.now += TICK
+        wheel.advance()
+
+
+def test_timer_fires_on_the_first_tick_at_or_after_its_deadline():
+    clock, wheel = make_wheel()
+    fired = []
+    wheel.schedule(2.5 * TICK, fired.append, 'a')
+    run_ticks(clock, wheel, 2)
+    assert fired == []
+    run_ticks(clock, wheel, 1)
+    assert fired == ['a']
+
+
+def test_timers_beyond_level_zero_cascade_down_and_fire_on_time():
+    clock, wheel = make_wheel()
+    fired = {}
+    for ticks in (3, 5, 17, 40, 63):
+        wheel.schedule(ticks * TICK, lambda ticks=ticks: fired.setdefault(ticks, wheel._tick))
+    run_ticks(clock, wheel, 64)
+    assert fired == {3: 3, 5: 5, 17: 17, 40: 40, 63: 63}
+    assert wheel.cascaded > 0
+    assert wheel.pending == 0
+
+
+def test_timer_beyond_the_top_level_span_still_fires_on_time():
+    clock, wheel = make_wheel()
+    fired = []
+    wheel.schedule(200 * TICK, lambda: fired.append(wheel._tick))
+    run_ticks(clock, wheel, 199)
+    assert fired == []
+    run_ticks(clock, wheel, 1)
+    assert fired == [200]
+
+
+def test_cancelled_timer_never_fires():
+    clock, wheel = make_wheel()
+    fired = []
+    timer = wheel.schedule(30 * TICK, fired.append, 'late')
+    wheel.schedule(TICK, timer.cancel)
+    run_ticks(clock, wheel, 40)
+    assert fired == []
+    assert not timer.pending
+    assert wheel.pending == 0
+
+
+def test_callback_errors_are_counted_and_do_not_stop_the_wheel():
+    clock, wheel = make_wheel()
+    fired = []
+    wheel.schedule(TICK, lambda: 1 / 0)
+    wheel.schedule(TICK, fired.append, 'ok')
+    run_ticks(clock, wheel, 2)
+    assert fired == ['ok']
+    assert wheel.errors == 1
@@ -0,0 +1,169 @@
+"""Hierarchical timer wheel for large numbers of coarse deadlines.
+
+One asyncio task drives every timer, so a server with hundreds of
+thousands of rooms does not need a task or a ``call_later`` handle per
+room. Time is cut into ticks of ``resolution`` seconds. Level 0 has one
+slot per tick. Each higher level has one slot per full turn of the level
+below it. A timer sits in the lowest level whose span covers its
+deadline. When a level wraps, the next slot of the level above is
+cascaded down. Scheduling and cancelling are O(1). Each tick costs O(1)
+plus the timers that fire or cascade.
+
+Timers fire on the first tick at or after their deadline, so they are at
+most one tick late, plus whatever event-loop lag there is.
+"""
+import asyncio
+import logging
+import time
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Timer:
+    __slots__ = ('deadline', 'callback', 'args', '_slot')
+
+    def __init__(self, deadline: int, callback: Callable, args: tuple):
+        self.deadline = deadline  # Tick the timer fires on
+        self.callback = callback
+        self.args = args
+        self._slot: Optional[set] = None  # Wheel slot holding the timer while it is pending
+
+    @property
+    def pending(self) -> bool:
+        return self._slot is not None
+
+    def cancel(self):
+        if self._slot is not None:
+            self._slot.discard(self)
+            self._slot = None
+
+
+class TimerWheel:
+    def __init__(self, resolution: float = 0.1, slots: int = 64, levels: int = 4,
+                 clock: Callable[[], float] = time.monotonic):
+        if slots & (slots - 1):
+            raise ValueError("slots must be a power of two")
+        self.resolution = resolution
+        self.slots = slots
+        self.levels = levels
+        self.clock = clock
+        self._bits = slots.bit_length() - 1
+        self._mask = slots - 1
+        self._wheels = [[set() for _ in range(slots)] for _ in range(levels)]
+        self._start = clock()
+        self._tick = 0  # Last tick processed
+        self._task: Optional[asyncio.Task] = None
+        self._spawned = set()  # Tasks started by coroutine callbacks
+        self.scheduled = 0
+        self.fired = 0
+        self.cascaded = 0
+        self.errors = 0
+
+    @property
+    def pending(self) -> int:
+        return sum(len(slot) for wheel in self._wheels for slot in wheel)
+
+    def schedule(self, delay: float, callback: Callable, *args) -> Timer:
+        """Call ``callback(*args)`` after ``delay`` seconds. A coroutine result is run as a task."""
+        deadline = int((self.clock() + delay - self._start) / self.resolution + 0.999999)
+        timer = Timer(max(deadline, self._tick + 1), callback, args)
+        self._place(timer)
+        self.scheduled += 1
+        return timer
+
+    def _place(self, timer: Timer):
+        delta = timer.deadline - self._tick
+        bits = self._bits
+        for level in range(self.levels):
+            if delta < 1 << (bits * (level + 1)):
+                index = (timer.deadline >> (bits * level)) & self._mask
+                break
+        else:
+            # Beyond the top level's span: park in the slot that cascades last
+            # and re-place it from there
+            level = self.levels - 1
+            index = ((self._tick >> (bits * level)) - 1) & self._mask
+        slot = self._wheels[level][index]
+        slot.add(timer)
+        timer._slot = slot
+
+    def _step(self):
+        self._tick = tick = self._tick + 1
+        bits, mask = self._bits, self._mask
+
+        # Cascade from the highest level that wrapped down to level 1, so
+        # each cascade sees the timers the level above just moved into it
+        level = 0
+        while level + 1 < self.levels and (tick >> (bits * level)) & mask == 0:
+            level += 1
+        for upper in range(level, 0, -1):
+            slot = self._wheels[upper][(tick >> (bits * upper)) & mask]
+            if slot:
+                timers = list(slot)
+                slot.clear()
+                self.cascaded += len(timers)
+                for timer in timers:
+                    self._place(timer)
+
+        slot = self._wheels[0][tick & mask]
+        if slot:
+            for timer in list(slot):
+                # Skip timers cancelled by an earlier callback in this tick
+                if timer._slot is slot:
+                    slot.discard(timer)
+                    timer._slot = None
+                    self._fire(timer)
+
+    def _fire(self, timer: Timer):
+        self.fired += 1
+        try:
+            result = timer.callback(*timer.args)
+            if asyncio.iscoroutine(result):
+                task = asyncio.ensure_future(result)
+                self._spawned.add(task)
+                task.add_done_callback(self._task_done)
+        except Exception as e:
+            self.errors += 1
+            logger.exception("Error in timer callback: %s", e)
+
+    def _task_done(self, task: asyncio.Task):
+        self._spawned.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+            logger.error("Error in timer callback: %s", task.exception(), exc_info=task.exception())
+
+    def advance(self, now: float = None):
+        """Process every tick up to ``now``"""
+        now = self.clock() if now is None else now
+        target = int((now - self._start) / self.resolution)
+        while self._tick < target:
+            self._step()
+
+    async def run(self):
+        while True:
+            next_tick = self._start + (self._tick + 1) * self.resolution
+            await asyncio.sleep(max(0.0, next_tick - self.clock()))
+            self.advance()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            'pending': self.pending,
+            'scheduled': self.scheduled,
+            'fired': self.fired,
+            'cascaded': self.cascaded,
+            'errors': self.errors,
+        }
@@ -0,0 +1,129 @@
+"""Wire formats for client frames.
+
+JSON is the default and what every client speaks. If ``orjson`` is
+installed it is used to encode and decode JSON; the frames are the same,
+only cheaper to produce. If ``msgpack`` is installed a client can connect
+to ``/ws/{client_id}?format=msgpack`` and get binary MessagePack frames
+instead. Text frames from a client are always read as JSON, so a
+MessagePack client may still send JSON text.
+
+Broadcasts wrap their message in a ``Frame``, which encodes it at most once
+per format however many clients it goes to.
+"""
+import json
+from typing import Optional, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional format
+    msgpack = None
+
+
+class JsonCodec:
+    name = 'json'
+    binary = False
+
+    def __init__(self, backend: str = 'auto'):
+        if backend == 'orjson' or (backend == 'auto' and orjson is not None):
+            if orjson is None:
+                raise RuntimeError("orjson is not installed")
+            self.backend = 'orjson'
+            self.encode = self._encode_orjson
+            self.decode = orjson.loads
+        else:
+            self.backend = 'stdlib'
+            self.encode = self._encode_stdlib
+            self.decode = json.loads
+
+    @staticmethod
+    def _encode_orjson(message) -> str:
+        return orjson.dumps(message).decode('utf-8')
+
+    @staticmethod
+    def _encode_stdlib(message) -> str:
+        return json.dumps(message, separators=(',', ':'))
+
+
+class MsgpackCodec:
+    name = 'msgpack'
+    binary = True
+
+    def __init__(self):
+        if msgpack is None:
+            raise RuntimeError("msgpack is not installed")
+        self.backend = 'msgpack'
+
+    @staticmethod
+    def encode(message) -> bytes:
+        return msgpack.packb(message, use_bin_type=True)
+
+    @staticmethod
+    def decode(data: bytes):
+        return msgpack.unpackb(data, raw=False)
+
+
+JSON = JsonCodec()
+CODECS = {JSON.name: JSON}
+if msgpack is not None:
+    CODECS[MsgpackCodec.name] = MsgpackCodec()
+
+# Module-level shortcuts for JSON that is not sent to a client as-is (bus envelopes, delta history)
+dumps = JSON.encode
+loads = JSON.decode
+
+
+class Frame:
+    """An outbound message, encoded lazily and at most once per format.
+
+    Either built from the message itself, or from JSON text that is already
+    encoded (delta frames, frames forwarded over the room bus); the text is
+    only parsed if a client needs another format.
+    """
+
+    __slots__ = ('message', '_encoded')
+
+    def __init__(self, message: dict = None, text: str = None):
+        self.message = message
+        self._encoded = {JSON.name: text} if text is not None else {}
+
+    def encode(self, codec) -> Union[str, bytes]:
+        data = self._encoded.get(codec.name)
+        if data is None:
+            if self.message is None:
+                self.message = JSON.decode(self._encoded[JSON.name])
+            data = self._encoded[codec.name] = codec.encode(self.message)
+        return data
+
+    @property
+    def text(self) -> str:
+        return self.encode(JSON)
+
+    @property
+    def size(self) -> int:
+        """Length of the frame in whichever format it has been encoded in first"""
+        for data in self._encoded.values():
+            return len(data)
+        return len(self.text)
+
+
+def decode_message(text: Optional[str], data: Optional[bytes], codec) -> dict:
+    """Decode one incoming WebSocket frame into a message dict.
+
+    Raises ValueError if the frame cannot be decoded or is not an object
+    with a string ``type``.
+    """
+    try:
+        if text is not None:
+            message = JSON.decode(text) if codec.binary else codec.decode(text)
+        else:
+            message = codec.decode(data)
+    except Exception as e:
+        raise ValueError(f"Malformed frame: {e}") from e
+    if not isinstance(message, dict) or not isinstance(message.get('type'), str):
+        raise ValueError("Frame is not a message object with a type")
+    return message